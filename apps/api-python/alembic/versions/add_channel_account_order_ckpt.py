@@ -0,0 +1,71 @@
+"""move the incremental Shopify order sync checkpoint from shopify_integrations to channel_accounts
+
+Revision ID: add_channel_account_order_ckpt
+Revises: add_shipment_tracking_event_at
+Create Date: 2025-02-16
+
+Several users can connect the same store, each with their own channel account; the watermark was per
+shop, so a second account skipped history the first one had already synced. Existing checkpoints are
+copied to the accounts of that shop that already hold orders.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_channel_account_order_ckpt"
+down_revision = "add_shipment_tracking_event_at"
+branch_labels = None
+depends_on = None
+
+COPY_TO_ACCOUNTS = """
+    UPDATE channel_accounts
+    SET orders_updated_at_min = (
+            SELECT si.orders_updated_at_min FROM shopify_integrations si
+            WHERE si.shop_domain = channel_accounts.shop_domain
+        ),
+        orders_page_cursor = (
+            SELECT si.orders_page_cursor FROM shopify_integrations si
+            WHERE si.shop_domain = channel_accounts.shop_domain
+        )
+    WHERE shop_domain IS NOT NULL
+      AND EXISTS (SELECT 1 FROM orders o WHERE o.channel_account_id = channel_accounts.id)
+"""
+COPY_TO_INTEGRATIONS = """
+    UPDATE shopify_integrations
+    SET orders_updated_at_min = (
+            SELECT MIN(ca.orders_updated_at_min) FROM channel_accounts ca
+            WHERE ca.shop_domain = shopify_integrations.shop_domain
+        )
+"""
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("ALTER TABLE channel_accounts ADD COLUMN IF NOT EXISTS orders_updated_at_min VARCHAR")
+        op.execute("ALTER TABLE channel_accounts ADD COLUMN IF NOT EXISTS orders_page_cursor VARCHAR")
+        op.execute(COPY_TO_ACCOUNTS)
+        op.execute("ALTER TABLE shopify_integrations DROP COLUMN IF EXISTS orders_page_cursor")
+        op.execute("ALTER TABLE shopify_integrations DROP COLUMN IF EXISTS orders_updated_at_min")
+    else:
+        op.add_column("channel_accounts", sa.Column("orders_updated_at_min", sa.String(), nullable=True))
+        op.add_column("channel_accounts", sa.Column("orders_page_cursor", sa.String(), nullable=True))
+        op.execute(COPY_TO_ACCOUNTS)
+        op.drop_column("shopify_integrations", "orders_page_cursor")
+        op.drop_column("shopify_integrations", "orders_updated_at_min")
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("ALTER TABLE shopify_integrations ADD COLUMN IF NOT EXISTS orders_updated_at_min VARCHAR")
+        op.execute("ALTER TABLE shopify_integrations ADD COLUMN IF NOT EXISTS orders_page_cursor VARCHAR")
+        op.execute(COPY_TO_INTEGRATIONS)
+        op.execute("ALTER TABLE channel_accounts DROP COLUMN IF EXISTS orders_page_cursor")
+        op.execute("ALTER TABLE channel_accounts DROP COLUMN IF EXISTS orders_updated_at_min")
+    else:
+        op.add_column("shopify_integrations", sa.Column("orders_updated_at_min", sa.String(), nullable=True))
+        op.add_column("shopify_integrations", sa.Column("orders_page_cursor", sa.String(), nullable=True))
+        op.execute(COPY_TO_INTEGRATIONS)
+        op.drop_column("channel_accounts", "orders_page_cursor")
+        op.drop_column("channel_accounts", "orders_updated_at_min")
@@ -0,0 +1,57 @@
+"""add courier_push_tokens (courier status push endpoints) and an index on shipments.awb_number
+
+Revision ID: add_courier_push_tokens
+Revises: add_shipment_poll_schedule
+Create Date: 2025-02-13
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_courier_push_tokens"
+down_revision = "add_shipment_poll_schedule"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("""
+            CREATE TABLE IF NOT EXISTS courier_push_tokens (
+                id VARCHAR PRIMARY KEY,
+                user_id VARCHAR NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                courier VARCHAR NOT NULL,
+                token_hash VARCHAR NOT NULL UNIQUE,
+                last_push_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                CONSTRAINT uq_courier_push_tokens_user_courier UNIQUE (user_id, courier)
+            )
+        """)
+        op.execute("CREATE INDEX IF NOT EXISTS ix_shipments_awb_number ON shipments (awb_number)")
+    else:
+        op.create_table(
+            "courier_push_tokens",
+            sa.Column("id", sa.String(), nullable=False),
+            sa.Column("user_id", sa.String(), nullable=False),
+            sa.Column("courier", sa.String(), nullable=False),
+            sa.Column("token_hash", sa.String(), nullable=False),
+            sa.Column("last_push_at", sa.DateTime(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("token_hash"),
+            sa.UniqueConstraint("user_id", "courier", name="uq_courier_push_tokens_user_courier"),
+        )
+        op.create_index("ix_shipments_awb_number", "shipments", ["awb_number"])
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_shipments_awb_number")
+        op.execute("DROP TABLE IF EXISTS courier_push_tokens")
+    else:
+        op.drop_index("ix_shipments_awb_number", table_name="shipments")
+        op.drop_table("courier_push_tokens")
@@ -0,0 +1,64 @@
+"""add orders.order_date_ist (IST day, indexed) and daily_cac materialized table
+
+Revision ID: add_daily_cac
+Revises: add_shopify_inv_item_idx
+Create Date: 2025-02-07
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_daily_cac"
+down_revision = "add_shopify_inv_item_idx"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS order_date_ist DATE")
+        op.execute(
+            "UPDATE orders SET order_date_ist = ((created_at AT TIME ZONE 'UTC') AT TIME ZONE 'Asia/Kolkata')::date "
+            "WHERE order_date_ist IS NULL AND created_at IS NOT NULL"
+        )
+        op.execute("CREATE INDEX IF NOT EXISTS ix_orders_order_date_ist ON orders (order_date_ist)")
+        op.execute("""
+            CREATE TABLE IF NOT EXISTS daily_cac (
+                date DATE NOT NULL PRIMARY KEY,
+                spend NUMERIC(12, 2) NOT NULL DEFAULT 0,
+                order_count INTEGER NOT NULL DEFAULT 0,
+                cac NUMERIC(12, 2) NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    else:
+        op.add_column("orders", sa.Column("order_date_ist", sa.Date(), nullable=True))
+        op.execute(
+            "UPDATE orders SET order_date_ist = date(created_at, '+330 minutes') "
+            "WHERE order_date_ist IS NULL AND created_at IS NOT NULL"
+        )
+        op.create_index("ix_orders_order_date_ist", "orders", ["order_date_ist"])
+        op.create_table(
+            "daily_cac",
+            sa.Column("date", sa.Date(), nullable=False),
+            sa.Column("spend", sa.Numeric(12, 2), nullable=False, server_default="0"),
+            sa.Column("order_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("cac", sa.Numeric(12, 2), nullable=False, server_default="0"),
+            sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()),
+            sa.PrimaryKeyConstraint("date"),
+        )
+    # daily_cac rows are materialized on first read per day (app/services/daily_cac.py)
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("DROP TABLE IF EXISTS daily_cac")
+        op.execute("DROP INDEX IF EXISTS ix_orders_order_date_ist")
+        op.execute("ALTER TABLE orders DROP COLUMN IF EXISTS order_date_ist")
+    else:
+        op.drop_table("daily_cac")
+        op.drop_index("ix_orders_order_date_ist", table_name="orders")
+        op.drop_column("orders", "order_date_ist")
@@ -0,0 +1,89 @@
+"""add daily_order_rollup (per channel account, IST day) for analytics endpoints
+
+Revision ID: add_daily_order_rollup
+Revises: add_order_items_dep_idx
+Create Date: 2025-02-09
+
+Rows are filled incrementally by the app; run scripts/backfill_order_rollups.py once after upgrading.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_daily_order_rollup"
+down_revision = "add_order_items_dep_idx"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("""
+            CREATE TABLE IF NOT EXISTS daily_order_rollup (
+                channel_account_id VARCHAR NOT NULL REFERENCES channel_accounts(id) ON DELETE CASCADE,
+                date DATE NOT NULL,
+                order_count INTEGER NOT NULL DEFAULT 0,
+                revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+                item_count INTEGER NOT NULL DEFAULT 0,
+                new_count INTEGER NOT NULL DEFAULT 0,
+                confirmed_count INTEGER NOT NULL DEFAULT 0,
+                packed_count INTEGER NOT NULL DEFAULT 0,
+                shipped_count INTEGER NOT NULL DEFAULT 0,
+                delivered_count INTEGER NOT NULL DEFAULT 0,
+                cancelled_count INTEGER NOT NULL DEFAULT 0,
+                returned_count INTEGER NOT NULL DEFAULT 0,
+                hold_count INTEGER NOT NULL DEFAULT 0,
+                profit_order_count INTEGER NOT NULL DEFAULT 0,
+                profit_revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+                net_profit NUMERIC(14, 2) NOT NULL DEFAULT 0,
+                loss_count INTEGER NOT NULL DEFAULT 0,
+                loss_amount NUMERIC(14, 2) NOT NULL DEFAULT 0,
+                rto_count INTEGER NOT NULL DEFAULT 0,
+                rto_amount NUMERIC(14, 2) NOT NULL DEFAULT 0,
+                lost_count INTEGER NOT NULL DEFAULT 0,
+                lost_amount NUMERIC(14, 2) NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (channel_account_id, date)
+            )
+        """)
+        op.execute("CREATE INDEX IF NOT EXISTS ix_daily_order_rollup_date ON daily_order_rollup (date)")
+    else:
+        op.create_table(
+            "daily_order_rollup",
+            sa.Column("channel_account_id", sa.String(), nullable=False),
+            sa.Column("date", sa.Date(), nullable=False),
+            sa.Column("order_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("revenue", sa.Numeric(14, 2), nullable=False, server_default="0"),
+            sa.Column("item_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("new_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("confirmed_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("packed_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("shipped_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("delivered_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("cancelled_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("returned_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("hold_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("profit_order_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("profit_revenue", sa.Numeric(14, 2), nullable=False, server_default="0"),
+            sa.Column("net_profit", sa.Numeric(14, 2), nullable=False, server_default="0"),
+            sa.Column("loss_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("loss_amount", sa.Numeric(14, 2), nullable=False, server_default="0"),
+            sa.Column("rto_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("rto_amount", sa.Numeric(14, 2), nullable=False, server_default="0"),
+            sa.Column("lost_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("lost_amount", sa.Numeric(14, 2), nullable=False, server_default="0"),
+            sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()),
+            sa.ForeignKeyConstraint(["channel_account_id"], ["channel_accounts.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("channel_account_id", "date"),
+        )
+        op.create_index("ix_daily_order_rollup_date", "daily_order_rollup", ["date"])
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("DROP TABLE IF EXISTS daily_order_rollup")
+    else:
+        op.drop_index("ix_daily_order_rollup_date", table_name="daily_order_rollup")
+        op.drop_table("daily_order_rollup")
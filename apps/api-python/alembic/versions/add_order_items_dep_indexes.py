@@ -0,0 +1,34 @@
+"""add order_items (sku) and (order_id) indexes for profit dependency lookups
+
+Revision ID: add_order_items_dep_idx
+Revises: add_daily_cac
+Create Date: 2025-02-08
+
+"""
+from alembic import op
+
+
+revision = "add_order_items_dep_idx"
+down_revision = "add_daily_cac"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("CREATE INDEX IF NOT EXISTS ix_order_items_sku ON order_items (sku)")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id)")
+    else:
+        op.create_index("ix_order_items_sku", "order_items", ["sku"])
+        op.create_index("ix_order_items_order_id", "order_items", ["order_id"])
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_order_items_order_id")
+        op.execute("DROP INDEX IF EXISTS ix_order_items_sku")
+    else:
+        op.drop_index("ix_order_items_order_id", table_name="order_items")
+        op.drop_index("ix_order_items_sku", table_name="order_items")
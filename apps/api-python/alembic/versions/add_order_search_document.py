@@ -0,0 +1,61 @@
+"""add orders.search_document with tsvector + pg_trgm GIN indexes for order search
+
+Revision ID: add_order_search_doc
+Revises: add_orders_keyset_idx
+Create Date: 2025-02-11
+
+Postgres needs the pg_trgm extension (CREATE EXTENSION requires a role allowed to create it).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_order_search_doc"
+down_revision = "add_orders_keyset_idx"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS search_document TEXT")
+        op.execute("""
+            UPDATE orders o SET search_document = lower(concat_ws(' ',
+                o.channel_order_id,
+                NULLIF(ltrim(o.channel_order_id, '#'), o.channel_order_id),
+                o.customer_name,
+                o.customer_email,
+                (SELECT string_agg(s.awb_number, ' ') FROM shipments s WHERE s.order_id = o.id),
+                (SELECT string_agg(DISTINCT i.sku, ' ') FROM order_items i WHERE i.order_id = o.id)
+            ))
+        """)
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_orders_search_tsv ON orders "
+            "USING gin (to_tsvector('simple', coalesce(search_document, '')))"
+        )
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_orders_search_trgm ON orders "
+            "USING gin (search_document gin_trgm_ops)"
+        )
+    else:
+        op.add_column("orders", sa.Column("search_document", sa.Text(), nullable=True))
+        op.execute("""
+            UPDATE orders SET search_document = lower(
+                channel_order_id || ' ' || ltrim(channel_order_id, '#') || ' ' || customer_name
+                || ' ' || coalesce(customer_email, '')
+                || ' ' || coalesce((SELECT group_concat(awb_number, ' ') FROM shipments WHERE shipments.order_id = orders.id), '')
+                || ' ' || coalesce((SELECT group_concat(sku, ' ') FROM order_items WHERE order_items.order_id = orders.id), '')
+            )
+        """)
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_orders_search_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_orders_search_tsv")
+        op.execute("ALTER TABLE orders DROP COLUMN IF EXISTS search_document")
+    else:
+        op.drop_column("orders", "search_document")
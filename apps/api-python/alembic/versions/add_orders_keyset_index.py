@@ -0,0 +1,33 @@
+"""add (channel_account_id, created_at, id) index on orders for keyset pagination
+
+Revision ID: add_orders_keyset_idx
+Revises: add_daily_order_rollup
+Create Date: 2025-02-10
+
+"""
+from alembic import op
+
+
+revision = "add_orders_keyset_idx"
+down_revision = "add_daily_order_rollup"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_orders_account_created_id "
+            "ON orders (channel_account_id, created_at, id)"
+        )
+    else:
+        op.create_index("ix_orders_account_created_id", "orders", ["channel_account_id", "created_at", "id"])
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_orders_account_created_id")
+    else:
+        op.drop_index("ix_orders_account_created_id", table_name="orders")
@@ -0,0 +1,144 @@
+"""add rate_cards, courier_invoice_lines and shipment cost provenance columns (rate-card engine)
+
+Revision ID: add_rate_cards
+Revises: add_courier_push_tokens
+Create Date: 2025-02-14
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_rate_cards"
+down_revision = "add_courier_push_tokens"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("""
+            CREATE TABLE IF NOT EXISTS rate_cards (
+                id VARCHAR PRIMARY KEY,
+                user_id VARCHAR NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                courier VARCHAR NOT NULL,
+                version INTEGER NOT NULL,
+                effective_from TIMESTAMP NOT NULL,
+                origin_pincode VARCHAR,
+                zones JSONB NOT NULL,
+                additional_slab_grams INTEGER NOT NULL DEFAULT 500,
+                cod_fixed_fee NUMERIC(12, 2) NOT NULL DEFAULT 0,
+                cod_percent NUMERIC(6, 3) NOT NULL DEFAULT 0,
+                rto_multiplier NUMERIC(6, 3) NOT NULL DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                CONSTRAINT uq_rate_cards_user_courier_version UNIQUE (user_id, courier, version)
+            )
+        """)
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_rate_cards_user_courier_effective "
+            "ON rate_cards (user_id, courier, effective_from)"
+        )
+        op.execute("ALTER TABLE shipments ADD COLUMN IF NOT EXISTS cost_source VARCHAR")
+        op.execute(
+            "ALTER TABLE shipments ADD COLUMN IF NOT EXISTS rate_card_id VARCHAR "
+            "REFERENCES rate_cards(id) ON DELETE SET NULL"
+        )
+        op.execute("ALTER TABLE shipments ADD COLUMN IF NOT EXISTS shipping_zone VARCHAR")
+        op.execute("ALTER TABLE shipments ADD COLUMN IF NOT EXISTS chargeable_weight_grams INTEGER")
+        op.execute("ALTER TABLE shipments ADD COLUMN IF NOT EXISTS cost_reconciled_at TIMESTAMP")
+        # Costs entered before rate cards existed were typed in by hand
+        op.execute("UPDATE shipments SET cost_source = 'manual' WHERE cost_source IS NULL AND forward_cost > 0")
+        op.execute("""
+            CREATE TABLE IF NOT EXISTS courier_invoice_lines (
+                id VARCHAR PRIMARY KEY,
+                user_id VARCHAR NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                courier VARCHAR NOT NULL,
+                invoice_number VARCHAR NOT NULL,
+                awb_number VARCHAR NOT NULL,
+                forward_cost NUMERIC(12, 2) NOT NULL,
+                reverse_cost NUMERIC(12, 2),
+                shipment_id VARCHAR REFERENCES shipments(id) ON DELETE SET NULL,
+                reconciled_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                CONSTRAINT uq_courier_invoice_lines_awb UNIQUE (user_id, courier, invoice_number, awb_number)
+            )
+        """)
+        op.execute("CREATE INDEX IF NOT EXISTS ix_courier_invoice_lines_awb_number ON courier_invoice_lines (awb_number)")
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_courier_invoice_lines_pending ON courier_invoice_lines (created_at) "
+            "WHERE reconciled_at IS NULL"
+        )
+    else:
+        op.create_table(
+            "rate_cards",
+            sa.Column("id", sa.String(), nullable=False),
+            sa.Column("user_id", sa.String(), nullable=False),
+            sa.Column("courier", sa.String(), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("effective_from", sa.DateTime(), nullable=False),
+            sa.Column("origin_pincode", sa.String(), nullable=True),
+            sa.Column("zones", sa.JSON(), nullable=False),
+            sa.Column("additional_slab_grams", sa.Integer(), nullable=False, server_default="500"),
+            sa.Column("cod_fixed_fee", sa.Numeric(12, 2), nullable=False, server_default="0"),
+            sa.Column("cod_percent", sa.Numeric(6, 3), nullable=False, server_default="0"),
+            sa.Column("rto_multiplier", sa.Numeric(6, 3), nullable=False, server_default="1"),
+            sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("user_id", "courier", "version", name="uq_rate_cards_user_courier_version"),
+        )
+        op.create_index("ix_rate_cards_user_courier_effective", "rate_cards", ["user_id", "courier", "effective_from"])
+        op.add_column("shipments", sa.Column("cost_source", sa.String(), nullable=True))
+        op.add_column("shipments", sa.Column("rate_card_id", sa.String(), nullable=True))
+        op.add_column("shipments", sa.Column("shipping_zone", sa.String(), nullable=True))
+        op.add_column("shipments", sa.Column("chargeable_weight_grams", sa.Integer(), nullable=True))
+        op.add_column("shipments", sa.Column("cost_reconciled_at", sa.DateTime(), nullable=True))
+        op.execute("UPDATE shipments SET cost_source = 'manual' WHERE cost_source IS NULL AND forward_cost > 0")
+        op.create_table(
+            "courier_invoice_lines",
+            sa.Column("id", sa.String(), nullable=False),
+            sa.Column("user_id", sa.String(), nullable=False),
+            sa.Column("courier", sa.String(), nullable=False),
+            sa.Column("invoice_number", sa.String(), nullable=False),
+            sa.Column("awb_number", sa.String(), nullable=False),
+            sa.Column("forward_cost", sa.Numeric(12, 2), nullable=False),
+            sa.Column("reverse_cost", sa.Numeric(12, 2), nullable=True),
+            sa.Column("shipment_id", sa.String(), nullable=True),
+            sa.Column("reconciled_at", sa.DateTime(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["shipment_id"], ["shipments.id"], ondelete="SET NULL"),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("user_id", "courier", "invoice_number", "awb_number", name="uq_courier_invoice_lines_awb"),
+        )
+        op.create_index("ix_courier_invoice_lines_awb_number", "courier_invoice_lines", ["awb_number"])
+        op.create_index(
+            "ix_courier_invoice_lines_pending",
+            "courier_invoice_lines",
+            ["created_at"],
+            sqlite_where=sa.text("reconciled_at IS NULL"),
+        )
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("DROP TABLE IF EXISTS courier_invoice_lines")
+        op.execute("ALTER TABLE shipments DROP COLUMN IF EXISTS cost_reconciled_at")
+        op.execute("ALTER TABLE shipments DROP COLUMN IF EXISTS chargeable_weight_grams")
+        op.execute("ALTER TABLE shipments DROP COLUMN IF EXISTS shipping_zone")
+        op.execute("ALTER TABLE shipments DROP COLUMN IF EXISTS rate_card_id")
+        op.execute("ALTER TABLE shipments DROP COLUMN IF EXISTS cost_source")
+        op.execute("DROP TABLE IF EXISTS rate_cards")
+    else:
+        op.drop_index("ix_courier_invoice_lines_pending", table_name="courier_invoice_lines")
+        op.drop_index("ix_courier_invoice_lines_awb_number", table_name="courier_invoice_lines")
+        op.drop_table("courier_invoice_lines")
+        op.drop_column("shipments", "cost_reconciled_at")
+        op.drop_column("shipments", "chargeable_weight_grams")
+        op.drop_column("shipments", "shipping_zone")
+        op.drop_column("shipments", "rate_card_id")
+        op.drop_column("shipments", "cost_source")
+        op.drop_index("ix_rate_cards_user_courier_effective", table_name="rate_cards")
+        op.drop_table("rate_cards")
@@ -0,0 +1,67 @@
+"""add shipments.next_poll_at / poll_priority / status_changed_at for the adaptive tracking scheduler
+
+Revision ID: add_shipment_poll_schedule
+Revises: add_order_search_doc
+Create Date: 2025-02-12
+
+Non-final shipments are backfilled as due now; the poller spreads them out on their first poll.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_shipment_poll_schedule"
+down_revision = "add_order_search_doc"
+branch_labels = None
+depends_on = None
+
+FINAL = "('DELIVERED', 'RTO_DONE', 'LOST')"
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("ALTER TABLE shipments ADD COLUMN IF NOT EXISTS next_poll_at TIMESTAMP")
+        op.execute("ALTER TABLE shipments ADD COLUMN IF NOT EXISTS poll_priority INTEGER NOT NULL DEFAULT 0")
+        op.execute("ALTER TABLE shipments ADD COLUMN IF NOT EXISTS status_changed_at TIMESTAMP")
+        op.execute(
+            "UPDATE shipments SET status_changed_at = COALESCE(last_synced_at, created_at) "
+            "WHERE status_changed_at IS NULL"
+        )
+        op.execute(
+            "UPDATE shipments SET next_poll_at = (now() AT TIME ZONE 'utc') "
+            f"WHERE next_poll_at IS NULL AND status::text NOT IN {FINAL}"
+        )
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_shipments_next_poll_at ON shipments (next_poll_at) "
+            "WHERE next_poll_at IS NOT NULL"
+        )
+    else:
+        op.add_column("shipments", sa.Column("next_poll_at", sa.DateTime(), nullable=True))
+        op.add_column("shipments", sa.Column("poll_priority", sa.Integer(), nullable=False, server_default="0"))
+        op.add_column("shipments", sa.Column("status_changed_at", sa.DateTime(), nullable=True))
+        op.execute(
+            "UPDATE shipments SET status_changed_at = COALESCE(last_synced_at, created_at) "
+            "WHERE status_changed_at IS NULL"
+        )
+        op.execute(f"UPDATE shipments SET next_poll_at = CURRENT_TIMESTAMP WHERE status NOT IN {FINAL}")
+        op.create_index(
+            "ix_shipments_next_poll_at",
+            "shipments",
+            ["next_poll_at"],
+            sqlite_where=sa.text("next_poll_at IS NOT NULL"),
+        )
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_shipments_next_poll_at")
+        op.execute("ALTER TABLE shipments DROP COLUMN IF EXISTS status_changed_at")
+        op.execute("ALTER TABLE shipments DROP COLUMN IF EXISTS poll_priority")
+        op.execute("ALTER TABLE shipments DROP COLUMN IF EXISTS next_poll_at")
+    else:
+        op.drop_index("ix_shipments_next_poll_at", table_name="shipments")
+        op.drop_column("shipments", "status_changed_at")
+        op.drop_column("shipments", "poll_priority")
+        op.drop_column("shipments", "next_poll_at")
@@ -0,0 +1,31 @@
+"""add shipment_tracking.last_event_at (courier timestamp of the applied status) so stale pushes are skipped
+
+Revision ID: add_shipment_tracking_event_at
+Revises: add_rate_cards
+Create Date: 2025-02-15
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_shipment_tracking_event_at"
+down_revision = "add_rate_cards"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("ALTER TABLE shipment_tracking ADD COLUMN IF NOT EXISTS last_event_at TIMESTAMP")
+    else:
+        op.add_column("shipment_tracking", sa.Column("last_event_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("ALTER TABLE shipment_tracking DROP COLUMN IF EXISTS last_event_at")
+    else:
+        op.drop_column("shipment_tracking", "last_event_at")
@@ -0,0 +1,33 @@
+"""add (shop_domain, inventory_item_id) index on shopify_inventory for webhook delta updates
+
+Revision ID: add_shopify_inv_item_idx
+Revises: add_webhook_queue
+Create Date: 2025-02-06
+
+"""
+from alembic import op
+
+
+revision = "add_shopify_inv_item_idx"
+down_revision = "add_webhook_queue"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_shopify_inventory_shop_item "
+            "ON shopify_inventory (shop_domain, inventory_item_id)"
+        )
+    else:
+        op.create_index("ix_shopify_inventory_shop_item", "shopify_inventory", ["shop_domain", "inventory_item_id"])
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_shopify_inventory_shop_item")
+    else:
+        op.drop_index("ix_shopify_inventory_shop_item", table_name="shopify_inventory")
@@ -0,0 +1,35 @@
+"""add incremental order sync checkpoint to shopify_integrations
+
+Revision ID: add_shopify_order_ckpt
+Revises: add_orders_account_unique
+Create Date: 2025-02-03
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_shopify_order_ckpt"
+down_revision = "add_orders_account_unique"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("ALTER TABLE shopify_integrations ADD COLUMN IF NOT EXISTS orders_updated_at_min VARCHAR")
+        op.execute("ALTER TABLE shopify_integrations ADD COLUMN IF NOT EXISTS orders_page_cursor VARCHAR")
+    else:
+        op.add_column("shopify_integrations", sa.Column("orders_updated_at_min", sa.String(), nullable=True))
+        op.add_column("shopify_integrations", sa.Column("orders_page_cursor", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("ALTER TABLE shopify_integrations DROP COLUMN IF EXISTS orders_page_cursor")
+        op.execute("ALTER TABLE shopify_integrations DROP COLUMN IF EXISTS orders_updated_at_min")
+    else:
+        op.drop_column("shopify_integrations", "orders_page_cursor")
+        op.drop_column("shopify_integrations", "orders_updated_at_min")
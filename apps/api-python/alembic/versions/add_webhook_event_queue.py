@@ -0,0 +1,54 @@
+"""add durable queue columns to webhook_events (payload, status, attempts, next_attempt_at)
+
+Revision ID: add_webhook_queue
+Revises: add_shopify_order_ckpt
+Create Date: 2025-02-05
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "add_webhook_queue"
+down_revision = "add_shopify_order_ckpt"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS payload TEXT")
+        op.execute("ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS status VARCHAR")
+        op.execute("ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0")
+        op.execute("ALTER TABLE webhook_events ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP")
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_webhook_events_status_next_attempt "
+            "ON webhook_events (status, next_attempt_at)"
+        )
+        op.execute("CREATE INDEX IF NOT EXISTS ix_webhook_events_created_at ON webhook_events (created_at)")
+    else:
+        op.add_column("webhook_events", sa.Column("payload", sa.Text(), nullable=True))
+        op.add_column("webhook_events", sa.Column("status", sa.String(), nullable=True))
+        op.add_column("webhook_events", sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+        op.add_column("webhook_events", sa.Column("next_attempt_at", sa.DateTime(), nullable=True))
+        op.create_index("ix_webhook_events_status_next_attempt", "webhook_events", ["status", "next_attempt_at"])
+        op.create_index("ix_webhook_events_created_at", "webhook_events", ["created_at"])
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_webhook_events_created_at")
+        op.execute("DROP INDEX IF EXISTS ix_webhook_events_status_next_attempt")
+        op.execute("ALTER TABLE webhook_events DROP COLUMN IF EXISTS next_attempt_at")
+        op.execute("ALTER TABLE webhook_events DROP COLUMN IF EXISTS attempts")
+        op.execute("ALTER TABLE webhook_events DROP COLUMN IF EXISTS status")
+        op.execute("ALTER TABLE webhook_events DROP COLUMN IF EXISTS payload")
+    else:
+        op.drop_index("ix_webhook_events_created_at", table_name="webhook_events")
+        op.drop_index("ix_webhook_events_status_next_attempt", table_name="webhook_events")
+        op.drop_column("webhook_events", "next_attempt_at")
+        op.drop_column("webhook_events", "attempts")
+        op.drop_column("webhook_events", "status")
+        op.drop_column("webhook_events", "payload")
@@ -1,16 +1,21 @@
 """
 Authentication utilities
 """
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.models import User, UserRole
 from app.config import settings
+from app.services.tenant_scope import get_channel_account_ids
+from app.services.user_cache import cache_user, get_cached_user
 
 SECRET_KEY = settings.JWT_SECRET
 ALGORITHM = settings.AUTH_ALGORITHM
@@ -18,6 +23,9 @@ ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# bcrypt is deliberately slow (~250ms): run it here, not on the event loop
+_bcrypt_executor = ThreadPoolExecutor(max_workers=settings.BCRYPT_MAX_WORKERS, thread_name_prefix="bcrypt")
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
     try:
@@ -42,6 +50,16 @@ def get_password_hash(password: str) -> str:
     # Return as string for database storage
     return hashed.decode('utf-8')
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the bounded bcrypt pool (use from async routes)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash on the bounded bcrypt pool (use from async routes)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_executor, get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT token"""
     to_encode = data.copy()
@@ -53,11 +71,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(
+async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
-    """Get current authenticated user"""
+    """Get current authenticated user (cached per user id; see app/services/user_cache.py)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -68,14 +86,33 @@ def get_current_user(
         user_id: str = payload.get('sub')
         if user_id is None:
             raise credentials_exception
-        user = db.query(User).filter(User.id == user_id).first()
+        user = get_cached_user(user_id)
+        if user is not None:
+            return user
+        user = await db.get(User, user_id)
         if user is None:
             raise credentials_exception
+        cache_user(user)
         return user
     except JWTError:
         raise credentials_exception
 
 
+@dataclass
+class TenantScope:
+    """The authenticated user plus the channel-account ids their data is scoped to."""
+    user: User
+    channel_account_ids: list[str]
+
+
+async def get_tenant_scope(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+) -> TenantScope:
+    """Current user and their channel-account ids (cached per user; see app/services/tenant_scope.py)"""
+    return TenantScope(user=current_user, channel_account_ids=await get_channel_account_ids(db, current_user.id))
+
+
 def require_admin(current_user: User = Depends(get_current_user)) -> User:
     """Require admin role"""
     if current_user.role != UserRole.ADMIN:
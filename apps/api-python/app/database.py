@@ -1,23 +1,163 @@
 """
-Database configuration and session management
+Database configuration and session management.
+Sync engine (psycopg2) for writes/services; async engine (asyncpg, or aiosqlite for local SQLite) for
+hot read endpoints and auth so slow queries do not block the event loop.
+Pool size/overflow/recycle/pre-ping and the default statement timeout come from settings (DB_*);
+pool_status() reports checkout/wait/overflow counters for both engines.
 """
-from sqlalchemy import create_engine
+import logging
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = settings.DATABASE_URL
 
+
+class PoolStats:
+    """Counters for connection checkouts: how many, how long callers waited, how many timed out."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.overflow_max = 0
+
+    def record(self, wait_ms: float, overflow: int, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            self.overflow_max = max(self.overflow_max, overflow)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "waitAvgMs": round(self.wait_total_ms / waits, 2) if waits else 0.0,
+                "waitMaxMs": round(self.wait_max_ms, 2),
+                "overflowMax": self.overflow_max,
+            }
+
+
+class _InstrumentedPoolMixin:
+    """Times QueuePool._do_get (the blocking wait for a free connection) into self.stats."""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record((time.perf_counter() - start) * 1000, self.overflow(), timed_out=True)
+            raise
+        self.stats.record((time.perf_counter() - start) * 1000, self.overflow())
+        return conn
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+
+def _pool_kwargs(poolclass) -> dict:
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SEC,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SEC,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
 # SQLite-specific connection args (only for SQLite)
 connect_args = {}
+engine_kwargs = {}
 if DATABASE_URL.startswith("sqlite"):
     connect_args = {'check_same_thread': False}
+else:
+    engine_kwargs = _pool_kwargs(InstrumentedQueuePool)
+    if DATABASE_URL.startswith(("postgres://", "postgresql")) and settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        # Server-side default for every session; routes can tighten it with set_statement_timeout()
+        connect_args = {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+engine = create_engine(DATABASE_URL, connect_args=connect_args, **engine_kwargs)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+
+def _async_database_url(url: str) -> str | None:
+    """
+    postgresql://... -> postgresql+asyncpg://... (drop libpq-only query params); sqlite:///... ->
+    sqlite+aiosqlite:///... None for other databases.
+    """
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    parts = urlsplit(url)
+    if parts.scheme not in ("postgresql", "postgresql+psycopg2", "postgresql+asyncpg"):
+        return None
+    query = []
+    for key, value in parse_qsl(parts.query):
+        if key == "schema":
+            continue  # Prisma-style param; not a connection option
+        if key == "sslmode":
+            key = "ssl"
+        query.append((key, value))
+    return urlunsplit(("postgresql+asyncpg", parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+ASYNC_DATABASE_URL = _async_database_url(DATABASE_URL)
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_DATABASE_URL:
+    try:
+        if ASYNC_DATABASE_URL.startswith("sqlite"):
+            # Local/dev: aiosqlite (pool defaults of the SQLite dialect; no statement timeout)
+            async_engine = create_async_engine(ASYNC_DATABASE_URL, connect_args={"check_same_thread": False})
+        else:
+            async_connect_args = {}
+            if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+                async_connect_args = {"server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}}
+            async_engine = create_async_engine(
+                ASYNC_DATABASE_URL,
+                connect_args=async_connect_args,
+                **_pool_kwargs(InstrumentedAsyncQueuePool),
+            )
+        AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    except ImportError as e:
+        logger.warning("Async DB engine disabled (asyncpg / aiosqlite not installed): %s", e)
+else:
+    logger.warning("Async DB engine disabled: DATABASE_URL is neither PostgreSQL nor SQLite")
+
+
 def get_db():
     """Dependency for getting database session"""
     db = SessionLocal()
@@ -25,3 +165,57 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def async_session() -> AsyncSession:
+    """New AsyncSession (use as `async with async_session() as db`)."""
+    if AsyncSessionLocal is None:
+        raise RuntimeError(
+            "Async database session unavailable: install asyncpg (PostgreSQL) or aiosqlite (SQLite)"
+        )
+    return AsyncSessionLocal()
+
+
+async def get_async_db():
+    """Dependency for an AsyncSession. Use for read endpoints on the request hot path."""
+    async with async_session() as session:
+        yield session
+
+
+async def set_statement_timeout(db: AsyncSession, timeout_ms: int) -> None:
+    """
+    Per-route statement timeout for the current transaction (SET LOCAL; reset when the session ends).
+    Postgres cancels a query exceeding it with QueryCanceledError instead of holding the connection.
+    """
+    if timeout_ms <= 0 or db.bind.dialect.name != "postgresql":
+        return
+    await db.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+
+
+def _engine_pool_status(eng) -> dict | None:
+    if eng is None:
+        return None
+    pool = eng.pool
+    status = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checkedIn": pool.checkedin(),
+            "checkedOut": pool.checkedout(),
+            "overflow": max(0, pool.overflow()),
+            "maxOverflow": settings.DB_MAX_OVERFLOW,
+            "timeoutSec": settings.DB_POOL_TIMEOUT_SEC,
+        })
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update(stats.snapshot())
+    return status
+
+
+def pool_status() -> dict:
+    """Live pool gauges plus checkout/wait counters since process start, per engine."""
+    return {
+        "sync": _engine_pool_status(engine),
+        "async": _engine_pool_status(async_engine),
+        "statementTimeoutMs": settings.DB_STATEMENT_TIMEOUT_MS,
+    }
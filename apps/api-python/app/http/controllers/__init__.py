@@ -20,6 +20,7 @@ from app.http.controllers import (
     sku_costs,
     profit,
     mock,
+    admin,
 )
 
 __all__ = [
@@ -43,4 +44,5 @@ __all__ = [
     "sku_costs",
     "profit",
     "mock",
+    "admin",
 ]
@@ -0,0 +1,18 @@
+"""
+Admin-only operational routes (runtime diagnostics)
+"""
+from fastapi import APIRouter, Depends
+from app.database import pool_status
+from app.models import User
+from app.auth import require_admin
+
+router = APIRouter()
+
+
+@router.get("/db-pool")
+async def get_db_pool_status(current_user: User = Depends(require_admin)):
+    """
+    Connection pool gauges (size, checked out, overflow) and checkout/wait/timeout counters
+    for the sync and async engines of this worker process.
+    """
+    return pool_status()
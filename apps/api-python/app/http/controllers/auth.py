@@ -7,7 +7,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User, UserRole
-from app.auth import verify_password, create_access_token, get_current_user
+from app.auth import verify_password_async, create_access_token, get_current_user
 from app.http.requests import (
     LoginRequest,
     LoginResponse,
@@ -16,7 +16,7 @@ from app.http.requests import (
     ForgotPasswordRequest,
     ResetPasswordRequest,
 )
-from app.auth import get_password_hash
+from app.auth import get_password_hash_async
 from app.config import settings
 from app.services.email_service import send_password_reset_email
 
@@ -44,7 +44,7 @@ async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
         )
     
     # Verify password
-    if not verify_password(credentials.password, user.password_hash):
+    if not await verify_password_async(credentials.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
@@ -82,7 +82,7 @@ async def register(user_data: RegisterRequest, db: Session = Depends(get_db)):
     new_user = User(
         email=user_data.email,
         name=user_data.name,
-        password_hash=get_password_hash(user_data.password),
+        password_hash=await get_password_hash_async(user_data.password),
         role=UserRole.STAFF  # Default to STAFF role
     )
     db.add(new_user)
@@ -173,7 +173,7 @@ async def reset_password(body: ResetPasswordRequest, db: Session = Depends(get_d
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid or expired reset link. Please request a new one.",
         )
-    user.password_hash = get_password_hash(body.new_password)
+    user.password_hash = await get_password_hash_async(body.new_password)
     user.password_reset_token = None
     user.password_reset_expires = None
     db.commit()
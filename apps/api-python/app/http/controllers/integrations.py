@@ -29,21 +29,30 @@ from app.models import (
     PaymentMode,
     FulfillmentStatus,
     ProviderCredential,
+    CourierPushToken,
 )
 from app.auth import get_current_user
 from app.services.shopify_service import (
     get_orders as shopify_get_orders,
     get_inventory as shopify_get_inventory,
-    get_orders_raw,
+    get_orders_raw_paginated,
+    latest_updated_at,
     get_access_scopes,
 )
-from app.services.shopify_inventory_persist import persist_shopify_inventory
-from app.services.profit_calculator import compute_profit_for_order
+from app.services.shopify_inventory_persist import clear_inventory_cache, persist_shopify_inventory
+from app.services.profit_calculator import compute_profit_for_orders
+from app.services.profit_queue import enqueue_profit_recompute
 from app.services.shopify import ShopifyService
-from sqlalchemy import func
-from app.services.credentials import encrypt_token, decrypt_token
+from app.services.credentials import (
+    encrypt_token,
+    decrypt_token,
+    get_provider_credentials,
+    invalidate_provider_credentials,
+)
 from app.services.ad_spend_sync import sync_ad_spend_for_date
+from app.services.courier_push import PUSH_COURIERS, issue_push_token
 from app.services.sync_engine import SyncEngine
+from app.services.webhook_secrets import invalidate_webhook_secrets
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -366,19 +375,9 @@ def _validate_provider_credentials(provider_id: str, body: dict[str, Any]) -> No
 
 def _get_shopify_app_credentials(db: Session, user_id: str) -> dict | None:
     """Return { apiKey, apiSecret } for current user's Shopify app credentials, or None."""
-    cred = db.query(ProviderCredential).filter(
-        ProviderCredential.user_id == user_id,
-        ProviderCredential.provider_id == "shopify_app",
-    ).first()
-    if not cred or not cred.value_encrypted:
-        return None
-    try:
-        dec = decrypt_token(cred.value_encrypted)
-        data = json.loads(dec) if isinstance(dec, str) and dec.strip().startswith("{") else {}
-        if isinstance(data, dict) and data.get("apiKey") and data.get("apiSecret"):
-            return {"apiKey": (data["apiKey"] or "").strip(), "apiSecret": (data["apiSecret"] or "").strip()}
-    except Exception:
-        pass
+    data = get_provider_credentials(db, user_id, "shopify_app")
+    if data and data.get("apiKey") and data.get("apiSecret"):
+        return {"apiKey": (data["apiKey"] or "").strip(), "apiSecret": (data["apiSecret"] or "").strip()}
     return None
 
 
@@ -425,23 +424,17 @@ async def connect_shopify_app(
         db.add(cred)
         db.commit()
         db.refresh(cred)
+    invalidate_provider_credentials(current_user.id, "shopify_app")
+    # Secret applies to every shop this user has connected
+    invalidate_webhook_secrets()
     return {"connected": True, "message": "Shopify App credentials saved. You can now click Connect."}
 
 
 def _get_provider_credential_status(db: Session, user_id: str, provider_id: str) -> dict:
     """Return connected status for a credential-based provider (user key or env)."""
-    cred = db.query(ProviderCredential).filter(
-        ProviderCredential.user_id == user_id,
-        ProviderCredential.provider_id == provider_id,
-    ).first()
-    if cred and cred.value_encrypted:
-        try:
-            dec = decrypt_token(cred.value_encrypted)
-            data = json.loads(dec) if isinstance(dec, str) and dec.strip().startswith("{") else {"apiKey": dec}
-            if data and any(v for v in data.values() if isinstance(v, str) and v.strip()):
-                return {"connected": True, "source": "user", "configured": True}
-        except Exception:
-            pass
+    data = get_provider_credentials(db, user_id, provider_id)
+    if data and any(v for v in data.values() if isinstance(v, str) and v.strip()):
+        return {"connected": True, "source": "user", "configured": True}
     env_key = CREDENTIAL_PROVIDER_ENV_KEYS.get(provider_id)
     if env_key:
         global_val = getattr(settings, env_key, None) or ""
@@ -462,6 +455,78 @@ async def get_provider_status(
     return _get_provider_credential_status(db, current_user.id, provider_id)
 
 
+def _courier_push_url(courier: str) -> str | None:
+    base = (getattr(settings, "WEBHOOK_BASE_URL", None) or "").strip().rstrip("/")
+    return f"{base}/api/webhooks/couriers/{courier}" if base else None
+
+
+@router.post("/providers/{provider_id}/push-token")
+async def create_courier_push_token(
+    provider_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Create or rotate the courier status push token (delhivery, selloship). The token is returned once;
+    give the courier the push URL and the token (X-Webhook-Token header or ?token=). Rotating revokes the old one.
+    """
+    if provider_id not in PUSH_COURIERS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Status push is not supported for this provider")
+    token = issue_push_token(db, current_user.id, provider_id)
+    db.commit()
+    return {
+        "token": token,
+        "url": _courier_push_url(provider_id),
+        "message": "Copy this token now; it is not shown again.",
+    }
+
+
+@router.delete("/providers/{provider_id}/push-token")
+async def delete_courier_push_token(
+    provider_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Revoke the courier status push token; shipments go back to full-rate polling."""
+    if provider_id not in PUSH_COURIERS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Status push is not supported for this provider")
+    deleted = (
+        db.query(CourierPushToken)
+        .filter(CourierPushToken.user_id == current_user.id, CourierPushToken.courier == provider_id)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return {"deleted": bool(deleted)}
+
+
+@router.get("/providers/{provider_id}/push-status")
+async def get_courier_push_status(
+    provider_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Whether a push token exists and when the courier last pushed (active = within COURIER_PUSH_ACTIVE_WINDOW_SEC)."""
+    if provider_id not in PUSH_COURIERS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Status push is not supported for this provider")
+    row = (
+        db.query(CourierPushToken)
+        .filter(CourierPushToken.user_id == current_user.id, CourierPushToken.courier == provider_id)
+        .first()
+    )
+    last_push_at = row.last_push_at if row else None
+    active = bool(
+        last_push_at
+        and datetime.now(timezone.utc).replace(tzinfo=None) - last_push_at
+        <= timedelta(seconds=settings.COURIER_PUSH_ACTIVE_WINDOW_SEC)
+    )
+    return {
+        "configured": row is not None,
+        "active": active,
+        "lastPushAt": last_push_at.isoformat() if last_push_at else None,
+        "url": _courier_push_url(provider_id),
+    }
+
+
 def _ensure_channel_account_for_marketplace(
     db: Session,
     user_id: str,
@@ -552,6 +617,7 @@ async def connect_provider(
         db.add(cred)
         db.commit()
         db.refresh(cred)
+    invalidate_provider_credentials(current_user.id, provider_id)
 
     # Ensure ChannelAccount exists for commerce marketplaces so sync/orders can run
     seller_id = (body.get("seller_id") or body.get("sellerId") or "").strip()
@@ -666,10 +732,8 @@ async def trigger_ad_spend_sync(
     yesterday = (now_ist - timedelta(days=1)).date()
     result = await sync_ad_spend_for_date(db, current_user.id, yesterday)
     db.commit()
-    # Recompute profit for orders on that date so marketing_cost is updated
-    for (oid,) in db.query(Order.id).filter(func.date(Order.created_at) == yesterday).all():
-        compute_profit_for_order(db, str(oid))
-    db.commit()
+    # Queue profit recompute for orders on that date so marketing_cost is updated
+    enqueue_profit_recompute(days=[yesterday])
     return {
         "message": "Ad spend sync completed",
         "date": yesterday.isoformat(),
@@ -916,7 +980,7 @@ async def shopify_inventory(
     # Refresh: call Shopify, persist to cache, return
     logger.info("GET /shopify/inventory: shop=%s refresh=true calling Shopify", shop)
     try:
-        inventory = await shopify_get_inventory(shop, integration.access_token)
+        inventory, failed_item_ids = await shopify_get_inventory(shop, integration.access_token)
     except Exception as e:
         logger.warning("Shopify inventory fetch failed: %s", e)
         return {
@@ -929,7 +993,7 @@ async def shopify_inventory(
 
     # Upsert cache
     try:
-        db.query(ShopifyInventory).filter(ShopifyInventory.shop_domain == shop).delete()
+        clear_inventory_cache(db, shop, failed_item_ids)
         for row in inventory:
             if not isinstance(row, dict):
                 continue
@@ -961,6 +1025,46 @@ async def shopify_inventory(
     return {"inventory": out, "source": "shopify"}
 
 
+async def _fetch_shopify_orders_delta(integration, account: ChannelAccount) -> tuple[list[dict], str | None]:
+    """
+    Fetch orders changed since the account's sync checkpoint (resuming a capped run from its cursor).
+    Returns (raw_orders, next_cursor); next_cursor is set when SHOPIFY_ORDER_SYNC_MAX_PAGES was hit.
+    """
+    watermark = account.orders_updated_at_min
+    cursor = account.orders_page_cursor
+    max_pages = settings.SHOPIFY_ORDER_SYNC_MAX_PAGES
+    if cursor:
+        try:
+            return await get_orders_raw_paginated(
+                integration.shop_domain, integration.access_token, cursor=cursor, max_pages=max_pages
+            )
+        except Exception as e:
+            # page_info cursors expire; the updated_at watermark still bounds the refetch
+            logger.warning("Shopify order cursor resume failed, falling back to updated_at_min: %s", e)
+    return await get_orders_raw_paginated(
+        integration.shop_domain, integration.access_token, updated_at_min=watermark, max_pages=max_pages
+    )
+
+
+def _save_shopify_order_checkpoint(account: ChannelAccount, raw_orders: list[dict], next_cursor: str | None) -> None:
+    """Advance the account's order watermark and store the resume cursor; caller commits with the orders."""
+    account.orders_updated_at_min = latest_updated_at(raw_orders, account.orders_updated_at_min)
+    account.orders_page_cursor = next_cursor
+
+
+def _existing_channel_order_ids(db: Session, channel_id: str, account_id: str, raw_orders: list[dict]) -> set[str]:
+    """channel_order_ids from raw_orders already stored for this account (one query)."""
+    ids = {str(o.get("id")) for o in raw_orders if o.get("id")}
+    if not ids:
+        return set()
+    rows = db.query(Order.channel_order_id).filter(
+        Order.channel_id == channel_id,
+        Order.channel_account_id == account_id,
+        Order.channel_order_id.in_(ids),
+    ).all()
+    return {r[0] for r in rows}
+
+
 @router.post("/shopify/sync/orders")
 async def shopify_sync_orders(
     db: Session = Depends(get_db),
@@ -978,11 +1082,7 @@ async def shopify_sync_orders(
     if not account:
         raise HTTPException(status_code=401, detail="Shopify not connected. Connect via OAuth first.")
     try:
-        raw_orders = await get_orders_raw(
-            integration.shop_domain,
-            integration.access_token,
-            limit=250,
-        )
+        raw_orders, next_cursor = await _fetch_shopify_orders_delta(integration, account)
     except Exception as e:
         logger.exception("Shopify API error in sync/orders: %s", e)
         raise HTTPException(
@@ -991,18 +1091,15 @@ async def shopify_sync_orders(
         )
     inserted = 0
     try:
+        existing_ids = _existing_channel_order_ids(db, channel.id, account.id, raw_orders)
         for o in raw_orders:
             shopify_id = str(o.get("id") or "")
             if not shopify_id:
                 continue
             # Idempotent: skip if we already have this order for this user's account
-            existing = db.query(Order).filter(
-                Order.channel_id == channel.id,
-                Order.channel_account_id == account.id,
-                Order.channel_order_id == shopify_id,
-            ).first()
-            if existing:
+            if shopify_id in existing_ids:
                 continue
+            existing_ids.add(shopify_id)
 
             # Customer name from billing or email
             billing = o.get("billing_address") or {}
@@ -1044,6 +1141,7 @@ async def shopify_sync_orders(
 
         if getattr(integration, "_integration_row", None):
             integration._integration_row.last_synced_at = datetime.now(timezone.utc)
+        _save_shopify_order_checkpoint(account, raw_orders, next_cursor)
         db.commit()
     except IntegrityError as e:
         db.rollback()
@@ -1059,7 +1157,12 @@ async def shopify_sync_orders(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Order sync failed. Check server logs or try again.",
         )
-    return {"synced": inserted, "total_fetched": len(raw_orders), "message": f"Imported {inserted} new orders."}
+    return {
+        "synced": inserted,
+        "total_fetched": len(raw_orders),
+        "has_more": bool(next_cursor),
+        "message": f"Imported {inserted} new orders.",
+    }
 
 
 def _get_or_create_shopify_channel_account(db: Session, integration: ShopifyIntegration, current_user: User):
@@ -1106,11 +1209,7 @@ async def shopify_sync(
 
     # 1) Sync orders
     try:
-        raw_orders = await get_orders_raw(
-            integration.shop_domain,
-            integration.access_token,
-            limit=250,
-        )
+        raw_orders, next_cursor = await _fetch_shopify_orders_delta(integration, account)
     except Exception as e:
         logger.exception("Shopify API error in sync (orders): %s", e)
         raise HTTPException(
@@ -1137,12 +1236,12 @@ async def shopify_sync(
     orders_inserted = 0
     new_order_ids: list[str] = []
     try:
+        existing_ids = _existing_channel_order_ids(db, channel.id, account.id, raw_orders)
         for o in raw_orders:
             shopify_id = str(o.get("id") or "")
-            if not shopify_id:
-                continue
-            if db.query(Order).filter(Order.channel_id == channel.id, Order.channel_account_id == account.id, Order.channel_order_id == shopify_id).first():
+            if not shopify_id or shopify_id in existing_ids:
                 continue
+            existing_ids.add(shopify_id)
             billing = o.get("billing_address") or {}
             first = (billing.get("first_name") or "").strip()
             last = (billing.get("last_name") or "").strip()
@@ -1184,14 +1283,14 @@ async def shopify_sync(
             orders_inserted += 1
 
         # 2) Recompute profit for newly synced orders (uses sku_costs when present)
-        for oid in new_order_ids:
-            try:
-                compute_profit_for_order(db, oid)
-            except Exception as e:
-                logger.warning("Profit recompute for order %s failed: %s", oid, e)
+        try:
+            compute_profit_for_orders(db, new_order_ids)
+        except Exception as e:
+            logger.warning("Profit recompute for %s synced order(s) failed: %s", len(new_order_ids), e)
 
         if getattr(integration, "_integration_row", None):
             integration._integration_row.last_synced_at = datetime.now(timezone.utc)
+        _save_shopify_order_checkpoint(account, raw_orders, next_cursor)
         db.commit()
     except IntegrityError as e:
         db.rollback()
@@ -1210,14 +1309,15 @@ async def shopify_sync(
 
     # Inventory sync (outside order transaction; never fail the request)
     inv_list: list = []
+    failed_item_ids: set = set()
     try:
-        inv_list = await shopify_get_inventory(
+        inv_list, failed_item_ids = await shopify_get_inventory(
             integration.shop_domain,
             integration.access_token,
         )
     except Exception as e:
         logger.warning("Shopify inventory fetch in sync failed: %s", e)
-    inventory_synced = persist_shopify_inventory(db, integration.shop_domain, inv_list or [])
+    inventory_synced = persist_shopify_inventory(db, integration.shop_domain, inv_list or [], failed_item_ids)
     try:
         db.commit()
     except Exception as e:
@@ -1228,5 +1328,6 @@ async def shopify_sync(
         "orders_synced": orders_inserted,
         "inventory_synced": inventory_synced,
         "total_orders_fetched": len(raw_orders),
+        "has_more_orders": bool(next_cursor),
         "message": message,
     }
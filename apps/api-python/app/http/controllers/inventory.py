@@ -4,9 +4,11 @@ only variants that appear in orders from the user's connected channel accounts a
 If no marketplace is connected, inventory list is empty.
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.models import (
     Inventory,
     Warehouse,
@@ -16,11 +18,10 @@ from app.models import (
     User,
     AuditLog,
     AuditLogAction,
-    ChannelAccount,
     Order,
     OrderItem,
 )
-from app.auth import get_current_user
+from app.auth import TenantScope, get_current_user, get_tenant_scope
 from app.http.requests import InventoryAdjustRequest, InventoryResponse
 
 router = APIRouter()
@@ -30,42 +31,37 @@ router = APIRouter()
 async def list_inventory(
     warehouse_id: Optional[str] = Query(None),
     sku: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    scope: TenantScope = Depends(get_tenant_scope),
 ):
     """List inventory scoped to current user: only variants from their channel orders. No channels => empty."""
-    user_account_ids = [
-        acc.id for acc in db.query(ChannelAccount).filter(
-            ChannelAccount.user_id == current_user.id
-        ).all()
-    ]
+    user_account_ids = scope.channel_account_ids
     if not user_account_ids:
         return {"inventory": []}
 
     # Variant IDs that appear in this user's orders (scope inventory to user's channels)
-    variant_ids = [
-        r[0]
-        for r in db.query(OrderItem.variant_id)
+    variant_ids = (
+        select(OrderItem.variant_id)
         .join(Order, Order.id == OrderItem.order_id)
-        .filter(
+        .where(
             Order.channel_account_id.in_(user_account_ids),
             OrderItem.variant_id.isnot(None),
         )
         .distinct()
-        .all()
-    ]
-    if not variant_ids:
-        return {"inventory": []}
+    )
 
-    query = db.query(Inventory).filter(Inventory.variant_id.in_(variant_ids))
+    query = select(Inventory).where(Inventory.variant_id.in_(variant_ids)).options(
+        selectinload(Inventory.warehouse),
+        selectinload(Inventory.variant).selectinload(ProductVariant.product),
+    )
 
     if warehouse_id:
-        query = query.filter(Inventory.warehouse_id == warehouse_id)
+        query = query.where(Inventory.warehouse_id == warehouse_id)
 
     if sku:
-        query = query.join(ProductVariant).filter(ProductVariant.sku.contains(sku))
+        query = query.join(ProductVariant).where(ProductVariant.sku.contains(sku))
 
-    inventory_list = query.all()
+    inventory_list = (await db.execute(query)).scalars().all()
     
     result = []
     for inv in inventory_list:
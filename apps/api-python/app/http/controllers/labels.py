@@ -4,8 +4,8 @@ Label generation routes
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import Order, User, Label, ChannelAccount
-from app.auth import get_current_user
+from app.models import Order, User, Label
+from app.auth import TenantScope, get_current_user, get_tenant_scope
 from pydantic import BaseModel
 from typing import Optional, List
 
@@ -39,7 +39,7 @@ async def list_labels(
 async def generate_labels(
     request: GenerateLabelRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    scope: TenantScope = Depends(get_tenant_scope)
 ):
     """Generate shipping labels for orders"""
     # Handle both single orderId and orderIds array
@@ -55,11 +55,7 @@ async def generate_labels(
         )
     
     # Get channel accounts for the current user
-    channel_accounts = db.query(ChannelAccount).filter(
-        ChannelAccount.user_id == current_user.id
-    ).all()
-    
-    channel_account_ids = [ca.id for ca in channel_accounts]
+    channel_account_ids = scope.channel_account_ids
     
     # Get orders that belong to user's channel accounts
     if channel_account_ids:
@@ -94,7 +90,7 @@ async def generate_labels(
         order_id_str = str(order.id) if isinstance(order.id, str) else order.id
         label = Label(
             order_id=order_id_str,
-            user_id=str(current_user.id),
+            user_id=str(scope.user.id),
             tracking_number=f"TRACK{order.id:08d}",
             carrier="Standard",
             status="PENDING"
@@ -2,106 +2,177 @@
 Order routes
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, tuple_
 from typing import Optional
 from datetime import datetime
-from app.database import get_db
-from app.models import Order, OrderItem, OrderStatus, User, FulfillmentStatus, Warehouse, Inventory, InventoryMovement, InventoryMovementType, Channel, ChannelAccount, AuditLog, AuditLogAction, OrderProfit
-from app.auth import get_current_user
+import base64
+import json
+from app.config import settings
+from app.database import get_db, get_async_db
+from app.models import Order, OrderItem, OrderStatus, User, FulfillmentStatus, Warehouse, Inventory, InventoryMovement, InventoryMovementType, Channel, AuditLog, AuditLogAction, OrderProfit, DailyOrderRollup
+from app.auth import TenantScope, get_current_user, get_tenant_scope
 from app.services.warehouse_helper import get_default_warehouse
+from app.services.order_search import search_condition, search_rank
+from app.services.rate_cards import COST_SOURCE_MANUAL, apply_rate_card
 from app.http.requests import OrderResponse, ShipOrderRequest
 from decimal import Decimal
 
 router = APIRouter()
 
+def _order_list_item(order: Order) -> dict:
+    return {
+        "id": order.id,
+        "channelOrderId": order.channel_order_id,
+        "customerName": order.customer_name,
+        "customerEmail": order.customer_email,
+        "shippingAddress": getattr(order, "shipping_address", None) or None,
+        "billingAddress": getattr(order, "billing_address", None) or None,
+        "paymentMode": order.payment_mode.value,
+        "orderTotal": float(order.order_total),
+        "status": order.status.value,
+        "createdAt": order.created_at.isoformat(),
+        "items": [
+            {
+                "id": item.id,
+                "sku": item.sku,
+                "title": item.title,
+                "qty": item.qty,
+                "price": float(item.price),
+                "fulfillmentStatus": item.fulfillment_status.value
+            }
+            for item in order.items
+        ]
+    }
+
+
+def _encode_cursor(order: Order) -> str:
+    raw = json.dumps({"c": order.created_at.isoformat(), "i": order.id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(data["c"]), str(data["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("", response_model=dict)
 async def list_orders(
     status_filter: Optional[str] = Query(None, alias="status"),
     channel: Optional[str] = Query(None),
     q: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    limit: int = Query(settings.ORDERS_PAGE_SIZE, ge=1, le=settings.ORDERS_PAGE_SIZE_MAX),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(False, alias="includeTotal"),
+    db: AsyncSession = Depends(get_async_db),
+    scope: TenantScope = Depends(get_tenant_scope)
 ):
-    """List orders with filters"""
+    """
+    List orders with filters (q: indexed search, see /orders/search), newest first. Keyset pagination on (created_at, id): pass the previous
+    page's nextCursor as cursor. includeTotal=true adds total (from daily_order_rollup unless channel/q
+    filters are set, then an exact count).
+    """
     # Get channel accounts for the current user
-    channel_accounts = db.query(ChannelAccount).filter(
-        ChannelAccount.user_id == current_user.id
-    ).all()
-    
-    channel_account_ids = [ca.id for ca in channel_accounts]
+    channel_account_ids = scope.channel_account_ids
     
     # Start query with user's orders only
     if channel_account_ids:
-        query = db.query(Order).filter(
+        query = select(Order).where(
             Order.channel_account_id.in_(channel_account_ids)
         )
     else:
         # No channel accounts, return empty result
-        return {"orders": []}
+        return {"orders": [], "nextCursor": None, "hasMore": False}
     
+    status_value = None
     if status_filter and status_filter != "all":
-        query = query.filter(Order.status == status_filter)
+        try:
+            status_value = OrderStatus(status_filter)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid status: {status_filter}")
+        query = query.where(Order.status == status_value)
     
     if channel:
-        query = query.join(Order.channel).filter(Channel.name == channel)
-    
-    if q:
-        query = query.filter(
-            or_(
-                Order.channel_order_id.contains(q),
-                Order.customer_name.contains(q),
-                Order.customer_email.contains(q)
-            )
-        )
-    
-    orders = query.order_by(Order.created_at.desc()).limit(100).all()
-    
-    result = []
-    for order in orders:
-        items = db.query(OrderItem).filter(OrderItem.order_id == order.id).all()
-        result.append({
-            "id": order.id,
-            "channelOrderId": order.channel_order_id,
-            "customerName": order.customer_name,
-            "customerEmail": order.customer_email,
-            "shippingAddress": getattr(order, "shipping_address", None) or None,
-            "billingAddress": getattr(order, "billing_address", None) or None,
-            "paymentMode": order.payment_mode.value,
-            "orderTotal": float(order.order_total),
-            "status": order.status.value,
-            "createdAt": order.created_at.isoformat(),
-            "items": [
-                {
-                    "id": item.id,
-                    "sku": item.sku,
-                    "title": item.title,
-                    "qty": item.qty,
-                    "price": float(item.price),
-                    "fulfillmentStatus": item.fulfillment_status.value
-                }
-                for item in items
-            ]
-        })
-    
-    return {"orders": result}
+        query = query.join(Order.channel).where(Channel.name == channel)
+    
+    if q and q.strip():
+        query = query.where(search_condition(q, db.bind.dialect.name))
+    
+    total = None
+    if include_total:
+        if channel or q:
+            total = (await db.execute(select(func.count()).select_from(query.subquery()))).scalar() or 0
+        else:
+            count_col = getattr(DailyOrderRollup, f"{status_value.value.lower()}_count") if status_value else DailyOrderRollup.order_count
+            total = (await db.execute(
+                select(func.coalesce(func.sum(count_col), 0))
+                .where(DailyOrderRollup.channel_account_id.in_(channel_account_ids))
+            )).scalar() or 0
+    
+    if cursor:
+        after_created, after_id = _decode_cursor(cursor)
+        query = query.where(tuple_(Order.created_at, Order.id) < tuple_(after_created, after_id))
+    
+    page = (await db.execute(
+        query.options(selectinload(Order.items))
+        .order_by(Order.created_at.desc(), Order.id.desc())
+        .limit(limit + 1)
+    )).scalars().all()
+    has_more = len(page) > limit
+    orders = page[:limit]
+    
+    response = {
+        "orders": [_order_list_item(order) for order in orders],
+        "nextCursor": _encode_cursor(orders[-1]) if has_more else None,
+        "hasMore": has_more,
+    }
+    if total is not None:
+        response["total"] = int(total)
+    return response
+
+
+@router.get("/search", response_model=dict)
+async def search_orders(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+    scope: TenantScope = Depends(get_tenant_scope)
+):
+    """
+    Ranked order search by order number, customer name/email, AWB or SKU (word prefixes and substrings).
+    Indexed on Postgres (tsvector + pg_trgm); LIKE fallback on SQLite.
+    """
+    channel_account_ids = scope.channel_account_ids
+    if not channel_account_ids or not q.strip():
+        return {"orders": []}
+    dialect_name = db.bind.dialect.name
+    orders = (await db.execute(
+        select(Order)
+        .where(Order.channel_account_id.in_(channel_account_ids), search_condition(q, dialect_name))
+        .options(selectinload(Order.items))
+        .order_by(search_rank(q, dialect_name).desc(), Order.created_at.desc(), Order.id.desc())
+        .limit(limit)
+    )).scalars().all()
+    return {"orders": [_order_list_item(order) for order in orders]}
 
 @router.get("/{order_id}")
 async def get_order(
     order_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    scope: TenantScope = Depends(get_tenant_scope)
 ):
     """Get order details"""
     # Get channel accounts for the current user
-    channel_accounts = db.query(ChannelAccount).filter(
-        ChannelAccount.user_id == current_user.id
-    ).all()
-    
-    channel_account_ids = [ca.id for ca in channel_accounts]
+    channel_account_ids = scope.channel_account_ids
     
     # Check if order belongs to user
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = (await db.execute(
+        select(Order).where(Order.id == order_id).options(selectinload(Order.items), selectinload(Order.shipment))
+    )).scalars().first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -109,13 +180,12 @@ async def get_order(
     if order.channel_account_id not in channel_account_ids:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    items = db.query(OrderItem).filter(OrderItem.order_id == order.id).all()
+    items = order.items
     
     # Get shipment if exists
-    from app.models import Shipment
-    shipment = db.query(Shipment).filter(Shipment.order_id == order.id).first()
+    shipment = order.shipment
     # Get profit if computed
-    profit = db.query(OrderProfit).filter(OrderProfit.order_id == order.id).first()
+    profit = (await db.execute(select(OrderProfit).where(OrderProfit.order_id == order.id))).scalars().first()
 
     return {
         "order": {
@@ -176,10 +246,10 @@ async def get_order(
 async def confirm_order(
     order_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    scope: TenantScope = Depends(get_tenant_scope)
 ):
     """Confirm order (only for orders belonging to the current user)."""
-    account_ids = [ca.id for ca in db.query(ChannelAccount).filter(ChannelAccount.user_id == current_user.id).all()]
+    account_ids = scope.channel_account_ids
     order = db.query(Order).filter(Order.id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -231,7 +301,7 @@ async def confirm_order(
     
     # Log audit event
     audit_log = AuditLog(
-        user_id=current_user.id,
+        user_id=scope.user.id,
         action=AuditLogAction.ORDER_CONFIRMED,
         entity_type="Order",
         entity_id=order.id,
@@ -246,10 +316,10 @@ async def confirm_order(
 async def pack_order(
     order_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    scope: TenantScope = Depends(get_tenant_scope)
 ):
     """Pack order (only for orders belonging to the current user)."""
-    account_ids = [ca.id for ca in db.query(ChannelAccount).filter(ChannelAccount.user_id == current_user.id).all()]
+    account_ids = scope.channel_account_ids
     order = db.query(Order).filter(Order.id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -267,7 +337,7 @@ async def pack_order(
     
     # Log audit event
     audit_log = AuditLog(
-        user_id=current_user.id,
+        user_id=scope.user.id,
         action=AuditLogAction.ORDER_PACKED,
         entity_type="Order",
         entity_id=order.id,
@@ -317,6 +387,10 @@ async def ship_order(
         status=ShipmentStatus.SHIPPED,
         shipped_at=datetime.utcnow()
     )
+    if shipment.forward_cost or shipment.reverse_cost:
+        shipment.cost_source = COST_SOURCE_MANUAL
+    else:
+        apply_rate_card(db, shipment, order, current_user.id, zone=request.zone, weight_grams=request.weight_grams)
     db.add(shipment)
     
     # Decrement inventory
@@ -374,10 +448,10 @@ async def ship_order(
 async def cancel_order(
     order_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    scope: TenantScope = Depends(get_tenant_scope)
 ):
     """Cancel order (only for orders belonging to the current user)."""
-    account_ids = [ca.id for ca in db.query(ChannelAccount).filter(ChannelAccount.user_id == current_user.id).all()]
+    account_ids = scope.channel_account_ids
     order = db.query(Order).filter(Order.id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -427,7 +501,7 @@ async def cancel_order(
     
     # Log audit event
     audit_log = AuditLog(
-        user_id=current_user.id,
+        user_id=scope.user.id,
         action=AuditLogAction.ORDER_CANCELLED,
         entity_type="Order",
         entity_id=order.id,
@@ -6,9 +6,9 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from app.database import get_db
-from app.models import Order, OrderProfit, User, ChannelAccount
-from app.auth import get_current_user
-from app.services.profit_calculator import compute_profit_for_order
+from app.models import Order, OrderProfit
+from app.auth import TenantScope, get_tenant_scope
+from app.services.profit_calculator import compute_profit_for_order, compute_profit_for_orders
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -18,7 +18,7 @@ router = APIRouter()
 async def recompute_profit(
     order_id: str | None = Query(None, description="Recompute one order; omit to recompute all for user"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    scope: TenantScope = Depends(get_tenant_scope),
 ):
     """
     Recompute profit for one order or all orders belonging to the current user.
@@ -28,8 +28,7 @@ async def recompute_profit(
         order = db.query(Order).filter(Order.id == order_id).first()
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
-        account_ids = [a.id for a in db.query(ChannelAccount).filter(ChannelAccount.user_id == current_user.id).all()]
-        if order.channel_account_id not in account_ids:
+        if order.channel_account_id not in scope.channel_account_ids:
             raise HTTPException(status_code=403, detail="Access denied")
         row = compute_profit_for_order(db, order_id)
         db.commit()
@@ -44,16 +43,15 @@ async def recompute_profit(
             } if row else None,
         }
     # Recompute all orders for user's channel accounts
-    account_ids = [a.id for a in db.query(ChannelAccount).filter(ChannelAccount.user_id == current_user.id).all()]
+    account_ids = scope.channel_account_ids
     if not account_ids:
         return {"recomputed": 0, "message": "No channel accounts"}
-    orders = db.query(Order).filter(Order.channel_account_id.in_(account_ids)).all()
-    count = 0
-    for order in orders:
-        try:
-            compute_profit_for_order(db, order.id)
-            count += 1
-        except Exception as e:
-            logger.warning("Profit recompute for order %s failed: %s", order.id, e)
-    db.commit()
-    return {"recomputed": count, "totalOrders": len(orders)}
+    order_ids = [oid for (oid,) in db.query(Order.id).filter(Order.channel_account_id.in_(account_ids)).all()]
+    try:
+        count = compute_profit_for_orders(db, order_ids)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.exception("Profit recompute failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Profit recompute failed: {e}")
+    return {"recomputed": count, "totalOrders": len(order_ids)}
@@ -0,0 +1,290 @@
+"""
+Courier rate cards (versioned, per courier) and courier invoice upload for shipping-cost reconciliation.
+Shipments are costed from the card in force when they are created; invoices replace the estimate in the
+reconcile batch (see app/services/rate_cards.py).
+"""
+import csv
+import io
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from typing import Any
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from pydantic import BaseModel
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.models import CourierInvoiceLine, RateCard, User
+from app.auth import get_current_user
+from app.services.rate_cards import (
+    courier_key,
+    estimate_missing_costs,
+    find_rate_card,
+    quote,
+    reconcile_shipping_costs,
+    validate_zones,
+    zone_for,
+)
+from app.services.shipment_schedule import utcnow
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+class RateCardCreate(BaseModel):
+    courier: str
+    zones: dict[str, Any]
+    effective_from: datetime | None = None
+    origin_pincode: str | None = None
+    additional_slab_grams: int = 500
+    cod_fixed_fee: float = 0.0
+    cod_percent: float = 0.0
+    rto_multiplier: float = 1.0
+
+
+class QuoteRequest(BaseModel):
+    courier: str
+    weight_grams: int
+    zone: str | None = None
+    destination_pincode: str | None = None
+    cod: bool = False
+    order_total: float = 0.0
+
+
+def _to_response(card: RateCard) -> dict:
+    return {
+        "id": card.id,
+        "courier": card.courier,
+        "version": card.version,
+        "effective_from": card.effective_from.isoformat() if card.effective_from else None,
+        "origin_pincode": card.origin_pincode,
+        "zones": card.zones,
+        "additional_slab_grams": card.additional_slab_grams,
+        "cod_fixed_fee": float(card.cod_fixed_fee or 0),
+        "cod_percent": float(card.cod_percent or 0),
+        "rto_multiplier": float(card.rto_multiplier or 1),
+        "created_at": card.created_at.isoformat() if card.created_at else None,
+    }
+
+
+def _invoice_line_response(line: CourierInvoiceLine) -> dict:
+    return {
+        "id": line.id,
+        "courier": line.courier,
+        "invoice_number": line.invoice_number,
+        "awb_number": line.awb_number,
+        "forward_cost": float(line.forward_cost or 0),
+        "reverse_cost": float(line.reverse_cost) if line.reverse_cost is not None else None,
+        "shipment_id": line.shipment_id,
+        "reconciled_at": line.reconciled_at.isoformat() if line.reconciled_at else None,
+    }
+
+
+def _norm_header(k: str) -> str:
+    return (k or "").strip().lower().replace(" ", "_")
+
+
+@router.get("", response_model=list)
+async def list_rate_cards(
+    courier: str | None = Query(None, description="Filter by courier, e.g. delhivery"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """All rate card versions of the current user, newest first."""
+    query = db.query(RateCard).filter(RateCard.user_id == current_user.id)
+    if courier and courier.strip():
+        query = query.filter(RateCard.courier == courier_key(courier))
+    rows = query.order_by(RateCard.courier, RateCard.version.desc()).all()
+    return [_to_response(r) for r in rows]
+
+
+@router.post("", status_code=status.HTTP_201_CREATED, response_model=dict)
+async def create_rate_card(
+    body: RateCardCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Add a new rate card version for a courier (cards are never edited). Shipments created from effective_from
+    on are costed with it; shipments of this courier that were never costed are estimated right away.
+    """
+    courier = courier_key(body.courier)
+    if not courier:
+        raise HTTPException(status_code=400, detail="courier is required")
+    try:
+        zones = validate_zones(body.zones)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if body.additional_slab_grams <= 0 or body.cod_fixed_fee < 0 or body.cod_percent < 0 or body.rto_multiplier < 0:
+        raise HTTPException(status_code=400, detail="Slab size must be positive and fees/multiplier non-negative")
+    latest = (
+        db.query(func.max(RateCard.version))
+        .filter(RateCard.user_id == current_user.id, RateCard.courier == courier)
+        .scalar()
+    )
+    effective_from = body.effective_from or utcnow()
+    if effective_from.tzinfo is not None:
+        effective_from = effective_from.astimezone(timezone.utc).replace(tzinfo=None)
+    card = RateCard(
+        user_id=current_user.id,
+        courier=courier,
+        version=(latest or 0) + 1,
+        effective_from=effective_from,
+        origin_pincode=(body.origin_pincode or "").strip() or None,
+        zones=zones,
+        additional_slab_grams=body.additional_slab_grams,
+        cod_fixed_fee=Decimal(str(body.cod_fixed_fee)),
+        cod_percent=Decimal(str(body.cod_percent)),
+        rto_multiplier=Decimal(str(body.rto_multiplier)),
+    )
+    db.add(card)
+    db.commit()
+    db.refresh(card)
+    estimated = estimate_missing_costs(db, current_user.id, card) if effective_from <= utcnow() else 0
+    return {**_to_response(card), "estimated_shipments": estimated}
+
+
+@router.post("/quote", response_model=dict)
+async def quote_shipping_cost(
+    body: QuoteRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Forward/reverse cost for a parcel on the courier's current card (zone given or from destination pincode)."""
+    card = find_rate_card(db, current_user.id, body.courier)
+    if not card:
+        raise HTTPException(status_code=404, detail="No rate card in force for this courier")
+    zone = (body.zone or "").strip().upper() or zone_for(card.origin_pincode, (body.destination_pincode or "").strip() or None)
+    result = quote(card, zone, body.weight_grams, body.cod, body.order_total)
+    if result is None:
+        raise HTTPException(status_code=400, detail=f"Rate card has no rates for zone {zone}")
+    return {
+        "rate_card_id": card.id,
+        "version": card.version,
+        **{k: float(v) if isinstance(v, Decimal) else v for k, v in result.items()},
+    }
+
+
+@router.post("/invoices", response_model=dict)
+async def upload_courier_invoice(
+    courier: str = Query(..., description="Courier the invoice is from, e.g. delhivery"),
+    file: UploadFile = File(..., description="CSV with columns: invoice_number, awb_number, forward_cost, reverse_cost (optional)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Upload a courier invoice CSV. Lines are applied to shipment costs by the reconcile batch (or POST /reconcile)."""
+    courier = courier_key(courier)
+    if not courier:
+        raise HTTPException(status_code=400, detail="courier is required")
+    if not file.filename or not file.filename.lower().endswith(".csv"):
+        raise HTTPException(status_code=400, detail="File must be a CSV")
+    try:
+        body = await file.read()
+    except Exception as e:
+        logger.warning("Invoice upload read error: %s", e)
+        raise HTTPException(status_code=400, detail="Failed to read file")
+    try:
+        text = body.decode("utf-8-sig").replace("\r\n", "\n").replace("\r", "\n")
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames:
+            raise HTTPException(status_code=400, detail="CSV has no header row")
+        field_map = {_norm_header(f): f for f in reader.fieldnames}
+        awb_col = field_map.get("awb_number") or field_map.get("awb") or field_map.get("waybill")
+        fwd_col = field_map.get("forward_cost") or field_map.get("amount")
+        if not awb_col or not fwd_col:
+            raise HTTPException(status_code=400, detail="CSV must have 'awb_number' and 'forward_cost' columns")
+        inv_col = field_map.get("invoice_number")
+        rev_col = field_map.get("reverse_cost") or field_map.get("rto_cost")
+        parsed: dict[tuple[str, str], tuple[Decimal, Decimal | None]] = {}
+        errors: list[str] = []
+        for i, row in enumerate(reader):
+            awb = (row.get(awb_col) or "").strip()
+            if not awb:
+                continue
+            invoice_number = ((row.get(inv_col) if inv_col else None) or "").strip() or (file.filename or "invoice")
+            try:
+                forward = Decimal(str(row.get(fwd_col) or 0).strip())
+                raw_reverse = (row.get(rev_col) or "").strip() if rev_col else ""
+                reverse = Decimal(raw_reverse) if raw_reverse else None
+            except (InvalidOperation, ValueError) as e:
+                errors.append(f"Row {i + 2}: invalid number - {e}")
+                continue
+            parsed[(invoice_number, awb)] = (forward, reverse)
+        existing = {
+            (line.invoice_number, line.awb_number): line
+            for line in db.query(CourierInvoiceLine).filter(
+                CourierInvoiceLine.user_id == current_user.id,
+                CourierInvoiceLine.courier == courier,
+                CourierInvoiceLine.invoice_number.in_({k[0] for k in parsed}),
+            )
+        }
+        created = 0
+        updated = 0
+        for (invoice_number, awb), (forward, reverse) in parsed.items():
+            line = existing.get((invoice_number, awb))
+            if line:
+                # Re-upload re-opens the line (corrected amounts, or the shipment now exists)
+                line.forward_cost = forward
+                line.reverse_cost = reverse
+                line.reconciled_at = None
+                updated += 1
+            else:
+                db.add(CourierInvoiceLine(
+                    user_id=current_user.id,
+                    courier=courier,
+                    invoice_number=invoice_number,
+                    awb_number=awb,
+                    forward_cost=forward,
+                    reverse_cost=reverse,
+                ))
+                created += 1
+        db.commit()
+        return {"created": created, "updated": updated, "errors": errors[:50]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Invoice upload failed: %s", e)
+        raise HTTPException(status_code=400, detail=f"Invalid CSV: {e}")
+
+
+@router.get("/invoices", response_model=list)
+async def list_courier_invoice_lines(
+    state: str | None = Query(None, description="pending | matched | unmatched"),
+    limit: int = Query(200, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Uploaded invoice lines of the current user, newest first."""
+    query = db.query(CourierInvoiceLine).filter(CourierInvoiceLine.user_id == current_user.id)
+    if state == "pending":
+        query = query.filter(CourierInvoiceLine.reconciled_at.is_(None))
+    elif state == "matched":
+        query = query.filter(CourierInvoiceLine.shipment_id.isnot(None))
+    elif state == "unmatched":
+        query = query.filter(CourierInvoiceLine.reconciled_at.isnot(None), CourierInvoiceLine.shipment_id.is_(None))
+    rows = query.order_by(CourierInvoiceLine.created_at.desc()).limit(limit).all()
+    return [_invoice_line_response(r) for r in rows]
+
+
+@router.post("/reconcile", response_model=dict)
+async def reconcile_now(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Run the shipping-cost reconcile batch for the current user now (invoices, then courier-reported costs)."""
+    return reconcile_shipping_costs(db, user_id=current_user.id)
+
+
+@router.get("/{card_id}", response_model=dict)
+async def get_rate_card(
+    card_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Get one rate card version."""
+    card = db.query(RateCard).filter(RateCard.id == card_id, RateCard.user_id == current_user.id).first()
+    if not card:
+        raise HTTPException(status_code=404, detail="Rate card not found")
+    return _to_response(card)
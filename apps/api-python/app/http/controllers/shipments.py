@@ -4,22 +4,21 @@ Shipment routes: list, get by id or order_id, create, sync, generate label (Sell
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
-from app.models import Shipment, Order, OrderItem, User, ChannelAccount, ShipmentStatus
-from app.auth import get_current_user
+from app.database import get_db, get_async_db
+from app.models import Shipment, Order, OrderItem, User, ShipmentStatus
+from app.auth import TenantScope, get_current_user, get_tenant_scope
 from app.services.shipment_sync import sync_shipments, _get_selloship_credentials
 from app.services.selloship_service import get_selloship_client, build_waybill_payload_from_order
+from app.services.rate_cards import COST_SOURCE_MANUAL, apply_rate_card
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-def _user_channel_account_ids(db: Session, user: User) -> list[str]:
-    return [ca.id for ca in db.query(ChannelAccount).filter(ChannelAccount.user_id == user.id).all()]
-
-
 class ShipmentCreate(BaseModel):
     order_id: str
     awb_number: str
@@ -28,6 +27,9 @@ class ShipmentCreate(BaseModel):
     label_url: str | None = None
     forward_cost: float = 0.0
     reverse_cost: float = 0.0
+    # Rate card inputs when no cost is given (default: zone from pincodes, weight from variants)
+    zone: str | None = None
+    weight_grams: int | None = None
 
 
 class GenerateLabelRequest(BaseModel):
@@ -37,20 +39,20 @@ class GenerateLabelRequest(BaseModel):
 
 @router.get("")
 async def list_shipments(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    scope: TenantScope = Depends(get_tenant_scope),
 ):
     """List shipments for current user's orders."""
-    account_ids = _user_channel_account_ids(db, current_user)
+    account_ids = scope.channel_account_ids
     if not account_ids:
         return {"shipments": []}
     query = (
-        db.query(Shipment)
+        select(Shipment)
         .join(Order, Shipment.order_id == Order.id)
-        .filter(Order.channel_account_id.in_(account_ids))
+        .where(Order.channel_account_id.in_(account_ids))
         .order_by(Shipment.created_at.desc())
     )
-    shipments = query.all()
+    shipments = (await db.execute(query)).scalars().all()
     return {
         "shipments": [
             {
@@ -63,6 +65,8 @@ async def list_shipments(
                 "status": s.status.value if hasattr(s.status, "value") else str(s.status),
                 "forwardCost": float(s.forward_cost or 0),
                 "reverseCost": float(s.reverse_cost or 0),
+                "costSource": s.cost_source,
+                "shippingZone": s.shipping_zone,
                 "shippedAt": s.shipped_at.isoformat() if s.shipped_at else None,
                 "lastSyncedAt": s.last_synced_at.isoformat() if s.last_synced_at else None,
                 "createdAt": s.created_at.isoformat() if s.created_at else None,
@@ -76,10 +80,10 @@ async def list_shipments(
 async def get_shipment_by_order(
     order_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    scope: TenantScope = Depends(get_tenant_scope),
 ):
     """Get shipment for an order. 404 if not found or not user's order."""
-    account_ids = _user_channel_account_ids(db, current_user)
+    account_ids = scope.channel_account_ids
     order = db.query(Order).filter(Order.id == order_id).first()
     if not order or order.channel_account_id not in account_ids:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -101,6 +105,8 @@ def _shipment_response(s: Shipment) -> dict:
             "status": s.status.value if hasattr(s.status, "value") else str(s.status),
             "forwardCost": float(s.forward_cost or 0),
             "reverseCost": float(s.reverse_cost or 0),
+            "costSource": s.cost_source,
+            "shippingZone": s.shipping_zone,
             "shippedAt": s.shipped_at.isoformat() if s.shipped_at else None,
             "lastSyncedAt": s.last_synced_at.isoformat() if s.last_synced_at else None,
             "createdAt": s.created_at.isoformat() if s.created_at else None,
@@ -112,10 +118,10 @@ def _shipment_response(s: Shipment) -> dict:
 async def create_shipment(
     body: ShipmentCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    scope: TenantScope = Depends(get_tenant_scope),
 ):
     """Create a shipment for an order (link AWB). Order must belong to current user."""
-    account_ids = _user_channel_account_ids(db, current_user)
+    account_ids = scope.channel_account_ids
     order = db.query(Order).filter(Order.id == body.order_id).first()
     if not order or order.channel_account_id not in account_ids:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -133,6 +139,10 @@ async def create_shipment(
         reverse_cost=Decimal(str(body.reverse_cost)),
         status=ShipmentStatus.CREATED,
     )
+    if shipment.forward_cost or shipment.reverse_cost:
+        shipment.cost_source = COST_SOURCE_MANUAL
+    else:
+        apply_rate_card(db, shipment, order, scope.user.id, zone=body.zone, weight_grams=body.weight_grams)
     db.add(shipment)
     db.commit()
     db.refresh(shipment)
@@ -145,12 +155,12 @@ async def create_shipment(
 async def generate_label(
     body: GenerateLabelRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    scope: TenantScope = Depends(get_tenant_scope),
 ):
     """Generate shipping label via Selloship (Base.com waybill). Returns waybill and label URL for use in create shipment."""
     if (body.courier_name or "").strip().lower() != "selloship":
         raise HTTPException(status_code=400, detail="Only Selloship is supported for label generation")
-    account_ids = _user_channel_account_ids(db, current_user)
+    account_ids = scope.channel_account_ids
     order = db.query(Order).filter(Order.id == body.order_id).first()
     if not order or order.channel_account_id not in account_ids:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -158,7 +168,7 @@ async def generate_label(
     if existing:
         raise HTTPException(status_code=400, detail="Order already has a shipment")
     items = db.query(OrderItem).filter(OrderItem.order_id == body.order_id).all()
-    api_key, username, password = _get_selloship_credentials(db, str(current_user.id))
+    api_key, username, password = _get_selloship_credentials(db, str(scope.user.id))
     if not api_key and not (username and password):
         raise HTTPException(
             status_code=400,
@@ -196,13 +206,13 @@ async def sync_shipments_endpoint(
 async def get_shipment(
     shipment_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    scope: TenantScope = Depends(get_tenant_scope),
 ):
     """Get shipment by id. 404 if not found or not user's order."""
     shipment = db.query(Shipment).filter(Shipment.id == shipment_id).first()
     if not shipment:
         raise HTTPException(status_code=404, detail="Shipment not found")
-    account_ids = _user_channel_account_ids(db, current_user)
+    account_ids = scope.channel_account_ids
     order = db.query(Order).filter(Order.id == shipment.order_id).first()
     if not order or order.channel_account_id not in account_ids:
         raise HTTPException(status_code=404, detail="Shipment not found")
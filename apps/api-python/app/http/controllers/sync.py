@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import ChannelAccount, User, SyncJob
-from app.auth import get_current_user
+from app.auth import TenantScope, get_current_user, get_tenant_scope
 from app.services.sync_engine import SyncEngine
 
 router = APIRouter()
@@ -13,13 +13,11 @@ router = APIRouter()
 @router.get("/jobs")
 async def list_sync_jobs(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    scope: TenantScope = Depends(get_tenant_scope)
 ):
     """List all sync jobs for the current user"""
     # Get user's channel accounts
-    user_account_ids = [acc.id for acc in db.query(ChannelAccount).filter(
-        ChannelAccount.user_id == current_user.id
-    ).all()]
+    user_account_ids = scope.channel_account_ids
     
     if not user_account_ids:
         return {"jobs": []}
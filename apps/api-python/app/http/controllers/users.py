@@ -7,7 +7,7 @@ from app.database import get_db
 from app.models import User, UserRole
 from app.auth import get_current_user, require_admin
 from app.http.requests import RegisterRequest
-from app.auth import get_password_hash
+from app.auth import get_password_hash_async
 
 router = APIRouter()
 
@@ -50,7 +50,7 @@ async def create_user(
     user = User(
         name=request.name,
         email=request.email.lower().strip(),
-        password_hash=get_password_hash(request.password),
+        password_hash=await get_password_hash_async(request.password),
         role=UserRole.STAFF  # Default to STAFF, admin can change later
     )
     db.add(user)
@@ -85,7 +85,7 @@ async def update_user(
     if "role" in request:
         user.role = UserRole(request["role"])
     if "password" in request and request["password"]:
-        user.password_hash = get_password_hash(request["password"])
+        user.password_hash = await get_password_hash_async(request["password"])
     
     db.commit()
     db.refresh(user)
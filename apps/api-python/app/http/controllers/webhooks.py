@@ -3,13 +3,12 @@ Webhook management routes. Shopify webhook receiver is public (no JWT); HMAC ver
 """
 import json
 import logging
-import uuid
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
 from sqlalchemy.orm import Session
 
 from app.database import get_db
-from app.models import ChannelAccount, User, WebhookEvent, ShopifyIntegration, ProviderCredential
+from app.models import ChannelAccount, User, WebhookEvent, WebhookEventStatus
 from app.auth import get_current_user
 from app.services.shopify import ShopifyService
 from app.services.credentials import decrypt_token
@@ -17,6 +16,9 @@ from app.services.shopify_webhook_handler import (
     verify_webhook_hmac,
     process_shopify_webhook,
 )
+from app.services.courier_push import PUSH_COURIERS, ingest_push, resolve_push_token, verify_push_signature
+from app.services.webhook_queue import enqueue_event, mark_failed, requeue_event
+from app.services.webhook_secrets import get_webhook_secret_candidates
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -140,6 +142,7 @@ async def get_webhook_events(
     limit: int = Query(50, le=100),
     source: Optional[str] = Query(None),
     topic: Optional[str] = Query(None),
+    status_filter: Optional[str] = Query(None, alias="status", description="PENDING, PROCESSING, DONE or DEAD"),
 ):
     """Get persisted webhook events for the current user's connected shops only."""
     user_shops = _get_user_shop_domains(db, str(current_user.id))
@@ -153,6 +156,8 @@ async def get_webhook_events(
         query = query.filter(WebhookEvent.source == source)
     if topic:
         query = query.filter(WebhookEvent.topic == topic)
+    if status_filter:
+        query = query.filter(WebhookEvent.status == status_filter.upper())
     rows = query.limit(limit).all()
     return [
         {
@@ -161,6 +166,9 @@ async def get_webhook_events(
             "shopDomain": r.shop_domain,
             "topic": r.topic,
             "payloadSummary": r.payload_summary,
+            "status": r.status or ("DONE" if r.processed_at else None),
+            "attempts": r.attempts or 0,
+            "nextAttemptAt": r.next_attempt_at.isoformat() if r.next_attempt_at else None,
             "processedAt": r.processed_at.isoformat() if r.processed_at else None,
             "error": r.error,
             "createdAt": r.created_at.isoformat() if r.created_at else None,
@@ -176,7 +184,9 @@ async def get_webhook_events_list(
     limit: int = Query(50, le=100),
 ):
     """Alias: get webhook events list."""
-    return await get_webhook_events(db=db, current_user=current_user, limit=limit)
+    return await get_webhook_events(
+        db=db, current_user=current_user, limit=limit, source=None, topic=None, status_filter=None
+    )
 
 @router.post("/shopify")
 async def shopify_webhook_receive(
@@ -185,7 +195,8 @@ async def shopify_webhook_receive(
 ):
     """
     Public endpoint for Shopify webhooks. No JWT.
-    Verify X-Shopify-Hmac-Sha256, persist event, trigger sync/profit by topic.
+    Verify X-Shopify-Hmac-Sha256, persist event with raw payload, then ack (WEBHOOK_ASYNC_PROCESSING)
+    or trigger sync/profit by topic inline.
     Topics: orders/create, orders/updated, orders/cancelled, refunds/create, inventory_levels/update, products/update.
     """
     raw_body = await request.body()
@@ -196,47 +207,19 @@ async def shopify_webhook_receive(
         logger.warning("Shopify webhook: missing X-Shopify-Shop-Domain")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing shop domain")
 
-    # Collect all possible app secrets (webhook is signed with the app secret used at registration)
-    candidates: list[str] = []
-    integration = db.query(ShopifyIntegration).filter(ShopifyIntegration.shop_domain == shop_domain).first()
-    if integration and getattr(integration, "app_secret_encrypted", None):
-        try:
-            s = (decrypt_token(integration.app_secret_encrypted) or "").strip()
-            if s and s not in candidates:
-                candidates.append(s)
-        except Exception:
-            pass
-    # ProviderCredential (shopify_app) for any user who has this shop connected
-    for acc in db.query(ChannelAccount).filter(
-        ChannelAccount.shop_domain == shop_domain,
-        ChannelAccount.access_token.isnot(None),
-    ).all():
-        pc = db.query(ProviderCredential).filter(
-            ProviderCredential.user_id == acc.user_id,
-            ProviderCredential.provider_id == "shopify_app",
-            ProviderCredential.value_encrypted.isnot(None),
-        ).first()
-        if pc and pc.value_encrypted:
-            try:
-                raw = decrypt_token(pc.value_encrypted)
-                if isinstance(raw, str) and raw.strip().startswith("{"):
-                    data = json.loads(raw)
-                    s = (data.get("apiSecret") or data.get("appSecret") or "").strip()
-                    if s and s not in candidates:
-                        candidates.append(s)
-                elif isinstance(raw, str) and raw.strip() and raw.strip() not in candidates:
-                    candidates.append(raw.strip())
-            except Exception:
-                pass
-    # Env (OAuth flow registers webhooks with SHOPIFY_API_SECRET)
-    env_secret = (getattr(settings, "SHOPIFY_API_SECRET", None) or "").strip()
-    if env_secret and env_secret not in candidates:
-        candidates.append(env_secret)
+    # Candidate app secrets (webhook is signed with the app secret used at registration); cached per shop
+    candidates = get_webhook_secret_candidates(db, shop_domain)
+    verified = any(verify_webhook_hmac(raw_body, hmac_header, s) for s in candidates)
+    if not verified:
+        # Secret may have changed in another worker process since we cached it: reload once
+        fresh = get_webhook_secret_candidates(db, shop_domain, refresh=True)
+        if fresh != candidates:
+            candidates = fresh
+            verified = any(verify_webhook_hmac(raw_body, hmac_header, s) for s in candidates)
 
     if not candidates:
         logger.warning("Shopify webhook: no app secret for shop=%s (set SHOPIFY_API_SECRET or add in Integrations)", shop_domain)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="App secret not found for this shop. Set SHOPIFY_API_SECRET in env or add API Secret in Integrations → Shopify → Configure.")
-    verified = any(verify_webhook_hmac(raw_body, hmac_header, s) for s in candidates)
     if not verified:
         logger.warning("Shopify webhook: HMAC verification failed for shop=%s topic=%s", shop_domain, topic)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid webhook signature")
@@ -254,42 +237,90 @@ async def shopify_webhook_receive(
         if oid is not None:
             summary = f"id={oid}"
 
-    event = WebhookEvent(
-        id=str(uuid.uuid4()),
-        source="shopify",
-        shop_domain=shop_domain,
-        topic=topic,
-        payload_summary=summary,
-    )
-    db.add(event)
-    db.commit()
+    # Durable: raw payload is committed before we ack, so a crash or handler failure can be retried
+    inline = not settings.WEBHOOK_ASYNC_PROCESSING
+    event = enqueue_event(db, "shopify", shop_domain, topic, raw_body, payload_summary=summary, claim=inline)
+    if not inline:
+        return {"ok": True}
 
     try:
         process_shopify_webhook(db, shop_domain, topic, payload, event_id=event.id)
+        event.status = WebhookEventStatus.DONE.value
+        event.next_attempt_at = None
         db.commit()
     except Exception as e:
         logger.exception("Shopify webhook process failed: %s", e)
         try:
+            db.rollback()
             ev = db.query(WebhookEvent).filter(WebhookEvent.id == event.id).first()
             if ev:
-                ev.error = str(e)[:500]
+                mark_failed(db, ev, str(e))
             db.commit()
         except Exception:
             db.rollback()
-        # Return 200 so Shopify does not retry
+        # Return 200 so Shopify does not retry; the queue worker retries from the stored payload
 
     return {"ok": True}
 
 
+def _courier_push_token(request: Request) -> Optional[str]:
+    """Push token from X-Webhook-Token, Authorization (Bearer/Token) or ?token= (couriers differ)."""
+    token = request.headers.get("X-Webhook-Token")
+    if not token:
+        auth = (request.headers.get("Authorization") or "").strip()
+        scheme, _, value = auth.partition(" ")
+        if scheme.lower() in ("bearer", "token") and value:
+            token = value
+    return (token or request.query_params.get("token") or "").strip() or None
+
+
+@router.post("/couriers/{courier}")
+async def courier_status_push(
+    courier: str,
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Public endpoint for courier status pushes (delhivery, selloship). No JWT: the per-user push token
+    (Integrations → push token) identifies the tenant; X-Webhook-Signature is verified when sent.
+    Matching active shipments are updated in one commit and their next poll pushed out.
+    """
+    courier = courier.strip().lower()
+    if courier not in PUSH_COURIERS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown courier")
+    token = _courier_push_token(request)
+    push_token = resolve_push_token(db, courier, token)
+    if not push_token:
+        logger.warning("Courier push: invalid or missing token courier=%s", courier)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid push token")
+    raw_body = await request.body()
+    if not verify_push_signature(raw_body, request.headers.get("X-Webhook-Signature"), token):
+        logger.warning("Courier push: signature verification failed courier=%s user=%s", courier, push_token.user_id)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid webhook signature")
+    try:
+        payload = json.loads(raw_body.decode("utf-8")) if raw_body else {}
+    except Exception as e:
+        logger.warning("Courier push: invalid JSON %s", e)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON")
+
+    try:
+        result = ingest_push(db, push_token, payload)
+    except Exception as e:
+        logger.exception("Courier push process failed courier=%s: %s", courier, e)
+        db.rollback()
+        # Non-2xx so the courier retries; the poller also picks the shipments up on schedule
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to process push")
+    return {"ok": True, **result}
+
+
 @router.post("/events/{event_id}/retry")
 async def retry_webhook_event(
     event_id: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Retry a failed webhook event. Event must belong to one of the current user's shops.
-    Note: Full payload is not stored; retry re-processes only if the handler can re-fetch data.
-    For Shopify, failed events are not re-sent by Shopify; consider re-syncing orders/inventory instead.
+    """Re-queue a webhook event (failed, dead-lettered or done) for processing from its stored payload.
+    Event must belong to one of the current user's shops. Events received before payloads were stored cannot be retried.
     """
     user_shops = _get_user_shop_domains(db, str(current_user.id))
     event = db.query(WebhookEvent).filter(WebhookEvent.id == event_id).first()
@@ -297,11 +328,15 @@ async def retry_webhook_event(
         raise HTTPException(status_code=404, detail="Event not found")
     if event.shop_domain not in user_shops:
         raise HTTPException(status_code=403, detail="Access denied")
-    # We do not store full payload; cannot truly re-run process_shopify_webhook without it
-    raise HTTPException(
-        status_code=501,
-        detail="Retry not supported: event payload is not stored. Re-sync orders or inventory from Integrations if needed.",
-    )
+    if event.payload is None:
+        raise HTTPException(
+            status_code=422,
+            detail="Retry not supported: this event was received before payloads were stored. Re-sync orders or inventory from Integrations if needed.",
+        )
+    if event.status in (WebhookEventStatus.PENDING.value, WebhookEventStatus.PROCESSING.value):
+        return {"ok": True, "id": event.id, "status": event.status}
+    requeue_event(db, event)
+    return {"ok": True, "id": event.id, "status": event.status}
 
 
 @router.get("/subscriptions")
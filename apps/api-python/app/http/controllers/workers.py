@@ -5,8 +5,8 @@ import logging
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import SyncJob, User, ChannelAccount, SyncJobStatus
-from app.auth import get_current_user
+from app.models import SyncJob, SyncJobStatus
+from app.auth import TenantScope, get_tenant_scope
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -15,15 +15,11 @@ router = APIRouter()
 @router.get("")
 async def list_worker_jobs(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    scope: TenantScope = Depends(get_tenant_scope)
 ):
     """List all worker jobs for the current user. Returns [] if none or on error."""
     try:
-        user_account_ids = [
-            acc.id for acc in db.query(ChannelAccount).filter(
-                ChannelAccount.user_id == current_user.id
-            ).all()
-        ]
+        user_account_ids = scope.channel_account_ids
         if not user_account_ids:
             return []
 
@@ -54,13 +50,11 @@ async def control_worker_job(
     job_id: str,
     action: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    scope: TenantScope = Depends(get_tenant_scope)
 ):
     """Control worker job (retry, cancel, etc.)"""
     # Get user's channel accounts
-    user_account_ids = [acc.id for acc in db.query(ChannelAccount).filter(
-        ChannelAccount.user_id == current_user.id
-    ).all()]
+    user_account_ids = scope.channel_account_ids
     
     if not user_account_ids:
         raise HTTPException(
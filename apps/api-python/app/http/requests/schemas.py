@@ -99,6 +99,9 @@ class ShipOrderRequest(BaseModel):
     label_url: Optional[str] = None
     forward_cost: float = 0.0
     reverse_cost: float = 0.0
+    # Rate card inputs when no cost is given (default: zone from pincodes, weight from variants)
+    zone: Optional[str] = None
+    weight_grams: Optional[int] = None
 
 # Inventory Schemas
 class InventoryAdjustRequest(BaseModel):
@@ -2,13 +2,27 @@
 SQLAlchemy models matching the Prisma schema.
 All model and enum definitions live here for simplicity and to avoid circular imports.
 """
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, Date, ForeignKey, Numeric, Enum as SQLEnum, JSON, UniqueConstraint
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, Date, ForeignKey, Numeric, Enum as SQLEnum, JSON, UniqueConstraint, Index, Text
+from sqlalchemy import event, inspect, text
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.sql import func
 from app.database import Base
+from datetime import datetime, timedelta, timezone
 import enum
 import uuid
 
+# Business day boundary (ad spend, CAC, dashboards) is India Standard Time
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+def ist_date(value: datetime | None = None):
+    """IST calendar date for a timestamp (naive values are UTC, as stored); now if None."""
+    if value is None:
+        value = datetime.now(timezone.utc)
+    elif value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(IST).date()
+
 # Enums
 class UserRole(str, enum.Enum):
     ADMIN = "ADMIN"
@@ -81,6 +95,13 @@ class LogLevel(str, enum.Enum):
     INFO = "INFO"
     ERROR = "ERROR"
 
+class WebhookEventStatus(str, enum.Enum):
+    """Stored as plain String on webhook_events.status (no DB enum type)."""
+    PENDING = "PENDING"
+    PROCESSING = "PROCESSING"
+    DONE = "DONE"
+    DEAD = "DEAD"
+
 # Models
 class User(Base):
     __tablename__ = "users"
@@ -116,6 +137,9 @@ class ChannelAccount(Base):
     shop_domain = Column("shop_domain", String, nullable=True)
     access_token = Column("access_token", String, nullable=True)  # Encrypted
     status = Column(SQLEnum(ChannelAccountStatus), default=ChannelAccountStatus.DISCONNECTED)
+    # Incremental Shopify order sync checkpoint: max updated_at processed + rel=next URL of a capped run
+    orders_updated_at_min = Column("orders_updated_at_min", String, nullable=True)
+    orders_page_cursor = Column("orders_page_cursor", String, nullable=True)
     created_at = Column("created_at", DateTime, server_default=func.now())
 
     channel = relationship("Channel", back_populates="accounts")
@@ -213,6 +237,10 @@ class Order(Base):
     status = Column(SQLEnum(OrderStatus), default=OrderStatus.NEW)
     created_at = Column("created_at", DateTime, server_default=func.now())
     updated_at = Column("updated_at", DateTime, server_default=func.now(), onupdate=func.now())
+    # IST calendar day of created_at (set on insert); indexed for per-day CAC and analytics
+    order_date_ist = Column("order_date_ist", Date, nullable=True, index=True)
+    # Lowercased order id / customer / email / AWB / SKUs for search (app/services/order_search.py)
+    search_document = Column("search_document", Text, nullable=True)
 
     channel = relationship("Channel", back_populates="orders")
     channel_account = relationship("ChannelAccount", back_populates="orders")
@@ -226,15 +254,23 @@ class Order(Base):
             "channel_order_id",
             name="orders_channel_account_order_unique",
         ),
+        # Keyset pagination of an account's orders (GET /orders)
+        Index("ix_orders_account_created_id", "channel_account_id", "created_at", "id"),
     )
 
+@event.listens_for(Order, "before_insert")
+def _set_order_date_ist(mapper, connection, target) -> None:
+    if target.order_date_ist is None:
+        target.order_date_ist = ist_date(target.created_at)
+
+
 class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    order_id = Column("order_id", String, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
+    order_id = Column("order_id", String, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False, index=True)
     variant_id = Column("variant_id", String, ForeignKey("product_variants.id", ondelete="SET NULL"), nullable=True)
-    sku = Column(String, nullable=False)
+    sku = Column(String, nullable=False, index=True)
     title = Column(String, nullable=False)
     qty = Column(Integer, nullable=False)
     price = Column("price", Numeric(10, 2), nullable=False)
@@ -249,7 +285,7 @@ class Shipment(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     order_id = Column("order_id", String, ForeignKey("orders.id", ondelete="CASCADE"), unique=True, nullable=False)
     courier_name = Column("courier_name", String, nullable=False)
-    awb_number = Column("awb_number", String, nullable=False)
+    awb_number = Column("awb_number", String, nullable=False, index=True)
     tracking_url = Column("tracking_url", String, nullable=True)
     label_url = Column("label_url", String, nullable=True)
     status = Column(SQLEnum(ShipmentStatus), default=ShipmentStatus.CREATED)
@@ -258,9 +294,60 @@ class Shipment(Base):
     forward_cost = Column("forward_cost", Numeric(12, 2), default=0, nullable=False)
     reverse_cost = Column("reverse_cost", Numeric(12, 2), default=0, nullable=False)
     last_synced_at = Column("last_synced_at", DateTime, nullable=True)
+    # Adaptive tracking schedule (app/services/shipment_schedule.py); NULL next_poll_at = final, never polled
+    next_poll_at = Column("next_poll_at", DateTime, nullable=True)
+    poll_priority = Column("poll_priority", Integer, default=0, nullable=False)
+    status_changed_at = Column("status_changed_at", DateTime, nullable=True)
+    # Shipping cost provenance (app/services/rate_cards.py): manual | rate_card | courier | invoice
+    cost_source = Column("cost_source", String, nullable=True)
+    rate_card_id = Column("rate_card_id", String, ForeignKey("rate_cards.id", ondelete="SET NULL"), nullable=True)
+    shipping_zone = Column("shipping_zone", String, nullable=True)
+    chargeable_weight_grams = Column("chargeable_weight_grams", Integer, nullable=True)
+    cost_reconciled_at = Column("cost_reconciled_at", DateTime, nullable=True)
 
     order = relationship("Order", back_populates="shipment")
 
+    __table_args__ = (
+        Index(
+            "ix_shipments_next_poll_at",
+            "next_poll_at",
+            postgresql_where=text("next_poll_at IS NOT NULL"),
+            sqlite_where=text("next_poll_at IS NOT NULL"),
+        ),
+    )
+
+
+SHIPMENT_FINAL_STATUSES = (ShipmentStatus.DELIVERED, ShipmentStatus.RTO_DONE, ShipmentStatus.LOST)
+
+
+def _naive_utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@event.listens_for(Shipment, "before_insert")
+def _schedule_new_shipment(mapper, connection, target) -> None:
+    now = _naive_utcnow()
+    if target.status_changed_at is None:
+        target.status_changed_at = now
+    if target.status in SHIPMENT_FINAL_STATUSES:
+        target.next_poll_at = None
+    elif target.next_poll_at is None:
+        target.next_poll_at = now
+
+
+@event.listens_for(Shipment, "before_update")
+def _reschedule_on_status_change(mapper, connection, target) -> None:
+    state = inspect(target)
+    if not state.attrs.status.history.has_changes():
+        return
+    now = _naive_utcnow()
+    if not state.attrs.status_changed_at.history.has_changes():
+        target.status_changed_at = now
+    if target.status in SHIPMENT_FINAL_STATUSES:
+        target.next_poll_at = None
+    elif target.next_poll_at is None:
+        target.next_poll_at = now
+
 class SyncJob(Base):
     __tablename__ = "sync_jobs"
 
@@ -361,7 +448,11 @@ class ShopifyInventory(Base):
     available = Column("available", Integer, default=0)
     synced_at = Column("synced_at", DateTime, server_default=func.now(), onupdate=func.now())
 
-    __table_args__ = (UniqueConstraint("shop_domain", "sku", "location_id", name="shopify_inventory_shop_sku_loc_unique"),)
+    __table_args__ = (
+        UniqueConstraint("shop_domain", "sku", "location_id", name="shopify_inventory_shop_sku_loc_unique"),
+        # inventory_levels/update webhooks look up by inventory item
+        Index("ix_shopify_inventory_shop_item", "shop_domain", "inventory_item_id"),
+    )
 
 
 class SkuCost(Base):
@@ -412,6 +503,8 @@ class ShipmentTracking(Base):
     delivery_status = Column("delivery_status", String, nullable=True)
     rto_status = Column("rto_status", String, nullable=True)
     raw_response = Column("raw_response", JSON, nullable=True)
+    # Courier timestamp (naive UTC) of the status last applied; older pushed events are skipped
+    last_event_at = Column("last_event_at", DateTime, nullable=True)
     last_updated_at = Column("last_updated_at", DateTime, server_default=func.now(), onupdate=func.now())
     created_at = Column("created_at", DateTime, server_default=func.now())
 
@@ -432,6 +525,74 @@ class ProviderCredential(Base):
     user = relationship("User")
 
 
+class CourierPushToken(Base):
+    """Per-user secret for courier status push endpoints (only the SHA-256 of the token is stored)."""
+    __tablename__ = "courier_push_tokens"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column("user_id", String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    courier = Column("courier", String, nullable=False)  # delhivery | selloship
+    token_hash = Column("token_hash", String, nullable=False, unique=True)
+    last_push_at = Column("last_push_at", DateTime, nullable=True)
+    created_at = Column("created_at", DateTime, server_default=func.now())
+
+    __table_args__ = (UniqueConstraint("user_id", "courier", name="uq_courier_push_tokens_user_courier"),)
+
+
+class RateCard(Base):
+    """
+    Versioned courier rate card (per user and courier). Immutable once created: a tariff change is a new
+    version with a later effective_from; shipments keep the version they were costed with.
+    zones: {"A": {"slabs": [{"upto_grams": 500, "charge": 30}, ...], "additional_charge": 28}, ...}
+    """
+    __tablename__ = "rate_cards"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column("user_id", String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    courier = Column("courier", String, nullable=False)  # lowercase, matched against shipments.courier_name
+    version = Column("version", Integer, nullable=False)
+    effective_from = Column("effective_from", DateTime, nullable=False)
+    origin_pincode = Column("origin_pincode", String, nullable=True)
+    zones = Column("zones", JSON, nullable=False)
+    additional_slab_grams = Column("additional_slab_grams", Integer, default=500, nullable=False)
+    cod_fixed_fee = Column("cod_fixed_fee", Numeric(12, 2), default=0, nullable=False)
+    cod_percent = Column("cod_percent", Numeric(6, 3), default=0, nullable=False)
+    rto_multiplier = Column("rto_multiplier", Numeric(6, 3), default=1, nullable=False)
+    created_at = Column("created_at", DateTime, server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "courier", "version", name="uq_rate_cards_user_courier_version"),
+        Index("ix_rate_cards_user_courier_effective", "user_id", "courier", "effective_from"),
+    )
+
+
+class CourierInvoiceLine(Base):
+    """One AWB on a courier invoice; applied to the shipment's forward/reverse cost by the reconcile batch."""
+    __tablename__ = "courier_invoice_lines"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column("user_id", String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    courier = Column("courier", String, nullable=False)
+    invoice_number = Column("invoice_number", String, nullable=False)
+    awb_number = Column("awb_number", String, nullable=False, index=True)
+    forward_cost = Column("forward_cost", Numeric(12, 2), nullable=False)
+    reverse_cost = Column("reverse_cost", Numeric(12, 2), nullable=True)
+    shipment_id = Column("shipment_id", String, ForeignKey("shipments.id", ondelete="SET NULL"), nullable=True)
+    # NULL = waiting for the reconcile batch; set with shipment_id NULL when no shipment matched
+    reconciled_at = Column("reconciled_at", DateTime, nullable=True)
+    created_at = Column("created_at", DateTime, server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "courier", "invoice_number", "awb_number", name="uq_courier_invoice_lines_awb"),
+        Index(
+            "ix_courier_invoice_lines_pending",
+            "created_at",
+            postgresql_where=text("reconciled_at IS NULL"),
+            sqlite_where=text("reconciled_at IS NULL"),
+        ),
+    )
+
+
 class AdSpendDaily(Base):
     __tablename__ = "ad_spend_daily"
 
@@ -445,6 +606,50 @@ class AdSpendDaily(Base):
     __table_args__ = (UniqueConstraint("date", "platform", name="uq_ad_spend_daily_date_platform"),)
 
 
+class DailyCac(Base):
+    """Materialized blended CAC per IST day: spend (ad_spend_daily) / non-cancelled orders. See app/services/daily_cac.py."""
+    __tablename__ = "daily_cac"
+
+    date = Column("date", Date, primary_key=True)
+    spend = Column("spend", Numeric(12, 2), default=0, nullable=False)
+    order_count = Column("order_count", Integer, default=0, nullable=False)
+    cac = Column("cac", Numeric(12, 2), default=0, nullable=False)
+    updated_at = Column("updated_at", DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class DailyOrderRollup(Base):
+    """
+    Per (channel account, IST day) order and profit totals for the analytics endpoints.
+    Maintained by app/services/order_rollup.py; rebuild with scripts/backfill_order_rollups.py.
+    """
+    __tablename__ = "daily_order_rollup"
+
+    channel_account_id = Column("channel_account_id", String, ForeignKey("channel_accounts.id", ondelete="CASCADE"), primary_key=True)
+    date = Column("date", Date, primary_key=True, index=True)
+    order_count = Column("order_count", Integer, default=0, nullable=False)
+    revenue = Column("revenue", Numeric(14, 2), default=0, nullable=False)
+    item_count = Column("item_count", Integer, default=0, nullable=False)
+    new_count = Column("new_count", Integer, default=0, nullable=False)
+    confirmed_count = Column("confirmed_count", Integer, default=0, nullable=False)
+    packed_count = Column("packed_count", Integer, default=0, nullable=False)
+    shipped_count = Column("shipped_count", Integer, default=0, nullable=False)
+    delivered_count = Column("delivered_count", Integer, default=0, nullable=False)
+    cancelled_count = Column("cancelled_count", Integer, default=0, nullable=False)
+    returned_count = Column("returned_count", Integer, default=0, nullable=False)
+    hold_count = Column("hold_count", Integer, default=0, nullable=False)
+    # order_profit buckets (orders of this account/day that have a profit row)
+    profit_order_count = Column("profit_order_count", Integer, default=0, nullable=False)
+    profit_revenue = Column("profit_revenue", Numeric(14, 2), default=0, nullable=False)
+    net_profit = Column("net_profit", Numeric(14, 2), default=0, nullable=False)
+    loss_count = Column("loss_count", Integer, default=0, nullable=False)
+    loss_amount = Column("loss_amount", Numeric(14, 2), default=0, nullable=False)
+    rto_count = Column("rto_count", Integer, default=0, nullable=False)
+    rto_amount = Column("rto_amount", Numeric(14, 2), default=0, nullable=False)
+    lost_count = Column("lost_count", Integer, default=0, nullable=False)
+    lost_amount = Column("lost_amount", Numeric(14, 2), default=0, nullable=False)
+    updated_at = Column("updated_at", DateTime, server_default=func.now(), onupdate=func.now())
+
+
 class WebhookEvent(Base):
     __tablename__ = "webhook_events"
 
@@ -453,6 +658,13 @@ class WebhookEvent(Base):
     shop_domain = Column("shop_domain", String, nullable=True, index=True)
     topic = Column("topic", String, nullable=False, index=True)
     payload_summary = Column("payload_summary", String, nullable=True)
+    # Raw body as received (durable queue + retry); status is a WebhookEventStatus value (None = legacy row)
+    payload = Column("payload", Text, nullable=True)
+    status = Column("status", String, nullable=True)
+    attempts = Column("attempts", Integer, default=0, nullable=False)
+    next_attempt_at = Column("next_attempt_at", DateTime, nullable=True)
     processed_at = Column("processed_at", DateTime, nullable=True)
     error = Column("error", String, nullable=True)
-    created_at = Column("created_at", DateTime, server_default=func.now())
+    created_at = Column("created_at", DateTime, server_default=func.now(), index=True)
+
+    __table_args__ = (Index("ix_webhook_events_status_next_attempt", "status", "next_attempt_at"),)
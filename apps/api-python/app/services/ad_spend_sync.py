@@ -2,7 +2,6 @@
 Daily ad spend sync: fetch Meta + Google Ads for a date, upsert ad_spend_daily.
 Used by cron at 00:30 IST to sync yesterday's spend for CAC.
 """
-import json
 import logging
 from datetime import date, datetime, timezone
 from decimal import Decimal
@@ -11,7 +10,7 @@ from typing import Optional
 from sqlalchemy.orm import Session
 
 from app.models import AdSpendDaily, ProviderCredential, User
-from app.services.credentials import decrypt_token
+from app.services.credentials import get_provider_credentials
 from app.services.meta_ads_service import fetch_meta_spend_for_date
 from app.services.google_ads_service import fetch_google_spend_for_date
 
@@ -23,46 +22,26 @@ DEFAULT_USD_TO_INR = Decimal("83")
 
 def _get_meta_credentials(db: Session, user_id: str) -> Optional[dict]:
     """Return { ad_account_id, access_token } for meta_ads or None."""
-    cred = db.query(ProviderCredential).filter(
-        ProviderCredential.user_id == user_id,
-        ProviderCredential.provider_id == "meta_ads",
-    ).first()
-    if not cred or not cred.value_encrypted:
-        return None
-    try:
-        dec = decrypt_token(cred.value_encrypted)
-        data = json.loads(dec) if isinstance(dec, str) and dec.strip().startswith("{") else {}
-        if isinstance(data, dict) and data.get("access_token"):
-            return {
-                "ad_account_id": (data.get("ad_account_id") or data.get("adAccountId") or "").strip(),
-                "access_token": (data.get("access_token") or data.get("accessToken") or "").strip(),
-            }
-    except Exception:
-        pass
+    data = get_provider_credentials(db, user_id, "meta_ads")
+    if data and data.get("access_token"):
+        return {
+            "ad_account_id": (data.get("ad_account_id") or data.get("adAccountId") or "").strip(),
+            "access_token": (data.get("access_token") or data.get("accessToken") or "").strip(),
+        }
     return None
 
 
 def _get_google_credentials(db: Session, user_id: str) -> Optional[dict]:
     """Return { developer_token, client_id, client_secret, refresh_token, customer_id } or None."""
-    cred = db.query(ProviderCredential).filter(
-        ProviderCredential.user_id == user_id,
-        ProviderCredential.provider_id == "google_ads",
-    ).first()
-    if not cred or not cred.value_encrypted:
-        return None
-    try:
-        dec = decrypt_token(cred.value_encrypted)
-        data = json.loads(dec) if isinstance(dec, str) and dec.strip().startswith("{") else {}
-        if isinstance(data, dict) and data.get("refresh_token"):
-            return {
-                "developer_token": (data.get("developer_token") or data.get("developerToken") or "").strip(),
-                "client_id": (data.get("client_id") or data.get("clientId") or "").strip(),
-                "client_secret": (data.get("client_secret") or data.get("clientSecret") or "").strip(),
-                "refresh_token": (data.get("refresh_token") or data.get("refreshToken") or "").strip(),
-                "customer_id": (data.get("customer_id") or data.get("customerId") or "").strip(),
-            }
-    except Exception:
-        pass
+    data = get_provider_credentials(db, user_id, "google_ads")
+    if data and data.get("refresh_token"):
+        return {
+            "developer_token": (data.get("developer_token") or data.get("developerToken") or "").strip(),
+            "client_id": (data.get("client_id") or data.get("clientId") or "").strip(),
+            "client_secret": (data.get("client_secret") or data.get("clientSecret") or "").strip(),
+            "refresh_token": (data.get("refresh_token") or data.get("refreshToken") or "").strip(),
+            "customer_id": (data.get("customer_id") or data.get("customerId") or "").strip(),
+        }
     return None
 
 
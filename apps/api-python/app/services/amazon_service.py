@@ -9,6 +9,8 @@ from typing import Any
 
 import httpx
 
+from app.services.http_client import get_client
+
 logger = logging.getLogger(__name__)
 
 # SP-API base URL (EU region covers India marketplace)
@@ -23,23 +25,22 @@ async def get_lwa_access_token(
     client_id: str,
     client_secret: str,
     refresh_token: str,
-    timeout: float = 15.0,
 ) -> str:
     """Exchange LWA refresh token for access token."""
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        resp = await client.post(
-            LWA_TOKEN_URL,
-            data={
-                "grant_type": "refresh_token",
-                "refresh_token": refresh_token,
-                "client_id": client_id,
-                "client_secret": client_secret,
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        return data["access_token"]
+    client = get_client("amazon")
+    resp = await client.post(
+        LWA_TOKEN_URL,
+        data={
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+            "client_id": client_id,
+            "client_secret": client_secret,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    return data["access_token"]
 
 
 async def get_orders(
@@ -49,7 +50,6 @@ async def get_orders(
     marketplace_id: str = DEFAULT_MARKETPLACE_ID,
     created_after: datetime | None = None,
     max_pages: int = 10,
-    timeout: float = 30.0,
 ) -> list[dict[str, Any]]:
     """
     Fetch orders from Amazon SP-API Orders v0.
@@ -65,41 +65,41 @@ async def get_orders(
     next_token: str | None = None
     page = 0
 
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        while page < max_pages:
-            params: dict[str, Any] = {
-                "CreatedAfter": created_after_str,
-                "MarketplaceIds": marketplace_id,
-                "MaxResultsPerPage": 100,
-            }
-            if next_token:
-                params["NextToken"] = next_token
-
-            url = f"{SP_API_BASE}/orders/v0/orders"
-            headers = {
-                "x-amz-access-token": access_token,
-                "Content-Type": "application/json",
-            }
-
-            try:
-                resp = await client.get(url, params=params, headers=headers)
-                resp.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                logger.warning("Amazon SP-API getOrders error: %s %s", e.response.status_code, e.response.text)
-                raise
-            except Exception as e:
-                logger.exception("Amazon get_orders request failed: %s", e)
-                raise
-
-            data = resp.json()
-            payload = data.get("payload") or {}
-            orders = payload.get("Orders") or []
-            all_orders.extend(orders)
-
-            next_token = payload.get("NextToken")
-            if not next_token or not orders:
-                break
-            page += 1
+    client = get_client("amazon")
+    while page < max_pages:
+        params: dict[str, Any] = {
+            "CreatedAfter": created_after_str,
+            "MarketplaceIds": marketplace_id,
+            "MaxResultsPerPage": 100,
+        }
+        if next_token:
+            params["NextToken"] = next_token
+
+        url = f"{SP_API_BASE}/orders/v0/orders"
+        headers = {
+            "x-amz-access-token": access_token,
+            "Content-Type": "application/json",
+        }
+
+        try:
+            resp = await client.get(url, params=params, headers=headers)
+            resp.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            logger.warning("Amazon SP-API getOrders error: %s %s", e.response.status_code, e.response.text)
+            raise
+        except Exception as e:
+            logger.exception("Amazon get_orders request failed: %s", e)
+            raise
+
+        data = resp.json()
+        payload = data.get("payload") or {}
+        orders = payload.get("Orders") or []
+        all_orders.extend(orders)
+
+        next_token = payload.get("NextToken")
+        if not next_token or not orders:
+            break
+        page += 1
 
     return all_orders
 
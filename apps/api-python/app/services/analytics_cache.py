@@ -0,0 +1,181 @@
+"""
+Per-user analytics response cache for the polled dashboard endpoints.
+Entries are keyed by (user_id, endpoint, params) and tagged with the user's data version. A version is
+bumped after any commit that touches the user's channel accounts or their orders, order_items,
+shipments or order_profit (Session hooks), so an entry is never served across a write in this process.
+Fresh for ANALYTICS_CACHE_TTL_SEC; for ANALYTICS_CACHE_STALE_SEC more the stale value is returned while
+one background task recomputes it. Concurrent misses for the same key share a single computation.
+The cache and versions are per process; with several workers the TTL bounds cross-process staleness.
+"""
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import ChannelAccount, Order, OrderItem, OrderProfit, Shipment
+
+logger = logging.getLogger(__name__)
+
+_INFO_KEY = "analytics_cache_users"
+MAX_ENTRIES = 2000
+RESOLVE_CHUNK = 500
+
+CacheKey = tuple[str, str, Hashable]
+
+
+@dataclass
+class _Entry:
+    value: Any
+    version: int
+    computed_at: float
+
+
+_versions: dict[str, int] = {}
+_versions_lock = threading.Lock()
+_entries: dict[CacheKey, _Entry] = {}
+_inflight: dict[CacheKey, asyncio.Task] = {}
+
+
+def get_version(user_id: str) -> int:
+    with _versions_lock:
+        return _versions.get(user_id, 0)
+
+
+def bump_versions(user_ids: Iterable[str]) -> None:
+    """Invalidate cached analytics for these users (thread-safe; called after commit)."""
+    with _versions_lock:
+        for user_id in user_ids:
+            if user_id:
+                _versions[user_id] = _versions.get(user_id, 0) + 1
+
+
+def _prune(now: float) -> None:
+    max_age = settings.ANALYTICS_CACHE_TTL_SEC + settings.ANALYTICS_CACHE_STALE_SEC
+    for key in [k for k, e in _entries.items() if now - e.computed_at > max_age]:
+        _entries.pop(key, None)
+    if len(_entries) > MAX_ENTRIES:
+        for key, _ in sorted(_entries.items(), key=lambda kv: kv[1].computed_at)[: len(_entries) - MAX_ENTRIES]:
+            _entries.pop(key, None)
+
+
+def _start(key: CacheKey, compute: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+    task = _inflight.get(key)
+    if task is not None:
+        return task
+    version = get_version(key[0])
+
+    async def _run() -> Any:
+        try:
+            value = await compute()
+            # A write during the computation may not be reflected: tag with the version seen at start
+            _entries[key] = _Entry(value, version, time.monotonic())
+            if len(_entries) > MAX_ENTRIES:
+                _prune(time.monotonic())
+            return value
+        finally:
+            _inflight.pop(key, None)
+
+    task = asyncio.create_task(_run())
+    _inflight[key] = task
+    return task
+
+
+def _log_refresh_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Analytics cache background refresh failed: %s", task.exception())
+
+
+async def get_or_compute(
+    user_id: str,
+    endpoint: str,
+    params: Hashable,
+    compute: Callable[[], Awaitable[Any]],
+) -> Any:
+    """
+    Cached result of compute() for (user_id, endpoint, params). compute must not depend on the
+    request's DB session (it may outlive the request when revalidating in the background).
+    """
+    ttl = settings.ANALYTICS_CACHE_TTL_SEC
+    if ttl <= 0:
+        return await compute()
+    key: CacheKey = (user_id, endpoint, params)
+    entry = _entries.get(key)
+    if entry is not None and entry.version == get_version(user_id):
+        age = time.monotonic() - entry.computed_at
+        if age < ttl:
+            return entry.value
+        if age < ttl + settings.ANALYTICS_CACHE_STALE_SEC:
+            if key not in _inflight:
+                _start(key, compute).add_done_callback(_log_refresh_failure)
+            return entry.value
+    # shield: a cancelled (disconnected) caller does not cancel the computation others wait on
+    return await asyncio.shield(_start(key, compute))
+
+
+def _user_ids_for(conn, account_ids: set[str], order_ids: set[str]) -> set[str]:
+    user_ids: set[str] = set()
+    ids = list(order_ids)
+    for i in range(0, len(ids), RESOLVE_CHUNK):
+        account_ids.update(
+            a for (a,) in conn.execute(
+                select(Order.channel_account_id).where(Order.id.in_(ids[i:i + RESOLVE_CHUNK])).distinct()
+            )
+        )
+    account_ids.discard(None)
+    if account_ids:
+        user_ids.update(
+            u for (u,) in conn.execute(select(ChannelAccount.user_id).where(ChannelAccount.id.in_(account_ids)))
+        )
+    return user_ids
+
+
+def note_orders_changed(db: Session, order_ids: Iterable[str]) -> None:
+    """Bump the owners' versions when this session commits (for bulk/Core writes the hooks do not see)."""
+    users = _user_ids_for(db.connection(), set(), {oid for oid in order_ids if oid})
+    if users:
+        db.info.setdefault(_INFO_KEY, set()).update(users)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session: Session, flush_context) -> None:
+    account_ids: set[str] = set()
+    order_ids: set[str] = set()
+    users_direct: set[str] = set()
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if isinstance(obj, Order):
+            if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+                continue
+            account_ids.add(obj.channel_account_id)
+        elif isinstance(obj, ChannelAccount):
+            # connect/disconnect changes the account list and connected count
+            users_direct.add(obj.user_id)
+        elif isinstance(obj, (OrderItem, OrderProfit, Shipment)):
+            if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+                continue
+            order_ids.add(obj.order_id)
+    account_ids.discard(None)
+    order_ids.discard(None)
+    users = set(users_direct)
+    users.discard(None)
+    if account_ids or order_ids:
+        users |= _user_ids_for(session.connection(), account_ids, order_ids)
+    if users:
+        session.info.setdefault(_INFO_KEY, set()).update(users)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(session: Session) -> None:
+    users = session.info.pop(_INFO_KEY, None)
+    if users:
+        bump_versions(users)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session) -> None:
+    session.info.pop(_INFO_KEY, None)
@@ -0,0 +1,94 @@
+"""
+Courier status push ingestion (POST /api/webhooks/couriers/{courier}). Delhivery scan pushes and
+Selloship status callbacks update shipments as events happen instead of waiting for the poller.
+Each tenant gets one secret per courier (Integrations → Delhivery/Selloship → push token); only its
+SHA-256 is stored, so the token identifies the tenant and is shown once. When the courier also signs
+the body (X-Webhook-Signature, HMAC-SHA256 keyed with the token) the signature is checked too.
+Tenants with live pushes are still polled, at COURIER_PUSH_POLL_INTERVAL_SEC, as a safety net.
+"""
+import base64
+import hashlib
+import hmac
+import secrets
+from datetime import timedelta
+from typing import Any, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import CourierPushToken
+from app.services.delhivery_service import parse_push_payload as parse_delhivery_push
+from app.services.selloship_service import parse_push_payload as parse_selloship_push
+from app.services.shipment_schedule import utcnow
+from app.services.shipment_sync import apply_courier_updates
+
+PUSH_COURIERS = {
+    "delhivery": parse_delhivery_push,
+    "selloship": parse_selloship_push,
+}
+# Large bodies are applied (and committed) in chunks of this many entries
+PUSH_CHUNK_SIZE = 500
+# last_push_at is only rewritten when older than this (no extra write per push on busy tenants)
+_LAST_PUSH_RESOLUTION = timedelta(minutes=5)
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def issue_push_token(db: Session, user_id: str, courier: str) -> str:
+    """Create or rotate the user's push token for this courier; returns the plain token (not stored). Caller commits."""
+    token = secrets.token_urlsafe(32)
+    row = (
+        db.query(CourierPushToken)
+        .filter(CourierPushToken.user_id == user_id, CourierPushToken.courier == courier)
+        .first()
+    )
+    if row:
+        row.token_hash = hash_token(token)
+        row.last_push_at = None
+    else:
+        db.add(CourierPushToken(user_id=user_id, courier=courier, token_hash=hash_token(token)))
+    return token
+
+
+def resolve_push_token(db: Session, courier: str, token: Optional[str]) -> Optional[CourierPushToken]:
+    if not token:
+        return None
+    return (
+        db.query(CourierPushToken)
+        .filter(CourierPushToken.token_hash == hash_token(token.strip()), CourierPushToken.courier == courier)
+        .first()
+    )
+
+
+def verify_push_signature(raw_body: bytes, signature: Optional[str], token: str) -> bool:
+    """HMAC-SHA256(body, token) as hex or base64; an absent signature is accepted (token-only couriers)."""
+    if not signature:
+        return True
+    digest = hmac.new(token.encode("utf-8"), raw_body, hashlib.sha256).digest()
+    sig = signature.strip()
+    if sig.lower().startswith("sha256="):
+        sig = sig[7:]
+    return hmac.compare_digest(sig.lower(), digest.hex()) or hmac.compare_digest(
+        sig, base64.b64encode(digest).decode("ascii")
+    )
+
+
+def ingest_push(db: Session, push_token: CourierPushToken, payload: Any) -> dict:
+    """
+    Parse the courier's body and apply all of it to the tenant's shipments, committing per PUSH_CHUNK_SIZE
+    entries (a later chunk's older events are skipped against the timestamps the earlier ones stored).
+    Returns counts.
+    """
+    user_id, courier = push_token.user_id, push_token.courier
+    results = PUSH_COURIERS[courier](payload)
+    now = utcnow()
+    if push_token.last_push_at is None or now - push_token.last_push_at > _LAST_PUSH_RESOLUTION:
+        push_token.last_push_at = now
+    totals = {"received": len(results), "updated": 0, "stale": 0, "unmatched": 0}
+    for i in range(0, max(len(results), 1), PUSH_CHUNK_SIZE):
+        outcome = apply_courier_updates(db, user_id, courier, results[i:i + PUSH_CHUNK_SIZE])
+        totals["updated"] += outcome["updated"]
+        totals["stale"] += outcome["stale"]
+        totals["unmatched"] += len(outcome["unmatched"])
+    return totals
@@ -1,9 +1,15 @@
 """
 Credential encryption/decryption and provider credential access.
+The Fernet instance is built once per key. Decrypted provider credentials are cached per
+(user, provider) for PROVIDER_CREDENTIALS_CACHE_TTL_SEC; controllers that save credentials call
+invalidate_provider_credentials. Per process: other workers pick up a new key within the TTL.
 """
 import json
 import base64
-from typing import Any
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Optional
 
 from cryptography.fernet import Fernet
 from sqlalchemy.orm import Session
@@ -18,23 +24,33 @@ def get_encryption_key() -> bytes:
     key_bytes = key_str.encode()[:32].ljust(32, b'0')
     return base64.urlsafe_b64encode(key_bytes)
 
+@lru_cache(maxsize=1)
+def _fernet() -> Fernet:
+    return Fernet(get_encryption_key())
+
 def encrypt_token(token: str) -> str:
     """Encrypt a token"""
-    key = get_encryption_key()
-    f = Fernet(key)
+    f = _fernet()
     encrypted = f.encrypt(token.encode())
     return encrypted.decode()
 
 def decrypt_token(encrypted: str) -> str:
     """Decrypt a token"""
-    key = get_encryption_key()
-    f = Fernet(key)
+    f = _fernet()
     decrypted = f.decrypt(encrypted.encode())
     return decrypted.decode()
 
+@lru_cache(maxsize=1024)
+def decrypt_token_cached(encrypted: str) -> str:
+    """decrypt_token memoized by ciphertext (a re-saved token has new ciphertext, so never stale)"""
+    return decrypt_token(encrypted)
 
-def get_provider_credentials(db: Session, user_id: str, provider_id: str) -> dict[str, Any] | None:
-    """Return decrypted provider credentials dict for the given user and provider, or None."""
+
+_cache: dict[tuple[str, str], tuple[float, Optional[dict[str, Any]]]] = {}
+_lock = threading.Lock()
+
+
+def _load_provider_credentials(db: Session, user_id: str, provider_id: str) -> dict[str, Any] | None:
     cred = (
         db.query(ProviderCredential)
         .filter(
@@ -52,3 +68,32 @@ def get_provider_credentials(db: Session, user_id: str, provider_id: str) -> dic
         return {"apiKey": dec}
     except Exception:
         return None
+
+
+def get_provider_credentials(db: Session, user_id: str, provider_id: str) -> dict[str, Any] | None:
+    """Return decrypted provider credentials dict for the given user and provider, or None (cached)."""
+    ttl = settings.PROVIDER_CREDENTIALS_CACHE_TTL_SEC
+    key = (str(user_id), provider_id)
+    now = time.monotonic()
+    if ttl > 0:
+        with _lock:
+            hit = _cache.get(key)
+        if hit and hit[0] > now:
+            return dict(hit[1]) if hit[1] is not None else None
+    data = _load_provider_credentials(db, user_id, provider_id)
+    if not isinstance(data, dict):
+        data = None
+    if ttl > 0:
+        with _lock:
+            _cache[key] = (now + ttl, data)
+    return dict(data) if data is not None else None
+
+
+def invalidate_provider_credentials(user_id: Optional[str] = None, provider_id: Optional[str] = None) -> None:
+    """Drop cached credentials for a user (optionally one provider), or for everyone."""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+            return
+        for key in [k for k in _cache if k[0] == str(user_id) and (provider_id is None or k[1] == provider_id)]:
+            _cache.pop(key, None)
@@ -0,0 +1,193 @@
+"""
+Materialized daily CAC (daily_cac): per IST day, ad spend, non-cancelled order count and blended CAC.
+Kept current by Session hooks: a flush that inserts/deletes orders or moves an order to/from CANCELLED
+records a +1/-1 order-count delta for its IST day, and ad_spend_daily writes mark the day's spend stale.
+After commit the deltas are applied as `order_count = order_count + delta` in a short transaction of
+their own (commutative, so concurrent importers cannot overwrite each other, and no daily_cac row lock
+is held by the writer's transaction). Days are materialized on first read (get_daily_cac_map).
+Profit computation reads one row per day instead of scanning orders.
+"""
+import logging
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+from typing import Iterable
+
+from sqlalchemy import case, event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app.models import AdSpendDaily, DailyCac, Order, OrderStatus, ist_date
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "daily_cac_changes"
+
+
+def _cac(spend: Decimal, order_count: int) -> Decimal:
+    if order_count <= 0:
+        return Decimal("0")
+    return (spend / order_count).quantize(Decimal("0.01"))
+
+
+def _insert_stmt(dialect_name: str, rows: list[dict], overwrite: bool):
+    """INSERT ... ON CONFLICT (date) DO UPDATE (overwrite) or DO NOTHING for Postgres/SQLite."""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(DailyCac).values(rows)
+    if not overwrite:
+        return stmt.on_conflict_do_nothing(index_elements=[DailyCac.date])
+    return stmt.on_conflict_do_update(
+        index_elements=[DailyCac.date],
+        set_={
+            "spend": stmt.excluded.spend,
+            "order_count": stmt.excluded.order_count,
+            "cac": stmt.excluded.cac,
+            "updated_at": func.now(),
+        },
+    )
+
+
+def _spend_by_day(conn, days: set[date]) -> dict:
+    return dict(
+        conn.execute(
+            select(AdSpendDaily.date, func.coalesce(func.sum(AdSpendDaily.spend), 0))
+            .where(AdSpendDaily.date.in_(days))
+            .group_by(AdSpendDaily.date)
+        ).all()
+    )
+
+
+def _recount(conn, days: set[date]) -> list[dict]:
+    spend_by_day = _spend_by_day(conn, days)
+    count_by_day = dict(
+        conn.execute(
+            select(Order.order_date_ist, func.count(Order.id))
+            .where(Order.order_date_ist.in_(days), Order.status != OrderStatus.CANCELLED)
+            .group_by(Order.order_date_ist)
+        ).all()
+    )
+    rows = []
+    for d in days:
+        spend = Decimal(str(spend_by_day.get(d) or 0))
+        n = int(count_by_day.get(d) or 0)
+        rows.append({"date": d, "spend": spend, "order_count": n, "cac": _cac(spend, n)})
+    return rows
+
+
+def refresh_daily_cac(db_or_conn, days: Iterable[date], overwrite: bool = True) -> list[dict]:
+    """
+    Recount daily_cac rows for days from ad_spend_daily and committed orders and upsert them.
+    overwrite=False only fills missing rows (a concurrent writer's newer row wins). Returns the recounted rows.
+    """
+    days = {d for d in days if d is not None}
+    if not days:
+        return []
+    conn = db_or_conn.connection() if isinstance(db_or_conn, Session) else db_or_conn
+    rows = _recount(conn, days)
+    conn.execute(_insert_stmt(conn.dialect.name, rows, overwrite))
+    return rows
+
+
+def get_daily_cac_map(db: Session, days: Iterable[date]) -> dict[date, Decimal]:
+    """CAC per day from daily_cac; days without a row are materialized on the fly."""
+    days = {d for d in days if d is not None}
+    if not days:
+        return {}
+    result = {d: Decimal(str(cac or 0)) for d, cac in db.query(DailyCac.date, DailyCac.cac).filter(DailyCac.date.in_(days))}
+    missing = days - result.keys()
+    if missing:
+        for row in refresh_daily_cac(db, missing, overwrite=False):
+            result[row["date"]] = row["cac"]
+    return result
+
+
+def _cac_expr(spend, order_count):
+    return case((order_count > 0, func.round(spend / order_count, 2)), else_=0)
+
+
+def _apply_changes(conn, deltas: Counter, spend_days: set[date], recount_days: set[date]) -> None:
+    """Apply order-count deltas / spend refreshes to existing rows (missing rows are materialized on read)."""
+    if recount_days:
+        refresh_daily_cac(conn, recount_days)
+    for d, delta in deltas.items():
+        if not delta or d in recount_days:
+            continue
+        new_count = DailyCac.order_count + delta
+        conn.execute(
+            update(DailyCac)
+            .where(DailyCac.date == d)
+            .values(order_count=new_count, cac=_cac_expr(DailyCac.spend, new_count), updated_at=func.now())
+        )
+    spend_days = spend_days - recount_days
+    if spend_days:
+        spend_by_day = _spend_by_day(conn, spend_days)
+        for d in spend_days:
+            spend = Decimal(str(spend_by_day.get(d) or 0))
+            conn.execute(
+                update(DailyCac)
+                .where(DailyCac.date == d)
+                .values(spend=spend, cac=_cac_expr(spend, DailyCac.order_count), updated_at=func.now())
+            )
+
+
+def _order_day(order: Order):
+    # before_flush runs ahead of the before_insert hook that sets order_date_ist on new orders
+    return order.order_date_ist or ist_date(order.created_at)
+
+
+def _counts(status) -> int:
+    return 0 if status == OrderStatus.CANCELLED else 1
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_daily_cac_changes(session: Session, flush_context, instances) -> None:
+    changes = session.info.setdefault(_PENDING_KEY, {"deltas": Counter(), "spend": set(), "recount": set()})
+    for obj in session.new:
+        if isinstance(obj, Order):
+            changes["deltas"][_order_day(obj)] += _counts(obj.status or OrderStatus.NEW)
+        elif isinstance(obj, AdSpendDaily):
+            changes["spend"].add(obj.date)
+    for obj in session.deleted:
+        if isinstance(obj, Order):
+            changes["deltas"][_order_day(obj)] -= _counts(obj.status)
+        elif isinstance(obj, AdSpendDaily):
+            changes["spend"].add(obj.date)
+    for obj in session.dirty:
+        if isinstance(obj, Order):
+            hist = inspect(obj).attrs.status.history
+            if not hist.has_changes():
+                continue
+            if not hist.deleted:
+                # Previous status not loaded: the delta is unknown, recount the day after commit
+                changes["recount"].add(_order_day(obj))
+                continue
+            delta = _counts(obj.status) - _counts(hist.deleted[0])
+            if delta:
+                changes["deltas"][_order_day(obj)] += delta
+        elif isinstance(obj, AdSpendDaily) and inspect(obj).attrs.spend.history.has_changes():
+            changes["spend"].add(obj.date)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_daily_cac_changes(session: Session) -> None:
+    changes = session.info.pop(_PENDING_KEY, None)
+    if not changes:
+        return
+    deltas = Counter({d: n for d, n in changes["deltas"].items() if d is not None and n})
+    spend_days = {d for d in changes["spend"] if d is not None}
+    recount_days = {d for d in changes["recount"] if d is not None}
+    if not (deltas or spend_days or recount_days):
+        return
+    try:
+        # Own short transaction on committed data; never fails the caller (rows are re-materialized on a miss)
+        with session.get_bind().begin() as conn:
+            _apply_changes(conn, deltas, spend_days, recount_days)
+    except Exception as e:
+        logger.warning("daily_cac update for %s day(s) failed: %s", len(deltas) + len(spend_days) + len(recount_days), e)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
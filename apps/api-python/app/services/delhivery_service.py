@@ -1,9 +1,10 @@
 """
-Delhivery tracking: GET /api/v1/packages/json/?waybill=XXXX
+Delhivery tracking: GET /api/v1/packages/json/?waybill=XXXX (or comma-separated waybills, see get_tracking_batch)
 Authorization: Token <API_KEY>
 Maps raw status to internal: DELIVERED, RTO_DONE, RTO_INITIATED, IN_TRANSIT, LOST.
 Persists to shipment_tracking when db is provided.
 """
+import asyncio
 import logging
 from datetime import datetime, timezone
 from typing import Any, Optional
@@ -13,6 +14,7 @@ import httpx
 from app.config import settings
 from app.services.http_client import get_with_retry
 from app.models import ShipmentStatus
+from app.services.shipment_schedule import parse_courier_time
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +49,66 @@ def map_delhivery_status(raw_status: Optional[str]) -> ShipmentStatus:
     return DELHIVERY_TO_INTERNAL.get(normalized, ShipmentStatus.IN_TRANSIT)
 
 
+def _error_result(waybill: str, error: str) -> dict:
+    return {
+        "waybill": waybill,
+        "status": ShipmentStatus.CREATED.value,
+        "raw_status": None,
+        "delivery_status": None,
+        "rto_status": None,
+        "scan": [],
+        "error": error,
+    }
+
+
+def _shipment_block(entry: Any) -> dict:
+    entry = entry if isinstance(entry, dict) else {}
+    return entry.get("Shipment") or entry.get("shipment") or entry
+
+
+def _parse_shipment(waybill: str, shipment: dict, raw_response: dict) -> dict:
+    """Normalize one ShipmentData[].Shipment block."""
+    status_block = shipment.get("Status") or shipment.get("status") or {}
+    raw_status = status_block.get("Status") or status_block.get("status") or shipment.get("Status") or ""
+    if isinstance(raw_status, dict):
+        raw_status = raw_status.get("Status") or raw_status.get("status") or ""
+    scans = shipment.get("Scans") or shipment.get("scans") or []
+    delivery_status = shipment.get("Delivery") or shipment.get("delivery")
+    rto_status = shipment.get("RTO") or shipment.get("rto")
+    internal = map_delhivery_status(str(raw_status))
+    return {
+        "waybill": waybill,
+        "status": internal.value,
+        "raw_status": str(raw_status),
+        "event_at": parse_courier_time(status_block.get("StatusDateTime") or status_block.get("statusDateTime")),
+        "delivery_status": str(delivery_status) if delivery_status is not None else None,
+        "rto_status": str(rto_status) if rto_status is not None else None,
+        "scan": scans if isinstance(scans, list) else [],
+        "error": None,
+        "raw_response": raw_response,
+    }
+
+
+def parse_push_payload(payload: Any) -> list[dict]:
+    """
+    Scan push body -> normalized results (get_tracking shape). Accepts {"Shipment": {...}},
+    {"ShipmentData": [...]} or a list of either.
+    """
+    entries: list = []
+    for item in payload if isinstance(payload, list) else [payload]:
+        if not isinstance(item, dict):
+            continue
+        shipment_data = item.get("ShipmentData") or item.get("shipmentData")
+        entries.extend(shipment_data if isinstance(shipment_data, list) else [item])
+    results = []
+    for entry in entries:
+        shipment = _shipment_block(entry)
+        awb = str(shipment.get("AWB") or shipment.get("awb") or shipment.get("Waybill") or "").strip()
+        if awb:
+            results.append(_parse_shipment(awb, shipment, {"ShipmentData": [entry]}))
+    return results
+
+
 def get_client(api_key: Optional[str] = None) -> "DelhiveryClient":
     """Return a client instance. Api key from env if not passed."""
     key = api_key or getattr(settings, "DELHIVERY_API_KEY", None) or ""
@@ -72,77 +134,96 @@ class DelhiveryClient:
         """
         if not self.api_key:
             logger.warning("Delhivery API key not set; returning stub")
-            return {
-                "waybill": waybill,
-                "status": ShipmentStatus.CREATED.value,
-                "raw_status": "not_configured",
-                "delivery_status": None,
-                "rto_status": None,
-                "scan": [],
-                "error": "DELHIVERY_API_KEY not set",
-            }
+            return {**_error_result(waybill, "DELHIVERY_API_KEY not set"), "raw_status": "not_configured"}
         url = f"{self.base_url}/api/v1/packages/json/"
         params = {"waybill": waybill}
         headers = {"Authorization": f"Token {self.api_key}"}
         try:
-            resp = await get_with_retry(url, params=params, headers=headers, timeout=15.0, max_retries=2)
+            resp = await get_with_retry(url, params=params, headers=headers, max_retries=2, provider="delhivery")
             resp.raise_for_status()
             data = resp.json()
         except httpx.HTTPStatusError as e:
             logger.warning("Delhivery API HTTP error waybill=%s status=%s", waybill, e.response.status_code)
-            return {
-                "waybill": waybill,
-                "status": ShipmentStatus.CREATED.value,
-                "raw_status": None,
-                "delivery_status": None,
-                "rto_status": None,
-                "scan": [],
-                "error": f"HTTP {e.response.status_code}",
-            }
+            return _error_result(waybill, f"HTTP {e.response.status_code}")
         except Exception as e:
             logger.warning("Delhivery API error waybill=%s: %s", waybill, e)
-            return {
-                "waybill": waybill,
-                "status": ShipmentStatus.CREATED.value,
-                "raw_status": None,
-                "delivery_status": None,
-                "rto_status": None,
-                "scan": [],
-                "error": str(e),
-            }
+            return _error_result(waybill, str(e))
 
         # Response shape: often { "ShipmentData": [ { "Shipment": { "AWB": "...", "Status": { "Status": "Delivered", ... }, "Scans": [...] } } ] }
         shipment_data = data.get("ShipmentData") or data.get("shipmentData") or []
         if not shipment_data:
-            return {
-                "waybill": waybill,
-                "status": ShipmentStatus.CREATED.value,
-                "raw_status": None,
-                "delivery_status": None,
-                "rto_status": None,
-                "scan": [],
-                "error": "No ShipmentData in response",
-            }
-        first = shipment_data[0] if isinstance(shipment_data[0], dict) else {}
-        shipment = first.get("Shipment") or first.get("shipment") or first
-        status_block = shipment.get("Status") or shipment.get("status") or {}
-        raw_status = status_block.get("Status") or status_block.get("status") or shipment.get("Status") or ""
-        if isinstance(raw_status, dict):
-            raw_status = raw_status.get("Status") or raw_status.get("status") or ""
-        scans = shipment.get("Scans") or shipment.get("scans") or []
-        delivery_status = shipment.get("Delivery") or shipment.get("delivery")
-        rto_status = shipment.get("RTO") or shipment.get("rto")
-        internal = map_delhivery_status(str(raw_status))
-        return {
-            "waybill": waybill,
-            "status": internal.value,
-            "raw_status": str(raw_status),
-            "delivery_status": str(delivery_status) if delivery_status is not None else None,
-            "rto_status": str(rto_status) if rto_status is not None else None,
-            "scan": scans if isinstance(scans, list) else [],
-            "error": None,
-            "raw_response": data,
-        }
+            return _error_result(waybill, "No ShipmentData in response")
+        return _parse_shipment(waybill, _shipment_block(shipment_data[0]), data)
+
+    async def get_tracking_batch(
+        self,
+        waybills: list[str],
+        chunk_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+    ) -> dict[str, dict]:
+        """
+        Fetch tracking for many waybills: comma-separated GETs of up to chunk_size
+        (DELHIVERY_TRACKING_BATCH_SIZE) AWBs, at most concurrency (DELHIVERY_TRACKING_CONCURRENCY) in flight.
+        Returns {waybill: get_tracking-shaped dict}; every requested waybill gets an entry, with "error"
+        set when that AWB failed. A chunk rejected with 400/404 (e.g. one malformed AWB) is retried one
+        AWB at a time so a bad waybill does not fail its neighbours.
+        """
+        unique = list(dict.fromkeys(w.strip() for w in waybills if w and w.strip()))
+        if not unique:
+            return {}
+        if not self.api_key:
+            logger.warning("Delhivery API key not set; returning stub")
+            return {w: {**_error_result(w, "DELHIVERY_API_KEY not set"), "raw_status": "not_configured"} for w in unique}
+        size = max(1, chunk_size or settings.DELHIVERY_TRACKING_BATCH_SIZE)
+        semaphore = asyncio.Semaphore(max(1, concurrency or settings.DELHIVERY_TRACKING_CONCURRENCY))
+        results: dict[str, dict] = {}
+
+        async def _run(chunk: list[str]) -> None:
+            async with semaphore:
+                results.update(await self._fetch_chunk(chunk))
+
+        await asyncio.gather(*(_run(unique[i:i + size]) for i in range(0, len(unique), size)))
+        return results
+
+    async def _fetch_chunk(self, chunk: list[str]) -> dict[str, dict]:
+        url = f"{self.base_url}/api/v1/packages/json/"
+        headers = {"Authorization": f"Token {self.api_key}"}
+        try:
+            resp = await get_with_retry(
+                url, params={"waybill": ",".join(chunk)}, headers=headers, timeout=30.0, max_retries=2, provider="delhivery"
+            )
+            resp.raise_for_status()
+            data = resp.json()
+        except httpx.HTTPStatusError as e:
+            code = e.response.status_code
+            if code in (400, 404) and len(chunk) > 1:
+                logger.warning("Delhivery batch of %s rejected (HTTP %s); retrying per AWB", len(chunk), code)
+                return {w: await self.get_tracking(w) for w in chunk}
+            logger.warning("Delhivery batch HTTP error (%s AWBs) status=%s", len(chunk), code)
+            return {w: _error_result(w, f"HTTP {code}") for w in chunk}
+        except Exception as e:
+            logger.warning("Delhivery batch error (%s AWBs): %s", len(chunk), e)
+            return {w: _error_result(w, str(e)) for w in chunk}
+
+        shipment_data = (data.get("ShipmentData") or data.get("shipmentData") or []) if isinstance(data, dict) else []
+        wanted = {w.upper(): w for w in chunk}
+        out: dict[str, dict] = {}
+        for entry in shipment_data:
+            shipment = _shipment_block(entry)
+            awb = str(shipment.get("AWB") or shipment.get("awb") or shipment.get("Waybill") or "").strip()
+            waybill = wanted.get(awb.upper())
+            if waybill is None:
+                if len(chunk) != 1:
+                    continue
+                waybill = chunk[0]
+            try:
+                out[waybill] = _parse_shipment(waybill, shipment, {"ShipmentData": [entry]})
+            except Exception as e:
+                out[waybill] = _error_result(waybill, f"Unparseable shipment: {e}")
+        for w in chunk:
+            if w not in out:
+                out[w] = _error_result(w, "No ShipmentData in response")
+        return out
 
     async def track_shipment(self, waybill: str) -> dict:
         """Alias for get_tracking."""
@@ -208,11 +289,10 @@ async def sync_delhivery_shipments(db: Any, api_key: Optional[str] = None) -> di
     """
     Sync all active shipments (status not DELIVERED/RTO_DONE/LOST) from Delhivery.
     Uses api_key if provided, else global DELHIVERY_API_KEY.
-    Updates Shipment.status, Shipment.last_synced_at, ShipmentTracking; triggers profit recompute.
+    Updates Shipment.status, Shipment.last_synced_at, ShipmentTracking; profit recompute is queued on commit (profit_queue).
     Returns { synced: int, updated: int, errors: list }.
     """
     from app.models import Shipment, ShipmentStatus, ShipmentTracking
-    from app.services.profit_calculator import compute_profit_for_order
 
     final_statuses = (ShipmentStatus.DELIVERED, ShipmentStatus.RTO_DONE, ShipmentStatus.LOST)
     active = (
@@ -224,12 +304,13 @@ async def sync_delhivery_shipments(db: Any, api_key: Optional[str] = None) -> di
     synced = 0
     errors: list[str] = []
     client = get_client(api_key) if api_key else get_client()
+    results = await client.get_tracking_batch([(s.awb_number or "").strip() for s in active])
     for s in active:
         awb = (s.awb_number or "").strip()
-        if not awb:
+        if not awb or awb not in results:
             continue
         try:
-            result = await client.get_tracking(awb)
+            result = results[awb]
             raw_status = result.get("raw_status") or result.get("status")
             internal_status = result.get("status")
             if isinstance(internal_status, ShipmentStatus):
@@ -237,7 +318,7 @@ async def sync_delhivery_shipments(db: Any, api_key: Optional[str] = None) -> di
             delivery_status = result.get("delivery_status")
             rto_status = result.get("rto_status")
             payload = result.get("raw_response")
-            if result.get("error") and not internal_status:
+            if result.get("error"):
                 errors.append(f"{awb}: {result.get('error')}")
                 continue
             # Update shipment
@@ -264,7 +345,6 @@ async def sync_delhivery_shipments(db: Any, api_key: Optional[str] = None) -> di
                 )
                 db.add(tracking)
             db.flush()
-            compute_profit_for_order(db, s.order_id)
             synced += 1
         except Exception as e:
             logger.warning("Sync shipment %s failed: %s", awb, e)
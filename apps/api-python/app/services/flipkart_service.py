@@ -8,6 +8,8 @@ from typing import Any
 
 import httpx
 
+from app.services.http_client import get_client
+
 logger = logging.getLogger(__name__)
 
 FLIPKART_OAUTH_URL = "https://api.flipkart.net/oauth-service/oauth/token"
@@ -17,19 +19,18 @@ FLIPKART_ORDERS_SEARCH_URL = "https://api.flipkart.net/sellers/v2/orders/search"
 async def get_access_token(
     client_id: str,
     client_secret: str,
-    timeout: float = 15.0,
 ) -> str:
     """Get Flipkart OAuth2 access token using client credentials."""
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        resp = await client.post(
-            FLIPKART_OAUTH_URL,
-            params={"grant_type": "client_credentials", "scope": "Seller_Api"},
-            auth=(client_id, client_secret),
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        return data["access_token"]
+    client = get_client("flipkart")
+    resp = await client.post(
+        FLIPKART_OAUTH_URL,
+        params={"grant_type": "client_credentials", "scope": "Seller_Api"},
+        auth=(client_id, client_secret),
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    return data["access_token"]
 
 
 async def get_orders(
@@ -39,7 +40,6 @@ async def get_orders(
     to_date: datetime | None = None,
     max_pages: int = 20,
     page_size: int = 20,
-    timeout: float = 30.0,
 ) -> list[dict[str, Any]]:
     """
     Fetch orders from Flipkart Seller API (POST /orders/search).
@@ -59,48 +59,48 @@ async def get_orders(
     next_page_url: str | None = None
     page = 0
 
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        while page < max_pages:
-            if next_page_url:
-                url = next_page_url
-                body = None
-            else:
-                url = FLIPKART_ORDERS_SEARCH_URL
-                body = {
-                    "filter": {
-                        "orderDate": {"fromDate": from_str, "toDate": to_str},
-                    },
-                    "pagination": {"pageSize": min(page_size, 20)},
-                    "sort": {"field": "orderDate", "order": "desc"},
-                }
-
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json",
+    client = get_client("flipkart")
+    while page < max_pages:
+        if next_page_url:
+            url = next_page_url
+            body = None
+        else:
+            url = FLIPKART_ORDERS_SEARCH_URL
+            body = {
+                "filter": {
+                    "orderDate": {"fromDate": from_str, "toDate": to_str},
+                },
+                "pagination": {"pageSize": min(page_size, 20)},
+                "sort": {"field": "orderDate", "order": "desc"},
             }
 
-            try:
-                if body is not None:
-                    resp = await client.post(url, json=body, headers=headers)
-                else:
-                    resp = await client.get(url, headers=headers)
-                resp.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                logger.warning("Flipkart orders/search error: %s %s", e.response.status_code, e.response.text)
-                raise
-            except Exception as e:
-                logger.exception("Flipkart get_orders failed: %s", e)
-                raise
-
-            data = resp.json()
-            # Response may have orderItems list and nextPageURL
-            items = data.get("orderItems") or data.get("orderItemIds") or []
-            if isinstance(items, list):
-                all_items.extend(items)
-            next_page_url = data.get("nextPageURL") or data.get("nextPageUrl")
-            if not next_page_url or not items:
-                break
-            page += 1
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+        }
+
+        try:
+            if body is not None:
+                resp = await client.post(url, json=body, headers=headers)
+            else:
+                resp = await client.get(url, headers=headers)
+            resp.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            logger.warning("Flipkart orders/search error: %s %s", e.response.status_code, e.response.text)
+            raise
+        except Exception as e:
+            logger.exception("Flipkart get_orders failed: %s", e)
+            raise
+
+        data = resp.json()
+        # Response may have orderItems list and nextPageURL
+        items = data.get("orderItems") or data.get("orderItemIds") or []
+        if isinstance(items, list):
+            all_items.extend(items)
+        next_page_url = data.get("nextPageURL") or data.get("nextPageUrl")
+        if not next_page_url or not items:
+            break
+        page += 1
 
     return all_items
 
@@ -1,19 +1,94 @@
 """
 Shared HTTP client with timeouts and optional retries for external APIs.
 Use for Selloship, Delhivery, Shopify, etc. to avoid hanging and improve resilience.
+Clients are pooled per provider (or host) for the process lifetime so keep-alive connections
+are reused across calls instead of paying a TCP+TLS handshake per request.
 """
 import asyncio
 import logging
 from typing import Any, Optional
+from urllib.parse import urlsplit
 
 import httpx
 
+from app.config import settings
+from app.services.rate_limiter import event_hooks
+
 logger = logging.getLogger(__name__)
 
 DEFAULT_TIMEOUT = 30.0
 DEFAULT_RETRIES = 2
 RETRY_BACKOFF_BASE = 1.0  # seconds
 
+# Request timeout per provider (the pooled client's default). Call sites normally leave timeout unset;
+# pass timeout= only to override one request (e.g. multi-AWB batches)
+PROVIDER_TIMEOUTS: dict[str, float] = {
+    "shopify": 30.0,
+    "amazon": 30.0,
+    "flipkart": 30.0,
+    "myntra": 30.0,
+    "meta": 30.0,
+    "delhivery": 15.0,
+    "selloship": 20.0,
+}
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_enabled() -> bool:
+    if not settings.HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP2_ENABLED is set but the h2 package is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+def _new_client(key: str) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SEC,
+    )
+    return httpx.AsyncClient(
+        timeout=PROVIDER_TIMEOUTS.get(key, DEFAULT_TIMEOUT),
+        limits=limits,
+        http2=_http2_enabled(),
+        event_hooks=event_hooks(key) if settings.OUTBOUND_RATE_LIMIT_ENABLED else None,
+    )
+
+
+def get_client(provider: str) -> httpx.AsyncClient:
+    """
+    Pooled AsyncClient for a provider name (e.g. "shopify") or host. Created on first use and
+    reused until close_clients(); do not use it as a context manager (that would close the pool).
+    """
+    client = _clients.get(provider)
+    if client is None or client.is_closed:
+        client = _new_client(provider)
+        _clients[provider] = client
+    return client
+
+
+def init_clients() -> None:
+    """Create clients for known providers at startup so the first sync does not pay setup cost."""
+    for provider in PROVIDER_TIMEOUTS:
+        get_client(provider)
+    logger.info("HTTP client pool ready for %s provider(s)", len(_clients))
+
+
+async def close_clients() -> None:
+    """Close all pooled clients (app shutdown)."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning("HTTP client close failed: %s", e)
+
 
 async def _sleep_backoff(attempt: int) -> None:
     if attempt <= 0:
@@ -26,22 +101,28 @@ async def request_with_retry(
     method: str,
     url: str,
     *,
-    timeout: float = DEFAULT_TIMEOUT,
+    timeout: Optional[float] = None,
     max_retries: int = DEFAULT_RETRIES,
-    retry_on: tuple[int, ...] = (502, 503, 504),
+    retry_on: tuple[int, ...] = (429, 502, 503, 504),
+    provider: Optional[str] = None,
     **kwargs: Any,
 ) -> httpx.Response:
     """
     Perform HTTP request with timeout and optional retries for server/network errors.
     Retries only on retry_on status codes and on connection errors (for GET/HEAD by default).
+    A 429 retry waits for the provider's Retry-After via the client's rate limiter.
+    Uses the pooled client for provider (or the URL host when provider is not given); timeout=None uses
+    that client's PROVIDER_TIMEOUTS default.
     """
+    client = get_client(provider or urlsplit(url).hostname or "default")
+    request_timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
     last_exc: Optional[Exception] = None
     for attempt in range(max_retries + 1):
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                resp = await client.request(method, url, **kwargs)
+            resp = await client.request(method, url, timeout=request_timeout, **kwargs)
             if attempt < max_retries and resp.status_code in retry_on:
-                await _sleep_backoff(attempt + 1)
+                if resp.status_code != 429 or not settings.OUTBOUND_RATE_LIMIT_ENABLED:
+                    await _sleep_backoff(attempt + 1)
                 continue
             return resp
         except (httpx.ConnectError, httpx.ReadTimeout, httpx.ConnectTimeout) as e:
@@ -61,12 +142,13 @@ async def get_with_retry(
     *,
     params: Optional[dict] = None,
     headers: Optional[dict] = None,
-    timeout: float = DEFAULT_TIMEOUT,
+    timeout: Optional[float] = None,
     max_retries: int = DEFAULT_RETRIES,
+    provider: Optional[str] = None,
 ) -> httpx.Response:
-    """GET with retries on 5xx and connection errors."""
+    """GET with retries on 429/5xx and connection errors."""
     return await request_with_retry(
-        "GET", url, params=params, headers=headers, timeout=timeout, max_retries=max_retries
+        "GET", url, params=params, headers=headers, timeout=timeout, max_retries=max_retries, provider=provider
     )
 
 
@@ -75,8 +157,12 @@ async def post_no_retry(
     *,
     json: Optional[dict] = None,
     headers: Optional[dict] = None,
-    timeout: float = DEFAULT_TIMEOUT,
+    timeout: Optional[float] = None,
+    provider: Optional[str] = None,
 ) -> httpx.Response:
-    """POST with no retries (non-idempotent). Uses single attempt with timeout."""
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        return await client.post(url, json=json or {}, headers=headers or {})
+    """POST with no retries (non-idempotent). Uses single attempt with timeout (None: provider default)."""
+    client = get_client(provider or urlsplit(url).hostname or "default")
+    return await client.post(
+        url, json=json or {}, headers=headers or {},
+        timeout=httpx.USE_CLIENT_DEFAULT if timeout is None else timeout,
+    )
@@ -10,6 +10,8 @@ from typing import Optional
 
 import httpx
 
+from app.services.http_client import get_client
+
 logger = logging.getLogger(__name__)
 
 META_GRAPH_BASE = "https://graph.facebook.com"
@@ -41,10 +43,10 @@ async def fetch_meta_spend_for_date(
         "limit": 1,
     }
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.get(url, params=params)
-            resp.raise_for_status()
-            data = resp.json()
+        client = get_client("meta")
+        resp = await client.get(url, params=params)
+        resp.raise_for_status()
+        data = resp.json()
     except httpx.HTTPStatusError as e:
         logger.warning("Meta Ads API error: %s %s", e.response.status_code, e.response.text[:200])
         return Decimal("0"), "USD"
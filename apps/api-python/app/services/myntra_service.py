@@ -9,6 +9,8 @@ from typing import Any
 
 import httpx
 
+from app.services.http_client import get_client
+
 logger = logging.getLogger(__name__)
 
 # Myntra API base (PPMP v4); may vary by partner
@@ -21,7 +23,6 @@ async def get_orders(
     seller_id: str,
     from_date: datetime | None = None,
     to_date: datetime | None = None,
-    timeout: float = 30.0,
 ) -> list[dict[str, Any]]:
     """
     Fetch orders from Myntra Partner API.
@@ -46,16 +47,16 @@ async def get_orders(
     }
 
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            resp = await client.get(url, params=params, headers=headers)
-            if resp.status_code == 404 or resp.status_code == 401:
-                logger.info(
-                    "Myntra API returned %s; partner-specific endpoint or credentials may be required.",
-                    resp.status_code,
-                )
-                return []
-            resp.raise_for_status()
-            data = resp.json()
+        client = get_client("myntra")
+        resp = await client.get(url, params=params, headers=headers)
+        if resp.status_code == 404 or resp.status_code == 401:
+            logger.info(
+                "Myntra API returned %s; partner-specific endpoint or credentials may be required.",
+                resp.status_code,
+            )
+            return []
+        resp.raise_for_status()
+        data = resp.json()
     except httpx.HTTPStatusError as e:
         logger.warning("Myntra get_orders HTTP error: %s %s", e.response.status_code, e.response.text)
         return []
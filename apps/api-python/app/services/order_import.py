@@ -1,6 +1,8 @@
 """
 Order import service for Shopify, Amazon, Flipkart, Myntra.
 """
+import logging
+import uuid
 from collections import defaultdict
 from datetime import datetime, timezone, timedelta
 from decimal import Decimal
@@ -41,6 +43,45 @@ from app.services.flipkart_service import (
 )
 from app.services.myntra_service import get_orders as myntra_get_orders, normalize_myntra_order_to_common
 
+logger = logging.getLogger(__name__)
+
+# Orders staged per transaction during channel imports
+IMPORT_BATCH_SIZE = 500
+
+
+def _shopify_order_to_common(shopify_order: dict) -> dict:
+    """
+    Map a raw Shopify REST order to the common-order shape used by the batch importer. Lines keep their SKU and
+    quantity as sent (lines_as_sent) and the raw order is kept for the SyncLog payloads.
+    """
+    shipping_address = shopify_order.get("shipping_address") or {}
+    customer = shopify_order.get("customer") or {}
+    customer_name = (
+        shipping_address.get("name") or
+        f"{customer.get('first_name') or ''} {customer.get('last_name') or ''}".strip() or
+        "Unknown"
+    )
+    return {
+        "id": shopify_order.get("id"),
+        "channel_order_id": str(shopify_order.get("id") or ""),
+        "order_total": shopify_order.get("total_price", 0),
+        "customer_name": customer_name,
+        "customer_email": shopify_order.get("email"),
+        "financial_status": shopify_order.get("financial_status"),
+        "lines_as_sent": True,
+        "raw": shopify_order,
+        "items": [
+            {
+                "sku": li.get("sku") or "",
+                "title": li.get("title") or "",
+                "quantity": li.get("quantity", 0),
+                "price": li.get("price", 0),
+            }
+            for li in shopify_order.get("line_items") or []
+        ],
+    }
+
+
 async def import_shopify_orders(db: Session, account: ChannelAccount) -> dict:
     """Import orders from Shopify"""
     service = ShopifyService(account)
@@ -62,164 +103,17 @@ async def import_shopify_orders(db: Session, account: ChannelAccount) -> dict:
         if not warehouse:
             raise Exception("No warehouse configured. Create a warehouse or set DEFAULT_WAREHOUSE_NAME / DEFAULT_WAREHOUSE_ID.")
         
-        # Fetch orders from Shopify
-        shopify_orders = await service.get_orders()
-        
-        imported = 0
-        skipped = 0
-        errors = 0
-        
-        for shopify_order in shopify_orders:
-            try:
-                # Check if order already exists (idempotent)
-                existing = db.query(Order).filter(
-                    Order.channel_id == account.channel_id,
-                    Order.channel_order_id == str(shopify_order["id"])
-                ).first()
-                
-                if existing:
-                    skipped += 1
-                    continue
-                
-                # Determine payment mode
-                payment_mode = PaymentMode.PREPAID if shopify_order.get("financial_status") == "paid" else PaymentMode.COD
-                
-                # Extract customer info
-                shipping_address = shopify_order.get("shipping_address", {})
-                customer = shopify_order.get("customer", {})
-                customer_name = (
-                    shipping_address.get("name") or
-                    f"{customer.get('first_name', '')} {customer.get('last_name', '')}".strip() or
-                    "Unknown"
-                )
-                customer_email = shopify_order.get("email")
-                
-                # Process order items
-                order_items_data = []
-                all_mapped = True
-                all_stock_available = True
-                
-                for line_item in shopify_order.get("line_items", []):
-                    sku = line_item.get("sku", "")
-                    variant = db.query(ProductVariant).filter(ProductVariant.sku == sku).first()
-                    
-                    fulfillment_status = FulfillmentStatus.PENDING
-                    variant_id = None
-                    
-                    if variant:
-                        fulfillment_status = FulfillmentStatus.MAPPED
-                        variant_id = variant.id
-                        
-                        # Check inventory availability
-                        inventory = db.query(Inventory).filter(
-                            Inventory.warehouse_id == warehouse.id,
-                            Inventory.variant_id == variant.id
-                        ).first()
-                        
-                        available_qty = (inventory.total_qty if inventory else 0) - (inventory.reserved_qty if inventory else 0)
-                        
-                        if available_qty < line_item.get("quantity", 0):
-                            all_stock_available = False
-                    else:
-                        fulfillment_status = FulfillmentStatus.UNMAPPED_SKU
-                        all_mapped = False
-                    
-                    order_items_data.append({
-                        "variant_id": variant_id,
-                        "sku": sku,
-                        "title": line_item.get("title", ""),
-                        "qty": line_item.get("quantity", 0),
-                        "price": Decimal(str(line_item.get("price", 0))),
-                        "fulfillment_status": fulfillment_status
-                    })
-                
-                # Determine order status
-                order_status = OrderStatus.NEW
-                if not all_mapped or not all_stock_available:
-                    order_status = OrderStatus.HOLD
-                
-                # Create order
-                order = Order(
-                    channel_id=account.channel_id,
-                    channel_account_id=account.id,
-                    channel_order_id=str(shopify_order["id"]),
-                    customer_name=customer_name,
-                    customer_email=customer_email,
-                    payment_mode=payment_mode,
-                    order_total=Decimal(str(shopify_order.get("total_price", 0))),
-                    status=order_status
-                )
-                db.add(order)
-                db.flush()
-                
-                # Create order items
-                for item_data in order_items_data:
-                    order_item = OrderItem(
-                        order_id=order.id,
-                        variant_id=item_data["variant_id"],
-                        sku=item_data["sku"],
-                        title=item_data["title"],
-                        qty=item_data["qty"],
-                        price=item_data["price"],
-                        fulfillment_status=item_data["fulfillment_status"]
-                    )
-                    db.add(order_item)
-                    
-                    # Reserve inventory for mapped items
-                    if item_data["variant_id"] and item_data["fulfillment_status"] == FulfillmentStatus.MAPPED:
-                        inventory = db.query(Inventory).filter(
-                            Inventory.warehouse_id == warehouse.id,
-                            Inventory.variant_id == item_data["variant_id"]
-                        ).first()
-                        
-                        if inventory:
-                            inventory.reserved_qty += item_data["qty"]
-                        else:
-                            inventory = Inventory(
-                                warehouse_id=warehouse.id,
-                                variant_id=item_data["variant_id"],
-                                total_qty=0,
-                                reserved_qty=item_data["qty"]
-                            )
-                            db.add(inventory)
-                        
-                        # Log inventory movement
-                        movement = InventoryMovement(
-                            warehouse_id=warehouse.id,
-                            variant_id=item_data["variant_id"],
-                            type=InventoryMovementType.RESERVE,
-                            qty=item_data["qty"],
-                            reference=order.id
-                        )
-                        db.add(movement)
-                
-                db.commit()
-                imported += 1
-                
-                # Log success
-                log = SyncLog(
-                    sync_job_id=sync_job.id,
-                    level=LogLevel.INFO,
-                    message=f"Imported order {order.id} from Shopify order {shopify_order['id']}",
-                    raw_payload=shopify_order
-                )
-                db.add(log)
-                db.commit()
-                
-            except Exception as e:
-                errors += 1
-                log = SyncLog(
-                    sync_job_id=sync_job.id,
-                    level=LogLevel.ERROR,
-                    message=f"Failed to import Shopify order {shopify_order.get('id', 'unknown')}: {str(e)}",
-                    raw_payload=shopify_order
-                )
-                db.add(log)
-                db.commit()
+        # Fetch orders from Shopify: only those changed since the account's incremental sync checkpoint
+        # (older ones were imported by it), page-capped
+        shopify_orders = await service.get_orders(updated_at_min=account.orders_updated_at_min)
+        common_orders = [_shopify_order_to_common(o) for o in shopify_orders]
+        imported, skipped, errors = _persist_common_orders(db, account, warehouse, common_orders, sync_job)
         
         # Update sync job
         sync_job.status = SyncJobStatus.SUCCESS
         sync_job.finished_at = datetime.utcnow()
+        sync_job.records_processed = imported
+        sync_job.records_failed = errors
         db.commit()
         
         return {
@@ -231,6 +125,7 @@ async def import_shopify_orders(db: Session, account: ChannelAccount) -> dict:
         }
         
     except Exception as e:
+        db.rollback()
         sync_job.status = SyncJobStatus.FAILED
         sync_job.finished_at = datetime.utcnow()
         log = SyncLog(
@@ -243,24 +138,42 @@ async def import_shopify_orders(db: Session, account: ChannelAccount) -> dict:
         raise
 
 
-def _persist_one_common_order(
-    db: Session,
+def _common_channel_order_id(common: dict) -> str:
+    return str(common.get("channel_order_id") or common.get("id") or "")
+
+
+def _common_line_sku(common: dict, it: dict, index: int) -> str:
+    sku = str(it.get("sku") or "").strip()
+    if common.get("lines_as_sent"):
+        return sku
+    return sku or f"LINE-{index}"
+
+
+def _common_line_qty(common: dict, it: dict) -> int:
+    if common.get("lines_as_sent"):
+        return int(it.get("quantity") or 0)
+    return int(it.get("quantity") or 1)
+
+
+def _log_payload(common: dict) -> dict:
+    """Payload stored on the order's SyncLog rows: the channel's raw order when the importer kept it."""
+    return common.get("raw") or common
+
+
+def _build_common_order_rows(
     account: ChannelAccount,
-    warehouse: Warehouse,
+    warehouse: Warehouse | None,
     common: dict,
+    channel_order_id: str,
+    variants_by_sku: dict,
+    inventory_by_variant: dict,
     sync_job: SyncJob,
-) -> tuple[bool, str | None]:
-    """Create Order + OrderItems from a common-order dict. Returns (imported, None) or (False, 'skipped'/'error')."""
-    channel_order_id = str(common.get("channel_order_id") or common.get("id") or "")
-    if not channel_order_id:
-        return False, "missing channel_order_id"
-    existing = db.query(Order).filter(
-        Order.channel_account_id == account.id,
-        Order.channel_order_id == channel_order_id,
-    ).first()
-    if existing:
-        return False, "skipped"
-
+) -> tuple[list, list[tuple[str, int]]]:
+    """
+    Build Order, OrderItems, RESERVE movements and the INFO SyncLog for one common order.
+    Returns (rows, reservations) where reservations are (variant_id, qty) still to apply to Inventory.
+    Pure in-memory: nothing is added to the session, so a bad row can be dropped without side effects.
+    """
     payment_mode = PaymentMode.PREPAID if (common.get("payment_mode") or common.get("financial_status")) in ("PREPAID", "paid") else PaymentMode.COD
     order_total = Decimal(str(common.get("order_total", 0)))
     customer_name = (common.get("customer_name") or "Customer").strip() or "Customer"
@@ -271,31 +184,31 @@ def _persist_one_common_order(
     all_mapped = True
     all_stock_available = True
     for it in items:
-        sku = str(it.get("sku") or "").strip() or f"LINE-{len(order_items_data)}"
-        variant = db.query(ProductVariant).filter(ProductVariant.sku == sku).first()
+        sku = _common_line_sku(common, it, len(order_items_data))
+        variant = variants_by_sku.get(sku)
         fulfillment_status = FulfillmentStatus.MAPPED if variant else FulfillmentStatus.UNMAPPED_SKU
         variant_id = variant.id if variant else None
+        qty = _common_line_qty(common, it)
         if not variant:
             all_mapped = False
         elif warehouse:
-            inv = db.query(Inventory).filter(
-                Inventory.warehouse_id == warehouse.id,
-                Inventory.variant_id == variant.id,
-            ).first()
-            available = (inv.total_qty if inv else 0) - (inv.reserved_qty if inv else 0)
-            if available < int(it.get("quantity") or 1):
+            inv = inventory_by_variant.get(variant.id)
+            available = ((inv.total_qty or 0) if inv else 0) - ((inv.reserved_qty or 0) if inv else 0)
+            if available < qty:
                 all_stock_available = False
         order_items_data.append({
             "variant_id": variant_id,
             "sku": sku,
             "title": str(it.get("title") or "Item").strip() or "Item",
-            "qty": int(it.get("quantity") or 1),
+            "qty": qty,
             "price": Decimal(str(it.get("price") or 0)),
             "fulfillment_status": fulfillment_status,
         })
 
     order_status = OrderStatus.NEW if (all_mapped and all_stock_available) else OrderStatus.HOLD
+    # Assign the id up front so items and movements can reference it without a per-order flush
     order = Order(
+        id=str(uuid.uuid4()),
         channel_id=account.channel_id,
         channel_account_id=account.id,
         channel_order_id=channel_order_id,
@@ -305,10 +218,10 @@ def _persist_one_common_order(
         order_total=order_total,
         status=order_status,
     )
-    db.add(order)
-    db.flush()
+    rows: list = [order]
+    reservations: list[tuple[str, int]] = []
     for item_data in order_items_data:
-        oi = OrderItem(
+        rows.append(OrderItem(
             order_id=order.id,
             variant_id=item_data["variant_id"],
             sku=item_data["sku"],
@@ -316,34 +229,151 @@ def _persist_one_common_order(
             qty=item_data["qty"],
             price=item_data["price"],
             fulfillment_status=item_data["fulfillment_status"],
-        )
-        db.add(oi)
+        ))
         if item_data["variant_id"] and item_data["fulfillment_status"] == FulfillmentStatus.MAPPED and warehouse:
-            inv = db.query(Inventory).filter(
+            reservations.append((item_data["variant_id"], item_data["qty"]))
+            rows.append(InventoryMovement(
+                warehouse_id=warehouse.id,
+                variant_id=item_data["variant_id"],
+                type=InventoryMovementType.RESERVE,
+                qty=item_data["qty"],
+                reference=order.id,
+            ))
+    rows.append(SyncLog(sync_job_id=sync_job.id, level=LogLevel.INFO, message=f"Imported order {order.id} ({channel_order_id})", raw_payload=_log_payload(common)))
+    return rows, reservations
+
+
+def _stage_common_order_batch(
+    db: Session,
+    account: ChannelAccount,
+    warehouse: Warehouse | None,
+    batch: list[dict],
+    sync_job: SyncJob,
+) -> tuple[int, int, int]:
+    """
+    Prefetch duplicates, SKU->variant and inventory for a batch (one query each), then add all
+    orders, items, movements and logs to the session and flush once. Caller commits.
+    Returns (imported, skipped, errors).
+    """
+    order_ids = {_common_channel_order_id(c) for c in batch} - {""}
+    existing: set[str] = set()
+    if order_ids:
+        existing = {
+            row[0]
+            for row in db.query(Order.channel_order_id).filter(
+                Order.channel_account_id == account.id,
+                Order.channel_order_id.in_(order_ids),
+            ).all()
+        }
+    skus = {_common_line_sku(c, it, i) for c in batch for i, it in enumerate(c.get("items") or [])}
+    variants_by_sku: dict = {}
+    if skus:
+        variants_by_sku = {v.sku: v for v in db.query(ProductVariant).filter(ProductVariant.sku.in_(skus)).all()}
+    inventory_by_variant: dict = {}
+    if warehouse and variants_by_sku:
+        variant_ids = [v.id for v in variants_by_sku.values()]
+        inventory_by_variant = {
+            inv.variant_id: inv
+            for inv in db.query(Inventory).filter(
                 Inventory.warehouse_id == warehouse.id,
-                Inventory.variant_id == item_data["variant_id"],
-            ).first()
+                Inventory.variant_id.in_(variant_ids),
+            ).all()
+        }
+
+    imported = skipped = errors = 0
+    rows: list = []
+    for common in batch:
+        channel_order_id = _common_channel_order_id(common)
+        if not channel_order_id:
+            errors += 1
+            rows.append(SyncLog(sync_job_id=sync_job.id, level=LogLevel.ERROR, message="Missing channel_order_id", raw_payload=_log_payload(common)))
+            continue
+        if channel_order_id in existing:
+            skipped += 1
+            continue
+        try:
+            order_rows, reservations = _build_common_order_rows(
+                account, warehouse, common, channel_order_id, variants_by_sku, inventory_by_variant, sync_job
+            )
+        except Exception as e:
+            errors += 1
+            rows.append(SyncLog(sync_job_id=sync_job.id, level=LogLevel.ERROR, message=f"Failed to import order {channel_order_id}: {e}", raw_payload=_log_payload(common)))
+            continue
+        rows.extend(order_rows)
+        # Reserve inventory for mapped items; later orders in the batch see the updated availability
+        for variant_id, qty in reservations:
+            inv = inventory_by_variant.get(variant_id)
             if inv:
-                inv.reserved_qty += item_data["qty"]
+                inv.reserved_qty = (inv.reserved_qty or 0) + qty
             else:
                 inv = Inventory(
                     warehouse_id=warehouse.id,
-                    variant_id=item_data["variant_id"],
+                    variant_id=variant_id,
                     total_qty=0,
-                    reserved_qty=item_data["qty"],
+                    reserved_qty=qty,
                 )
-                db.add(inv)
-            db.add(InventoryMovement(
-                warehouse_id=warehouse.id,
-                variant_id=item_data["variant_id"],
-                type=InventoryMovementType.RESERVE,
-                qty=item_data["qty"],
-                reference=order.id,
+                inventory_by_variant[variant_id] = inv
+                rows.append(inv)
+        existing.add(channel_order_id)
+        imported += 1
+    db.add_all(rows)
+    db.flush()
+    return imported, skipped, errors
+
+
+def _persist_common_order_batch(
+    db: Session,
+    account: ChannelAccount,
+    warehouse: Warehouse | None,
+    batch: list[dict],
+    sync_job: SyncJob,
+) -> tuple[int, int, int]:
+    """
+    Persist one batch in a single transaction. If the flush/commit fails (e.g. a concurrent sync
+    inserted the same order), roll back and retry row-by-row so one bad order cannot sink the batch.
+    """
+    try:
+        counts = _stage_common_order_batch(db, account, warehouse, batch, sync_job)
+        db.commit()
+        return counts
+    except Exception as e:
+        db.rollback()
+        if len(batch) == 1:
+            db.add(SyncLog(
+                sync_job_id=sync_job.id,
+                level=LogLevel.ERROR,
+                message=f"Failed to import order {_common_channel_order_id(batch[0]) or 'unknown'}: {e}",
+                raw_payload=_log_payload(batch[0]),
             ))
-    db.commit()
-    db.add(SyncLog(sync_job_id=sync_job.id, level=LogLevel.INFO, message=f"Imported order {order.id} ({channel_order_id})", raw_payload=common))
-    db.commit()
-    return True, None
+            db.commit()
+            return 0, 0, 1
+        logger.warning("Order import batch of %s failed, retrying per order: %s", len(batch), e)
+        imported = skipped = errors = 0
+        for common in batch:
+            i, s, err = _persist_common_order_batch(db, account, warehouse, [common], sync_job)
+            imported += i
+            skipped += s
+            errors += err
+        return imported, skipped, errors
+
+
+def _persist_common_orders(
+    db: Session,
+    account: ChannelAccount,
+    warehouse: Warehouse | None,
+    common_orders: list[dict],
+    sync_job: SyncJob,
+) -> tuple[int, int, int]:
+    """Persist common-order dicts in batches of IMPORT_BATCH_SIZE. Returns (imported, skipped, errors)."""
+    imported = skipped = errors = 0
+    for start in range(0, len(common_orders), IMPORT_BATCH_SIZE):
+        i, s, err = _persist_common_order_batch(
+            db, account, warehouse, common_orders[start:start + IMPORT_BATCH_SIZE], sync_job
+        )
+        imported += i
+        skipped += s
+        errors += err
+    return imported, skipped, errors
 
 
 async def import_amazon_orders(db: Session, account: ChannelAccount) -> dict:
@@ -383,20 +413,18 @@ async def import_amazon_orders(db: Session, account: ChannelAccount) -> dict:
     skipped = 0
     errors = 0
     try:
+        common_orders = []
         for raw in raw_orders:
             try:
-                common = normalize_amazon_order_to_common(raw)
-                ok, msg = _persist_one_common_order(db, account, warehouse, common, sync_job)
-                if ok:
-                    imported += 1
-                elif msg == "skipped":
-                    skipped += 1
-                else:
-                    errors += 1
+                common_orders.append(normalize_amazon_order_to_common(raw))
             except Exception as e:
                 errors += 1
                 db.add(SyncLog(sync_job_id=sync_job.id, level=LogLevel.ERROR, message=str(e), raw_payload=raw))
-                db.commit()
+        db.commit()
+        i, s, err = _persist_common_orders(db, account, warehouse, common_orders, sync_job)
+        imported += i
+        skipped += s
+        errors += err
         sync_job.status = SyncJobStatus.SUCCESS
         sync_job.finished_at = datetime.now(timezone.utc)
         sync_job.records_processed = imported
@@ -404,6 +432,7 @@ async def import_amazon_orders(db: Session, account: ChannelAccount) -> dict:
         db.commit()
         return {"success": True, "imported": imported, "skipped": skipped, "errors": errors, "jobId": sync_job.id}
     except Exception as e:
+        db.rollback()
         sync_job.status = SyncJobStatus.FAILED
         sync_job.finished_at = datetime.now(timezone.utc)
         sync_job.error_message = str(e)
@@ -470,19 +499,7 @@ async def import_flipkart_orders(db: Session, account: ChannelAccount) -> dict:
     db.refresh(sync_job)
     imported = skipped = errors = 0
     try:
-        for common in common_orders:
-            try:
-                ok, msg = _persist_one_common_order(db, account, warehouse, common, sync_job)
-                if ok:
-                    imported += 1
-                elif msg == "skipped":
-                    skipped += 1
-                else:
-                    errors += 1
-            except Exception as e:
-                errors += 1
-                db.add(SyncLog(sync_job_id=sync_job.id, level=LogLevel.ERROR, message=str(e), raw_payload=common))
-                db.commit()
+        imported, skipped, errors = _persist_common_orders(db, account, warehouse, common_orders, sync_job)
         sync_job.status = SyncJobStatus.SUCCESS
         sync_job.finished_at = datetime.now(timezone.utc)
         sync_job.records_processed = imported
@@ -490,6 +507,7 @@ async def import_flipkart_orders(db: Session, account: ChannelAccount) -> dict:
         db.commit()
         return {"success": True, "imported": imported, "skipped": skipped, "errors": errors, "jobId": sync_job.id}
     except Exception as e:
+        db.rollback()
         sync_job.status = SyncJobStatus.FAILED
         sync_job.finished_at = datetime.now(timezone.utc)
         sync_job.error_message = str(e)
@@ -527,19 +545,7 @@ async def import_myntra_orders(db: Session, account: ChannelAccount) -> dict:
     db.refresh(sync_job)
     imported = skipped = errors = 0
     try:
-        for common in common_orders:
-            try:
-                ok, msg = _persist_one_common_order(db, account, warehouse, common, sync_job)
-                if ok:
-                    imported += 1
-                elif msg == "skipped":
-                    skipped += 1
-                else:
-                    errors += 1
-            except Exception as e:
-                errors += 1
-                db.add(SyncLog(sync_job_id=sync_job.id, level=LogLevel.ERROR, message=str(e), raw_payload=common))
-                db.commit()
+        imported, skipped, errors = _persist_common_orders(db, account, warehouse, common_orders, sync_job)
         sync_job.status = SyncJobStatus.SUCCESS
         sync_job.finished_at = datetime.now(timezone.utc)
         sync_job.records_processed = imported
@@ -547,6 +553,7 @@ async def import_myntra_orders(db: Session, account: ChannelAccount) -> dict:
         db.commit()
         return {"success": True, "imported": imported, "skipped": skipped, "errors": errors, "jobId": sync_job.id}
     except Exception as e:
+        db.rollback()
         sync_job.status = SyncJobStatus.FAILED
         sync_job.finished_at = datetime.now(timezone.utc)
         sync_job.error_message = str(e)
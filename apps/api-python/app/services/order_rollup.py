@@ -0,0 +1,385 @@
+"""
+Analytics rollup (daily_order_rollup): per (channel_account_id, IST day) revenue, order/item counts,
+order status counts and order_profit buckets (net profit, loss, RTO, lost).
+Kept current incrementally: an after_flush hook diffs the old and new values of touched orders,
+order_items and order_profit rows (attribute history) into per-key deltas, and after commit they are
+added to the rows (`col = daily_order_rollup.col + delta`) in a short transaction of their own, so
+concurrent writers never overwrite each other. Changes whose previous values are unknown (unloaded
+attributes, deleted orders, orders moved between accounts/days) recount just those keys after commit.
+Bulk profit writes (compute_profit_for_orders) report their old/new values via record_profit_changes().
+scripts/backfill_order_rollups.py rebuilds everything.
+"""
+import logging
+from datetime import date
+from decimal import Decimal
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import case, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app.models import DailyOrderRollup, Order, OrderItem, OrderProfit, OrderStatus, ist_date
+
+logger = logging.getLogger(__name__)
+
+Key = tuple[str, date]
+
+RESOLVE_CHUNK = 500
+_PENDING_KEY = "order_rollup_changes"
+_STATUS_COLUMNS = {
+    OrderStatus.NEW: "new_count",
+    OrderStatus.CONFIRMED: "confirmed_count",
+    OrderStatus.PACKED: "packed_count",
+    OrderStatus.SHIPPED: "shipped_count",
+    OrderStatus.DELIVERED: "delivered_count",
+    OrderStatus.CANCELLED: "cancelled_count",
+    OrderStatus.RETURNED: "returned_count",
+    OrderStatus.HOLD: "hold_count",
+}
+_RTO_STATUSES = ("RTO_DONE", "RTO_INITIATED")
+_ORDER_FIELDS = ("status", "order_total")
+_ORDER_KEY_FIELDS = ("channel_account_id", "order_date_ist")
+_ITEM_FIELDS = ("qty",)
+ROLLUP_PROFIT_FIELDS = ("revenue", "net_profit", "rto_loss", "lost_loss", "final_status")
+_ROLLUP_COLUMNS = [
+    c.name for c in DailyOrderRollup.__table__.columns if c.name not in ("channel_account_id", "date", "updated_at")
+]
+
+
+def _count_if(cond):
+    return func.coalesce(func.sum(case((cond, 1), else_=0)), 0)
+
+
+def _sum_if(cond, value):
+    return func.coalesce(func.sum(case((cond, value), else_=0)), 0)
+
+
+def _upsert_stmt(dialect_name: str, rows: list[dict]):
+    """INSERT ... ON CONFLICT (channel_account_id, date) DO UPDATE for Postgres/SQLite."""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(DailyOrderRollup).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[DailyOrderRollup.channel_account_id, DailyOrderRollup.date],
+        set_={**{name: stmt.excluded[name] for name in _ROLLUP_COLUMNS}, "updated_at": func.now()},
+    )
+
+
+def _increment_stmt(dialect_name: str, rows: list[dict]):
+    """INSERT ... ON CONFLICT (channel_account_id, date) DO UPDATE SET col = col + excluded.col."""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = DailyOrderRollup.__table__
+    stmt = insert(DailyOrderRollup).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[DailyOrderRollup.channel_account_id, DailyOrderRollup.date],
+        set_={**{name: table.c[name] + stmt.excluded[name] for name in _ROLLUP_COLUMNS}, "updated_at": func.now()},
+    )
+
+
+def _empty_row(account_id: str, day: date) -> dict:
+    row = {name: 0 for name in _ROLLUP_COLUMNS}
+    row.update(channel_account_id=account_id, date=day)
+    return row
+
+
+def _recount(conn, keys: set[Key]) -> list[dict]:
+    accounts = {a for a, _ in keys}
+    days = {d for _, d in keys}
+    group = (Order.channel_account_id, Order.order_date_ist)
+    scope = (Order.channel_account_id.in_(accounts), Order.order_date_ist.in_(days))
+    rows = {k: _empty_row(*k) for k in keys}
+
+    status_cols = [_count_if(Order.status == status).label(name) for status, name in _STATUS_COLUMNS.items()]
+    for r in conn.execute(
+        select(*group, func.count(Order.id).label("order_count"),
+               func.coalesce(func.sum(Order.order_total), 0).label("revenue"), *status_cols)
+        .where(*scope).group_by(*group)
+    ).mappings():
+        row = rows.get((r["channel_account_id"], r["order_date_ist"]))
+        if row is not None:
+            row.update({name: r[name] for name in ("order_count", "revenue", *_STATUS_COLUMNS.values())})
+
+    for account_id, day, items in conn.execute(
+        select(*group, func.coalesce(func.sum(OrderItem.qty), 0))
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(*scope).group_by(*group)
+    ):
+        row = rows.get((account_id, day))
+        if row is not None:
+            row["item_count"] = items
+
+    is_loss = OrderProfit.net_profit < 0
+    is_rto = OrderProfit.final_status.in_(_RTO_STATUSES)
+    is_lost = OrderProfit.final_status == "LOST"
+    for r in conn.execute(
+        select(
+            *group,
+            func.count(OrderProfit.id).label("profit_order_count"),
+            func.coalesce(func.sum(OrderProfit.revenue), 0).label("profit_revenue"),
+            func.coalesce(func.sum(OrderProfit.net_profit), 0).label("net_profit"),
+            _count_if(is_loss).label("loss_count"),
+            _sum_if(is_loss, -OrderProfit.net_profit).label("loss_amount"),
+            _count_if(is_rto).label("rto_count"),
+            _sum_if(is_rto, OrderProfit.rto_loss).label("rto_amount"),
+            _count_if(is_lost).label("lost_count"),
+            _sum_if(is_lost, OrderProfit.lost_loss).label("lost_amount"),
+        )
+        .join(Order, Order.id == OrderProfit.order_id)
+        .where(*scope).group_by(*group)
+    ).mappings():
+        row = rows.get((r["channel_account_id"], r["order_date_ist"]))
+        if row is not None:
+            row.update({k: v for k, v in r.items() if k not in ("channel_account_id", "order_date_ist")})
+
+    for row in rows.values():
+        for name in ("revenue", "profit_revenue", "net_profit", "loss_amount", "rto_amount", "lost_amount"):
+            row[name] = Decimal(str(row[name] or 0))
+    return list(rows.values())
+
+
+def refresh_rollups(db_or_conn, keys: Iterable[Key]) -> int:
+    """Recount and upsert daily_order_rollup rows for (channel_account_id, IST day) keys. Returns row count."""
+    keys = {(a, d) for a, d in keys if a and d}
+    if not keys:
+        return 0
+    conn = db_or_conn.connection() if isinstance(db_or_conn, Session) else db_or_conn
+    rows = _recount(conn, keys)
+    conn.execute(_upsert_stmt(conn.dialect.name, rows))
+    return len(rows)
+
+
+def _keys_for_orders(conn, order_ids: Iterable[str]) -> set[Key]:
+    ids = list({oid for oid in order_ids if oid})
+    keys: set[Key] = set()
+    for i in range(0, len(ids), RESOLVE_CHUNK):
+        keys.update(
+            (a, d) for a, d in conn.execute(
+                select(Order.channel_account_id, Order.order_date_ist).where(Order.id.in_(ids[i:i + RESOLVE_CHUNK]))
+            )
+        )
+    return keys
+
+
+def _order_key(order: Order, account_id: Optional[str] = None) -> Key:
+    return (account_id or order.channel_account_id, order.order_date_ist or ist_date(order.created_at))
+
+
+def _dec(value) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+def _order_contrib(v: dict) -> dict:
+    row = {"order_count": 1, "revenue": _dec(v["order_total"])}
+    status_col = _STATUS_COLUMNS.get(v["status"])
+    if status_col:
+        row[status_col] = 1
+    return row
+
+
+def _item_contrib(v: dict) -> dict:
+    return {"item_count": v["qty"] or 0}
+
+
+def _profit_contrib(v: dict) -> dict:
+    net = _dec(v["net_profit"])
+    row = {"profit_order_count": 1, "profit_revenue": _dec(v["revenue"]), "net_profit": net}
+    if net < 0:
+        row.update(loss_count=1, loss_amount=-net)
+    if v["final_status"] in _RTO_STATUSES:
+        row.update(rto_count=1, rto_amount=_dec(v["rto_loss"]))
+    elif v["final_status"] == "LOST":
+        row.update(lost_count=1, lost_amount=_dec(v["lost_loss"]))
+    return row
+
+
+def _add(target: dict, contrib: dict, sign: int = 1) -> None:
+    for name, value in contrib.items():
+        target[name] = target.get(name, 0) + sign * value
+
+
+def _new_changes() -> dict:
+    # deltas: per key; order_deltas: per order id (item/profit rows, key resolved after commit)
+    return {"deltas": {}, "order_deltas": {}, "recount": set(), "recount_orders": set()}
+
+
+def _current(obj, fields: tuple[str, ...]) -> Optional[dict]:
+    """Loaded values of fields (None when any is not loaded; never emits SQL)."""
+    loaded = inspect(obj).dict
+    if any(f not in loaded for f in fields):
+        return None
+    return {f: loaded[f] for f in fields}
+
+
+def _old_new(obj, fields: tuple[str, ...]) -> Optional[tuple[dict, dict]]:
+    """Pre-flush and flushed values of fields from attribute history (None when a previous value is unknown)."""
+    attrs = inspect(obj).attrs
+    old: dict = {}
+    new: dict = {}
+    for f in fields:
+        hist = attrs[f].history
+        if hist.has_changes():
+            if not hist.deleted:
+                return None
+            old[f] = hist.deleted[0]
+            new[f] = hist.added[0] if hist.added else None
+        elif hist.unchanged:
+            old[f] = new[f] = hist.unchanged[0]
+        else:
+            return None
+    return old, new
+
+
+def _changed(obj, fields: tuple[str, ...]) -> bool:
+    attrs = inspect(obj).attrs
+    return any(attrs[f].history.has_changes() for f in fields)
+
+
+def _collect(session: Session, changes: dict) -> None:
+    deltas, order_deltas = changes["deltas"], changes["order_deltas"]
+    contribs = ((OrderItem, _ITEM_FIELDS, _item_contrib), (OrderProfit, ROLLUP_PROFIT_FIELDS, _profit_contrib))
+    for obj in session.new:
+        if isinstance(obj, Order):
+            _add(deltas.setdefault(_order_key(obj), {}), _order_contrib({f: getattr(obj, f) for f in _ORDER_FIELDS}))
+            continue
+        for cls, fields, contrib in contribs:
+            if isinstance(obj, cls):
+                _add(order_deltas.setdefault(obj.order_id, {}), contrib({f: getattr(obj, f) for f in fields}))
+    for obj in session.deleted:
+        if isinstance(obj, Order):
+            # Its items/profit row go with it (DB cascade): recount the key
+            changes["recount"].add(_order_key(obj))
+            continue
+        for cls, fields, contrib in contribs:
+            if isinstance(obj, cls):
+                values = _current(obj, fields)
+                if values is None:
+                    changes["recount_orders"].add(obj.order_id)
+                else:
+                    _add(order_deltas.setdefault(obj.order_id, {}), contrib(values), -1)
+    for obj in session.dirty:
+        if isinstance(obj, Order):
+            if _changed(obj, _ORDER_KEY_FIELDS):
+                # Moved between accounts/days (with its items and profit): recount old and new keys
+                changes["recount"].add(_order_key(obj))
+                for old_account in inspect(obj).attrs.channel_account_id.history.deleted or ():
+                    changes["recount"].add(_order_key(obj, old_account))
+                for old_day in inspect(obj).attrs.order_date_ist.history.deleted or ():
+                    changes["recount"].add((obj.channel_account_id, old_day))
+            elif _changed(obj, _ORDER_FIELDS):
+                diff = _old_new(obj, _ORDER_FIELDS)
+                if diff is None:
+                    changes["recount"].add(_order_key(obj))
+                else:
+                    delta = deltas.setdefault(_order_key(obj), {})
+                    _add(delta, _order_contrib(diff[1]))
+                    _add(delta, _order_contrib(diff[0]), -1)
+            continue
+        for cls, fields, contrib in contribs:
+            if not isinstance(obj, cls) or not _changed(obj, fields + ("order_id",)):
+                continue
+            diff = _old_new(obj, fields)
+            order_hist = inspect(obj).attrs.order_id.history
+            if diff is None or order_hist.has_changes():
+                changes["recount_orders"].update(order_hist.deleted or ())
+                changes["recount_orders"].add(obj.order_id)
+            else:
+                delta = order_deltas.setdefault(obj.order_id, {})
+                _add(delta, contrib(diff[1]))
+                _add(delta, contrib(diff[0]), -1)
+
+
+def record_profit_changes(session: Session, changes: Iterable[tuple[Key, Optional[dict[str, Any]], dict[str, Any]]]) -> None:
+    """
+    Queue rollup deltas for order_profit rows written without the unit of work (bulk mappings).
+    changes: (key, old values or None for a new row, new values), values keyed by the profit fields.
+    Applied after the session commits, like the hook's own deltas.
+    """
+    pending = session.info.setdefault(_PENDING_KEY, _new_changes())
+    for key, old, new in changes:
+        delta = pending["deltas"].setdefault(key, {})
+        _add(delta, _profit_contrib(new))
+        if old is not None:
+            _add(delta, _profit_contrib(old), -1)
+
+
+def _apply_changes(conn, changes: dict) -> None:
+    deltas = changes["deltas"]
+    recount = set(changes["recount"])
+    order_ids = list(changes["order_deltas"])
+    for i in range(0, len(order_ids), RESOLVE_CHUNK):
+        for oid, account_id, day in conn.execute(
+            select(Order.id, Order.channel_account_id, Order.order_date_ist).where(Order.id.in_(order_ids[i:i + RESOLVE_CHUNK]))
+        ):
+            _add(deltas.setdefault((account_id, day), {}), changes["order_deltas"][oid])
+    recount |= _keys_for_orders(conn, changes["recount_orders"])
+    recount = {(a, d) for a, d in recount if a and d}
+    if recount:
+        refresh_rollups(conn, recount)
+    rows = []
+    for (account_id, day), delta in deltas.items():
+        if not account_id or not day or (account_id, day) in recount or not any(delta.values()):
+            continue
+        row = _empty_row(account_id, day)
+        row.update(delta)
+        rows.append(row)
+    for i in range(0, len(rows), RESOLVE_CHUNK):
+        conn.execute(_increment_stmt(conn.dialect.name, rows[i:i + RESOLVE_CHUNK]))
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_order_rollup_changes(session: Session, flush_context) -> None:
+    # new/dirty/deleted and attribute history still show the pre-flush state here; ids are assigned
+    _collect(session, session.info.setdefault(_PENDING_KEY, _new_changes()))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_order_rollup_changes(session: Session) -> None:
+    changes = session.info.pop(_PENDING_KEY, None)
+    if not changes or not any(changes.values()):
+        return
+    try:
+        # Own short transaction on committed data; never fails the caller (the backfill repairs a missed delta)
+        with session.get_bind().begin() as conn:
+            _apply_changes(conn, changes)
+    except Exception as e:
+        logger.warning("daily_order_rollup update for %s key(s) failed: %s", len(changes["deltas"]) + len(changes["order_deltas"]), e)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def backfill_rollups(db: Session, since: Optional[date] = None, batch_days: int = 31) -> int:
+    """
+    Rebuild daily_order_rollup from orders (optionally only days >= since), including existing rollup
+    rows whose orders are gone. Commits per batch of days. Returns number of rows written.
+    """
+    day_q = select(Order.order_date_ist).where(Order.order_date_ist.isnot(None)).distinct()
+    rollup_day_q = select(DailyOrderRollup.date).distinct()
+    if since:
+        day_q = day_q.where(Order.order_date_ist >= since)
+        rollup_day_q = rollup_day_q.where(DailyOrderRollup.date >= since)
+    days = sorted({d for (d,) in db.execute(day_q)} | {d for (d,) in db.execute(rollup_day_q)})
+    written = 0
+    for i in range(0, len(days), batch_days):
+        chunk = days[i:i + batch_days]
+        keys = {
+            (a, d) for a, d in db.execute(
+                select(Order.channel_account_id, Order.order_date_ist)
+                .where(Order.order_date_ist.in_(chunk), Order.channel_account_id.isnot(None))
+                .distinct()
+            )
+        }
+        keys.update(
+            (a, d) for a, d in db.execute(
+                select(DailyOrderRollup.channel_account_id, DailyOrderRollup.date).where(DailyOrderRollup.date.in_(chunk))
+            )
+        )
+        written += refresh_rollups(db, keys)
+        db.commit()
+    return written
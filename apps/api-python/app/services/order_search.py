@@ -0,0 +1,147 @@
+"""
+Order search over orders.search_document: lowercased order id (with and without '#'), customer name,
+email, shipment AWB and item SKUs, kept current by a Session after_flush hook.
+Postgres: GIN indexes on to_tsvector('simple', search_document) for word/prefix queries and on
+search_document gin_trgm_ops (pg_trgm) for infix matches (partial AWB / order numbers); ranked by
+ts_rank_cd + trigram similarity. SQLite (local dev): LIKE over the same column, prefix matches first.
+"""
+import logging
+import re
+from typing import Iterable
+
+from sqlalchemy import bindparam, case, event, func, inspect, literal_column, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models import Order, OrderItem, Shipment
+
+logger = logging.getLogger(__name__)
+
+RESOLVE_CHUNK = 500
+_ORDER_FIELDS = ("channel_order_id", "customer_name", "customer_email")
+_TOKEN_RE = re.compile(r"[\w@.\-]+", re.UNICODE)
+# Must match the expression of ix_orders_search_tsv exactly (literals, not bound parameters)
+_TS_CONFIG = literal_column("'simple'")
+
+
+def build_search_document(channel_order_id, customer_name, customer_email, awbs: Iterable[str], skus: Iterable[str]) -> str:
+    parts = [channel_order_id, (channel_order_id or "").lstrip("#"), customer_name, customer_email, *awbs, *skus]
+    seen: list[str] = []
+    for part in parts:
+        part = (part or "").strip().lower()
+        if part and part not in seen:
+            seen.append(part)
+    return " ".join(seen)
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _ts_vector():
+    return func.to_tsvector(_TS_CONFIG, func.coalesce(Order.search_document, literal_column("''")))
+
+
+def _prefix_tsquery(term: str) -> str:
+    """'foo bar' -> 'foo:* & bar:*' (tokens restricted to word chars, @ . - so the tsquery is always valid)."""
+    return " & ".join(f"{tok}:*" for tok in _TOKEN_RE.findall(term) if tok.strip(".-@"))
+
+
+def search_condition(q: str, dialect_name: str):
+    """WHERE clause matching orders whose search document contains q (prefix words or substring)."""
+    term = (q or "").strip().lower()
+    like = Order.search_document.like(f"%{_escape_like(term)}%", escape="\\")
+    if dialect_name != "postgresql":
+        return like
+    tsquery = _prefix_tsquery(term)
+    if not tsquery:
+        return like
+    return or_(_ts_vector().op("@@")(func.to_tsquery(_TS_CONFIG, tsquery)), like)
+
+
+def search_rank(q: str, dialect_name: str):
+    """Relevance expression for ORDER BY ... DESC."""
+    term = (q or "").strip().lower()
+    if dialect_name == "postgresql":
+        tsquery = _prefix_tsquery(term)
+        rank = func.similarity(Order.search_document, term)
+        if tsquery:
+            rank = rank + func.ts_rank_cd(_ts_vector(), func.to_tsquery(_TS_CONFIG, tsquery))
+        return rank
+    escaped = _escape_like(term)
+    return case(
+        (Order.search_document.like(f"{escaped}%", escape="\\"), 2),
+        (Order.search_document.like(f"% {escaped}%", escape="\\"), 1),
+        else_=0,
+    )
+
+
+def refresh_search_documents(conn, order_ids: Iterable[str]) -> int:
+    """Rebuild search_document for these orders from orders, shipments and order_items."""
+    ids = list({oid for oid in order_ids if oid})
+    written = 0
+    orders = Order.__table__
+    for i in range(0, len(ids), RESOLVE_CHUNK):
+        chunk = ids[i:i + RESOLVE_CHUNK]
+        awbs: dict[str, list[str]] = {}
+        for oid, awb in conn.execute(select(Shipment.order_id, Shipment.awb_number).where(Shipment.order_id.in_(chunk))):
+            awbs.setdefault(oid, []).append(awb)
+        skus: dict[str, list[str]] = {}
+        for oid, sku in conn.execute(select(OrderItem.order_id, OrderItem.sku).where(OrderItem.order_id.in_(chunk))):
+            skus.setdefault(oid, []).append(sku)
+        params = [
+            {
+                "oid": oid,
+                "doc": build_search_document(order_no, name, email, awbs.get(oid, []), skus.get(oid, [])),
+            }
+            for oid, order_no, name, email in conn.execute(
+                select(Order.id, Order.channel_order_id, Order.customer_name, Order.customer_email)
+                .where(Order.id.in_(chunk))
+            )
+        ]
+        if params:
+            conn.execute(
+                update(orders)
+                .where(orders.c.id == bindparam("oid"))
+                # Keep updated_at: a search-document rebuild is not an order change
+                .values(search_document=bindparam("doc"), updated_at=orders.c.updated_at),
+                params,
+            )
+            written += len(params)
+    return written
+
+
+def _changed(obj, fields: tuple[str, ...]) -> bool:
+    attrs = inspect(obj).attrs
+    return any(attrs[f].history.has_changes() for f in fields)
+
+
+@event.listens_for(Session, "after_flush")
+def _refresh_changed_documents(session: Session, flush_context) -> None:
+    order_ids: set[str] = set()
+    deleted_orders = {obj.id for obj in session.deleted if isinstance(obj, Order)}
+    for obj in session.new:
+        if isinstance(obj, Order):
+            order_ids.add(obj.id)
+        elif isinstance(obj, (OrderItem, Shipment)):
+            order_ids.add(obj.order_id)
+    for obj in session.deleted:
+        if isinstance(obj, OrderItem):
+            order_ids.add(obj.order_id)
+    for obj in session.dirty:
+        if isinstance(obj, Order) and _changed(obj, _ORDER_FIELDS):
+            order_ids.add(obj.id)
+        elif isinstance(obj, OrderItem) and _changed(obj, ("sku",)):
+            order_ids.add(obj.order_id)
+        elif isinstance(obj, Shipment) and _changed(obj, ("awb_number",)):
+            order_ids.add(obj.order_id)
+    order_ids -= deleted_orders
+    order_ids.discard(None)
+    if not order_ids:
+        return
+    conn = session.connection()
+    try:
+        # Savepoint: never fail the caller's write over the search index
+        with conn.begin_nested():
+            refresh_search_documents(conn, order_ids)
+    except Exception as e:
+        logger.warning("search_document refresh for %s order(s) failed: %s", len(order_ids), e)
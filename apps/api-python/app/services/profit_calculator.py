@@ -1,13 +1,15 @@
 """
 Profit engine: compute net_profit per order from revenue, SKU costs, shipment (forward/reverse), courier status, and marketing CAC.
 Rules: Delivered = revenue - all costs; RTO = loss (product+packaging+forward+reverse+marketing); Lost = product+packaging+forward; Cancelled = marketing+payment.
-Marketing cost = blended CAC from ad_spend_daily (daily_spend / daily_orders for order date).
+Marketing cost = blended CAC per IST day from daily_cac (daily_spend / daily non-cancelled orders).
+compute_profit_for_orders() applies the same rules to many orders with preloaded maps and bulk writes
+(and queues the matching daily_order_rollup deltas itself).
 """
 import logging
+import uuid
 from datetime import date
 from decimal import Decimal
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
 from app.models import (
     Order,
@@ -17,42 +19,48 @@ from app.models import (
     Shipment,
     ShipmentStatus,
     OrderStatus,
-    AdSpendDaily,
+    ist_date,
 )
+from app.services.daily_cac import get_daily_cac_map
+from app.services.order_rollup import ROLLUP_PROFIT_FIELDS, record_profit_changes
+from app.services.analytics_cache import note_orders_changed
 
 logger = logging.getLogger(__name__)
 
 
 def _get_daily_cac(db: Session, order_date: date) -> Decimal:
-    """Blended CAC for a calendar day: daily_spend / daily_orders. Returns 0 if no orders or no spend."""
-    daily_spend = db.query(func.coalesce(func.sum(AdSpendDaily.spend), 0)).filter(
-        AdSpendDaily.date == order_date
-    ).scalar()
-    daily_spend = Decimal(str(daily_spend or 0))
-    daily_orders = db.query(func.count(Order.id)).filter(
-        func.date(Order.created_at) == order_date
-    ).scalar() or 0
-    if daily_orders <= 0:
-        return Decimal("0")
-    return (daily_spend / daily_orders).quantize(Decimal("0.01"))
+    """Blended CAC for an IST calendar day (daily_spend / daily_orders) from the materialized daily_cac table."""
+    return get_daily_cac_map(db, [order_date]).get(order_date, Decimal("0"))
 
 
-def compute_profit_for_order(db: Session, order_id: str) -> OrderProfit | None:
+# OrderProfit value columns written by both the single-order and batch paths
+_PROFIT_FIELDS = (
+    "revenue", "product_cost", "packaging_cost", "shipping_cost", "shipping_forward", "shipping_reverse",
+    "marketing_cost", "payment_fee", "net_profit", "rto_loss", "lost_loss", "courier_status", "final_status", "status",
+)
+PROFIT_BATCH_SIZE = 1000
+
+
+def _profit_values(
+    order_total,
+    order_status,
+    items: list[tuple[str, int]],
+    cost_by_sku: dict[str, tuple[Decimal, Decimal]],
+    shipment_status,
+    forward_cost,
+    reverse_cost,
+    marketing_cost: Decimal,
+    order_id: str = "",
+) -> dict:
     """
-    Compute profit for an order and upsert order_profit.
-    Uses shipment status (DELIVERED, RTO_DONE, RTO_INITIATED, LOST) and order status (CANCELLED) for rules.
-    Returns OrderProfit row or None if order not found.
+    Pure profit rules for one order (no DB access). items: (sku, qty); cost_by_sku: sku -> (unit product, unit packaging).
+    shipment_status is None when the order has no shipment. Returns OrderProfit column values.
     """
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        return None
-
-    revenue = Decimal(str(order.order_total or 0))
+    revenue = Decimal(str(order_total or 0))
     product_cost = Decimal("0")
     packaging_cost = Decimal("0")
     shipping_forward = Decimal("0")
     shipping_reverse = Decimal("0")
-    marketing_cost = Decimal("0")
     payment_fee = Decimal("0")
     status = "computed"
     missing_skus: list[str] = []
@@ -62,17 +70,15 @@ def compute_profit_for_order(db: Session, order_id: str) -> OrderProfit | None:
     lost_loss = Decimal("0")
 
     # Product + packaging from SKU costs
-    for item in order.items or []:
-        sku = (item.sku or "").strip()
-        qty = int(item.qty or 0)
+    for sku, qty in items:
+        sku = (sku or "").strip()
+        qty = int(qty or 0)
         if not sku or qty <= 0:
             continue
-        cost_row = db.query(SkuCost).filter(SkuCost.sku == sku).first()
-        if cost_row:
-            unit_product = Decimal(str(cost_row.product_cost or 0))
-            unit_packaging = Decimal(str(cost_row.packaging_cost or 0))
-            product_cost += unit_product * qty
-            packaging_cost += unit_packaging * qty
+        costs = cost_by_sku.get(sku)
+        if costs:
+            product_cost += costs[0] * qty
+            packaging_cost += costs[1] * qty
         else:
             missing_skus.append(sku)
 
@@ -81,34 +87,29 @@ def compute_profit_for_order(db: Session, order_id: str) -> OrderProfit | None:
         logger.debug("Order %s profit: missing sku_costs for %s", order_id, missing_skus[:5])
 
     # Shipment: forward/reverse cost and courier status
-    shipment = db.query(Shipment).filter(Shipment.order_id == order_id).first()
-    if shipment:
-        shipping_forward = Decimal(str(shipment.forward_cost or 0))
-        shipping_reverse = Decimal(str(shipment.reverse_cost or 0))
-        courier_status = shipment.status.value if hasattr(shipment.status, "value") else str(shipment.status)
-
-    # Marketing: blended CAC from ad_spend_daily for order date
-    order_date = order.created_at.date() if order.created_at else None
-    if order_date:
-        marketing_cost = _get_daily_cac(db, order_date)
+    has_shipment = shipment_status is not None
+    if has_shipment:
+        shipping_forward = Decimal(str(forward_cost or 0))
+        shipping_reverse = Decimal(str(reverse_cost or 0))
+        courier_status = shipment_status.value if hasattr(shipment_status, "value") else str(shipment_status)
 
     # Apply rules by final status
-    if order.status == OrderStatus.CANCELLED and (not shipment or shipment.status == ShipmentStatus.CREATED):
+    if order_status == OrderStatus.CANCELLED and (not has_shipment or shipment_status == ShipmentStatus.CREATED):
         # Cancelled (pre-ship): loss = marketing + payment
         final_status = "CANCELLED"
         net_profit = -(marketing_cost + payment_fee)
         revenue = Decimal("0")
-    elif shipment and shipment.status == ShipmentStatus.DELIVERED:
+    elif shipment_status == ShipmentStatus.DELIVERED:
         # Delivered: profit = revenue - all costs
         final_status = "DELIVERED"
         net_profit = revenue - product_cost - packaging_cost - shipping_forward - marketing_cost - payment_fee
-    elif shipment and shipment.status in (ShipmentStatus.RTO_DONE, ShipmentStatus.RTO_INITIATED):
+    elif shipment_status in (ShipmentStatus.RTO_DONE, ShipmentStatus.RTO_INITIATED):
         # RTO: loss = product + packaging + forward + reverse + marketing; revenue = 0
-        final_status = "RTO_DONE" if shipment.status == ShipmentStatus.RTO_DONE else "RTO_INITIATED"
+        final_status = "RTO_DONE" if shipment_status == ShipmentStatus.RTO_DONE else "RTO_INITIATED"
         rto_loss = product_cost + packaging_cost + shipping_forward + shipping_reverse + marketing_cost
         net_profit = -rto_loss
         revenue = Decimal("0")
-    elif shipment and shipment.status == ShipmentStatus.LOST:
+    elif shipment_status == ShipmentStatus.LOST:
         # Lost: loss = product + packaging + forward
         final_status = "LOST"
         lost_loss = product_cost + packaging_cost + shipping_forward
@@ -116,51 +117,161 @@ def compute_profit_for_order(db: Session, order_id: str) -> OrderProfit | None:
         revenue = Decimal("0")
     else:
         # Pending / In Transit / CREATED / SHIPPED: standard formula (revenue - costs)
-        if shipment and shipment.status == ShipmentStatus.IN_TRANSIT:
+        if shipment_status == ShipmentStatus.IN_TRANSIT:
             final_status = "IN_TRANSIT"
-        elif shipment and shipment.status == ShipmentStatus.SHIPPED:
+        elif shipment_status == ShipmentStatus.SHIPPED:
             final_status = "SHIPPED"
         net_profit = revenue - product_cost - packaging_cost - shipping_forward - marketing_cost - payment_fee
 
-    # Keep shipping_cost in sync with forward for backward compat
-    shipping_cost = shipping_forward
+    return {
+        "revenue": revenue,
+        "product_cost": product_cost,
+        "packaging_cost": packaging_cost,
+        # Keep shipping_cost in sync with forward for backward compat
+        "shipping_cost": shipping_forward,
+        "shipping_forward": shipping_forward,
+        "shipping_reverse": shipping_reverse,
+        "marketing_cost": marketing_cost,
+        "payment_fee": payment_fee,
+        "net_profit": net_profit,
+        "rto_loss": rto_loss,
+        "lost_loss": lost_loss,
+        "courier_status": courier_status,
+        "final_status": final_status,
+        "status": status,
+    }
+
+
+def compute_profit_for_order(db: Session, order_id: str) -> OrderProfit | None:
+    """
+    Compute profit for an order and upsert order_profit.
+    Uses shipment status (DELIVERED, RTO_DONE, RTO_INITIATED, LOST) and order status (CANCELLED) for rules.
+    Returns OrderProfit row or None if order not found.
+    """
+    order = db.query(Order).filter(Order.id == order_id).first()
+    if not order:
+        return None
+
+    items = [(item.sku, item.qty) for item in order.items or []]
+    skus = {(sku or "").strip() for sku, _ in items if (sku or "").strip()}
+    cost_by_sku = {
+        c.sku: (Decimal(str(c.product_cost or 0)), Decimal(str(c.packaging_cost or 0)))
+        for c in (db.query(SkuCost).filter(SkuCost.sku.in_(skus)).all() if skus else [])
+    }
+    shipment = db.query(Shipment).filter(Shipment.order_id == order_id).first()
+
+    # Marketing: blended CAC from daily_cac for the order's IST date
+    order_date = order.order_date_ist or (ist_date(order.created_at) if order.created_at else None)
+    marketing_cost = _get_daily_cac(db, order_date) if order_date else Decimal("0")
+
+    values = _profit_values(
+        order.order_total,
+        order.status,
+        items,
+        cost_by_sku,
+        shipment.status if shipment else None,
+        shipment.forward_cost if shipment else None,
+        shipment.reverse_cost if shipment else None,
+        marketing_cost,
+        order_id=order_id,
+    )
 
     existing = db.query(OrderProfit).filter(OrderProfit.order_id == order_id).first()
     if existing:
-        existing.revenue = revenue
-        existing.product_cost = product_cost
-        existing.packaging_cost = packaging_cost
-        existing.shipping_cost = shipping_cost
-        existing.shipping_forward = shipping_forward
-        existing.shipping_reverse = shipping_reverse
-        existing.marketing_cost = marketing_cost
-        existing.payment_fee = payment_fee
-        existing.net_profit = net_profit
-        existing.rto_loss = rto_loss
-        existing.lost_loss = lost_loss
-        existing.courier_status = courier_status
-        existing.final_status = final_status
-        existing.status = status
+        for field in _PROFIT_FIELDS:
+            setattr(existing, field, values[field])
         db.flush()
         return existing
-    else:
-        row = OrderProfit(
-            order_id=order_id,
-            revenue=revenue,
-            product_cost=product_cost,
-            packaging_cost=packaging_cost,
-            shipping_cost=shipping_cost,
-            shipping_forward=shipping_forward,
-            shipping_reverse=shipping_reverse,
-            marketing_cost=marketing_cost,
-            payment_fee=payment_fee,
-            net_profit=net_profit,
-            rto_loss=rto_loss,
-            lost_loss=lost_loss,
-            courier_status=courier_status,
-            final_status=final_status,
-            status=status,
+    row = OrderProfit(order_id=order_id, **values)
+    db.add(row)
+    db.flush()
+    return row
+
+
+def compute_profit_for_orders(db: Session, order_ids, batch_size: int = PROFIT_BATCH_SIZE) -> int:
+    """
+    Batch version of compute_profit_for_order: per chunk of order ids, load orders, items, SKU costs,
+    shipments, CAC and existing order_profit rows in a handful of queries, apply the same rules in memory,
+    then bulk insert/update order_profit. Flushes; caller commits. Returns number of orders computed.
+    """
+    ids = list(dict.fromkeys(str(oid) for oid in order_ids if oid))
+    cac_cache: dict[date, Decimal] = {}
+    computed = 0
+    for i in range(0, len(ids), batch_size):
+        chunk = ids[i:i + batch_size]
+        orders = (
+            db.query(Order.id, Order.channel_account_id, Order.order_total, Order.status, Order.created_at, Order.order_date_ist)
+            .filter(Order.id.in_(chunk))
+            .all()
         )
-        db.add(row)
+        if not orders:
+            continue
+
+        items_by_order: dict[str, list[tuple[str, int]]] = {}
+        skus: set[str] = set()
+        for oid, sku, qty in db.query(OrderItem.order_id, OrderItem.sku, OrderItem.qty).filter(OrderItem.order_id.in_(chunk)):
+            items_by_order.setdefault(oid, []).append((sku, qty))
+            if (sku or "").strip():
+                skus.add(sku.strip())
+
+        cost_by_sku = {
+            sku: (Decimal(str(pc or 0)), Decimal(str(pk or 0)))
+            for sku, pc, pk in (
+                db.query(SkuCost.sku, SkuCost.product_cost, SkuCost.packaging_cost).filter(SkuCost.sku.in_(skus))
+                if skus else []
+            )
+        }
+        shipment_by_order = {
+            oid: (st, fwd, rev)
+            for oid, st, fwd, rev in db.query(
+                Shipment.order_id, Shipment.status, Shipment.forward_cost, Shipment.reverse_cost
+            ).filter(Shipment.order_id.in_(chunk))
+        }
+        order_days = {
+            o.id: o.order_date_ist or (ist_date(o.created_at) if o.created_at else None) for o in orders
+        }
+        cac_cache.update(get_daily_cac_map(db, set(order_days.values()) - cac_cache.keys()))
+        existing_by_order = {
+            row.order_id: row
+            for row in db.query(
+                OrderProfit.order_id, OrderProfit.id, *(getattr(OrderProfit, f) for f in ROLLUP_PROFIT_FIELDS)
+            ).filter(OrderProfit.order_id.in_(chunk))
+        }
+
+        inserts: list[dict] = []
+        updates: list[dict] = []
+        rollup_changes = []
+        for o in orders:
+            shipment = shipment_by_order.get(o.id)
+            marketing_cost = cac_cache.get(order_days[o.id], Decimal("0"))
+            values = _profit_values(
+                o.order_total,
+                o.status,
+                items_by_order.get(o.id, []),
+                cost_by_sku,
+                shipment[0] if shipment else None,
+                shipment[1] if shipment else None,
+                shipment[2] if shipment else None,
+                marketing_cost,
+                order_id=o.id,
+            )
+            existing = existing_by_order.get(o.id)
+            if existing:
+                updates.append({"id": existing.id, **values})
+            else:
+                inserts.append({"id": str(uuid.uuid4()), "order_id": o.id, **values})
+            rollup_changes.append((
+                (o.channel_account_id, order_days[o.id]),
+                {f: getattr(existing, f) for f in ROLLUP_PROFIT_FIELDS} if existing else None,
+                values,
+            ))
+        if updates:
+            db.bulk_update_mappings(OrderProfit, updates)
+        if inserts:
+            db.bulk_insert_mappings(OrderProfit, inserts)
         db.flush()
-        return row
+        # Bulk writes bypass the session hooks that keep daily_order_rollup / the analytics cache current
+        record_profit_changes(db, rollup_changes)
+        note_orders_changed(db, [o.id for o in orders])
+        computed += len(orders)
+    return computed
@@ -0,0 +1,182 @@
+"""
+Incremental profit invalidation: track which order_profit rows a committed write made stale and
+recompute only those in the background.
+Dependencies: SkuCost (sku -> orders via order_items.sku), AdSpendDaily and orders inserted, deleted or
+moved to/from CANCELLED (IST day -> orders via orders.order_date_ist, i.e. CAC spend or divisor), Shipment (status/forward/reverse cost -> its order).
+A Session hook records changes at flush time and enqueues them after commit (discarded on rollback);
+the worker coalesces everything queued within PROFIT_RECOMPUTE_DEBOUNCE_SEC into one batch run of
+compute_profit_for_orders. The queue is in-process; /profit/recompute remains the full fallback.
+"""
+import asyncio
+import logging
+import threading
+from datetime import date
+from typing import Iterable, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import AdSpendDaily, Order, OrderItem, OrderStatus, Shipment, SkuCost, ist_date
+
+logger = logging.getLogger(__name__)
+
+_INFO_KEY = "profit_invalidations"
+_SKU_COST_FIELDS = ("product_cost", "packaging_cost")
+_SHIPMENT_FIELDS = ("status", "forward_cost", "reverse_cost")
+RESOLVE_CHUNK = 500
+
+_lock = threading.Lock()
+_pending_orders: set[str] = set()
+_pending_skus: set[str] = set()
+_pending_days: set[date] = set()
+_wakeup: Optional[asyncio.Event] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _notify() -> None:
+    if _wakeup is None or _loop is None:
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is _loop:
+        _wakeup.set()
+    elif _loop.is_running():
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+def enqueue_profit_recompute(
+    order_ids: Iterable[str] = (),
+    skus: Iterable[str] = (),
+    days: Iterable[date] = (),
+) -> None:
+    """Queue profit recompute for orders directly, for orders containing skus, or for orders on IST days."""
+    with _lock:
+        _pending_orders.update(str(o) for o in order_ids if o)
+        _pending_skus.update(s for s in skus if s)
+        _pending_days.update(d for d in days if d)
+        queued = bool(_pending_orders or _pending_skus or _pending_days)
+    if queued:
+        _notify()
+
+
+def pending_counts() -> dict:
+    with _lock:
+        return {"orders": len(_pending_orders), "skus": len(_pending_skus), "days": len(_pending_days)}
+
+
+def _changed(obj, fields: tuple[str, ...]) -> bool:
+    attrs = inspect(obj).attrs
+    return any(attrs[f].history.has_changes() for f in fields)
+
+
+def _order_day(order: Order) -> date:
+    # before_flush runs ahead of the before_insert hook that sets order_date_ist on new orders
+    return order.order_date_ist or ist_date(order.created_at)
+
+
+def _cancel_flip(order: Order) -> bool:
+    """Status moved to or from CANCELLED (an unloaded previous status counts), changing the day's CAC divisor."""
+    hist = inspect(order).attrs.status.history
+    if not hist.has_changes():
+        return False
+    if not hist.deleted:
+        return True
+    return (hist.deleted[0] == OrderStatus.CANCELLED) != (order.status == OrderStatus.CANCELLED)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_profit_dependencies(session: Session, flush_context, instances) -> None:
+    found = session.info.setdefault(_INFO_KEY, {"orders": set(), "skus": set(), "days": set()})
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, SkuCost):
+            found["skus"].add(obj.sku)
+        elif isinstance(obj, AdSpendDaily):
+            found["days"].add(obj.date)
+        elif isinstance(obj, Shipment):
+            found["orders"].add(obj.order_id)
+        elif isinstance(obj, Order):
+            found["days"].add(_order_day(obj))
+    for obj in session.dirty:
+        if isinstance(obj, SkuCost) and _changed(obj, _SKU_COST_FIELDS):
+            found["skus"].add(obj.sku)
+        elif isinstance(obj, AdSpendDaily) and _changed(obj, ("spend",)):
+            found["days"].add(obj.date)
+        elif isinstance(obj, Shipment) and _changed(obj, _SHIPMENT_FIELDS):
+            found["orders"].add(obj.order_id)
+        elif isinstance(obj, Order) and _cancel_flip(obj):
+            found["days"].add(_order_day(obj))
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_on_commit(session: Session) -> None:
+    found = session.info.pop(_INFO_KEY, None)
+    if found and (found["orders"] or found["skus"] or found["days"]):
+        enqueue_profit_recompute(found["orders"], found["skus"], found["days"])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session) -> None:
+    session.info.pop(_INFO_KEY, None)
+
+
+def _resolve_order_ids(db: Session, order_ids: set[str], skus: set[str], days: set[date]) -> set[str]:
+    """Expand sku/day dependencies to order ids (indexed order_items.sku / orders.order_date_ist lookups)."""
+    resolved = set(order_ids)
+    sku_list = list(skus)
+    for i in range(0, len(sku_list), RESOLVE_CHUNK):
+        chunk = sku_list[i:i + RESOLVE_CHUNK]
+        resolved.update(oid for (oid,) in db.query(OrderItem.order_id).filter(OrderItem.sku.in_(chunk)).distinct())
+    if days:
+        resolved.update(oid for (oid,) in db.query(Order.id).filter(Order.order_date_ist.in_(days)))
+    return resolved
+
+
+def _recompute(order_ids: set[str], skus: set[str], days: set[date]) -> int:
+    from app.services.profit_calculator import compute_profit_for_orders
+
+    db = SessionLocal()
+    try:
+        ids = _resolve_order_ids(db, order_ids, skus, days)
+        count = compute_profit_for_orders(db, ids)
+        db.commit()
+        return count
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def run_profit_recompute_worker() -> None:
+    """Background loop: wait for invalidations, let more coalesce for the debounce window, recompute in a thread."""
+    global _wakeup, _loop
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+    if any(pending_counts().values()):
+        _wakeup.set()
+    logger.info("Profit recompute worker started (debounce=%ss)", settings.PROFIT_RECOMPUTE_DEBOUNCE_SEC)
+    while True:
+        await _wakeup.wait()
+        await asyncio.sleep(settings.PROFIT_RECOMPUTE_DEBOUNCE_SEC)
+        _wakeup.clear()
+        with _lock:
+            order_ids, skus, days = set(_pending_orders), set(_pending_skus), set(_pending_days)
+            _pending_orders.clear()
+            _pending_skus.clear()
+            _pending_days.clear()
+        if not (order_ids or skus or days):
+            continue
+        try:
+            count = await asyncio.to_thread(_recompute, order_ids, skus, days)
+            logger.info(
+                "Profit recompute: %s order(s) from %s order / %s sku / %s day invalidation(s)",
+                count, len(order_ids), len(skus), len(days),
+            )
+        except Exception as e:
+            logger.exception("Profit recompute batch failed; re-queueing: %s", e)
+            enqueue_profit_recompute(order_ids, skus, days)
+            await asyncio.sleep(settings.PROFIT_RECOMPUTE_DEBOUNCE_SEC * 10)
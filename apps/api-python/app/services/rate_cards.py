@@ -0,0 +1,330 @@
+"""
+Rate-card engine: shipping cost from versioned courier rate cards instead of per-AWB cost API calls.
+forward_cost = slab charge for (zone, chargeable weight) + COD fee (max of fixed fee and % of order total) on
+COD orders; reverse_cost = slab charge x rto_multiplier (profit only counts it on RTO). Costs are set when the
+shipment is created, so profit is available immediately; reconcile_shipping_costs (periodic batch) later
+replaces the estimate with invoiced amounts (courier invoice CSV) or the courier-reported cost already stored
+from tracking. Zones follow the usual Indian courier scheme from origin/destination pincodes: A same city,
+B same postal circle, C metro to metro, E special (J&K, North East, islands), D rest of India.
+"""
+import logging
+import math
+import re
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Optional
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import (
+    SHIPMENT_FINAL_STATUSES,
+    ChannelAccount,
+    CourierInvoiceLine,
+    Order,
+    OrderItem,
+    PaymentMode,
+    ProductVariant,
+    RateCard,
+    Shipment,
+    ShipmentTracking,
+)
+from app.services.selloship_service import parse_shipping_cost
+from app.services.shipment_schedule import utcnow
+
+logger = logging.getLogger(__name__)
+
+ZONES = ("A", "B", "C", "D", "E")
+COST_SOURCE_MANUAL = "manual"
+COST_SOURCE_RATE_CARD = "rate_card"
+COST_SOURCE_COURIER = "courier"
+COST_SOURCE_INVOICE = "invoice"
+RESOLVE_CHUNK = 500
+
+# First three pincode digits of the metro cities (Delhi, Mumbai, Kolkata, Chennai, Bengaluru, Hyderabad,
+# Ahmedabad, Pune) and prefixes couriers bill as special zone (J&K/Ladakh, North East, Andaman)
+_METRO_PREFIXES = frozenset({"110", "400", "700", "600", "560", "500", "380", "411"})
+_SPECIAL_PREFIXES = ("18", "19", "78", "79", "744")
+_PINCODE_RE = re.compile(r"(?<!\d)([1-9]\d{5})(?!\d)")
+_CENT = Decimal("0.01")
+
+
+def courier_key(courier_name: Optional[str]) -> str:
+    return (courier_name or "").strip().lower()
+
+
+def extract_pincode(address: Optional[str]) -> Optional[str]:
+    """Last 6-digit Indian pincode in a formatted address (city, province, zip, country come last)."""
+    matches = _PINCODE_RE.findall(address or "")
+    return matches[-1] if matches else None
+
+
+def zone_for(origin_pincode: Optional[str], destination_pincode: Optional[str]) -> str:
+    """Courier zone (A-E) for a lane; RATE_CARD_DEFAULT_ZONE when either pincode is unknown."""
+    if not origin_pincode or not destination_pincode:
+        return settings.RATE_CARD_DEFAULT_ZONE
+    if destination_pincode.startswith(_SPECIAL_PREFIXES):
+        return "E"
+    if origin_pincode[:3] == destination_pincode[:3]:
+        return "A"
+    if origin_pincode[:2] == destination_pincode[:2]:
+        return "B"
+    if origin_pincode[:3] in _METRO_PREFIXES and destination_pincode[:3] in _METRO_PREFIXES:
+        return "C"
+    return "D"
+
+
+def validate_zones(zones: Any) -> dict:
+    """
+    Normalize a rate card's zones: {zone: {"slabs": [{"upto_grams", "charge"}], "additional_charge"}}.
+    Slabs are sorted by weight. Raises ValueError with a user-facing message.
+    """
+    if not isinstance(zones, dict) or not zones:
+        raise ValueError("zones must be an object keyed by zone (A-E)")
+    out: dict[str, dict] = {}
+    for zone, conf in zones.items():
+        zone = str(zone).strip().upper()
+        if zone not in ZONES:
+            raise ValueError(f"Unknown zone {zone!r}; use one of {', '.join(ZONES)}")
+        slabs = (conf or {}).get("slabs") if isinstance(conf, dict) else None
+        if not isinstance(slabs, list) or not slabs:
+            raise ValueError(f"Zone {zone}: at least one weight slab is required")
+        try:
+            parsed = sorted(
+                ({"upto_grams": int(s["upto_grams"]), "charge": float(s["charge"])} for s in slabs),
+                key=lambda s: s["upto_grams"],
+            )
+            additional = float(conf.get("additional_charge") or 0)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Zone {zone}: each slab needs numeric upto_grams and charge")
+        if any(s["upto_grams"] <= 0 or s["charge"] < 0 for s in parsed) or additional < 0:
+            raise ValueError(f"Zone {zone}: weights must be positive and charges non-negative")
+        out[zone] = {"slabs": parsed, "additional_charge": additional}
+    return out
+
+
+def _money(value: Any) -> Decimal:
+    return Decimal(str(value or 0)).quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+def quote(card: RateCard, zone: str, weight_grams: int, cod: bool, order_total: Any = 0) -> Optional[dict]:
+    """Forward/reverse cost for one parcel on this card, or None when the card has no rates for the zone."""
+    conf = (card.zones or {}).get(zone)
+    if not conf or not conf.get("slabs"):
+        return None
+    weight = max(int(weight_grams or 0), 1)
+    slabs = conf["slabs"]
+    slab = next((s for s in slabs if weight <= s["upto_grams"]), None)
+    if slab is not None:
+        freight = _money(slab["charge"])
+    else:
+        # Beyond the heaviest slab: its charge plus additional_charge per started additional_slab_grams
+        top = slabs[-1]
+        step = max(int(card.additional_slab_grams or 500), 1)
+        extra = math.ceil((weight - top["upto_grams"]) / step)
+        freight = _money(top["charge"]) + _money(conf.get("additional_charge")) * extra
+    cod_fee = Decimal("0")
+    if cod:
+        pct_fee = _money(Decimal(str(order_total or 0)) * Decimal(str(card.cod_percent or 0)) / 100)
+        cod_fee = max(_money(card.cod_fixed_fee), pct_fee)
+    return {
+        "zone": zone,
+        "weight_grams": weight,
+        "freight": freight,
+        "cod_fee": cod_fee,
+        "forward_cost": freight + cod_fee,
+        "reverse_cost": _money(freight * Decimal(str(card.rto_multiplier or 1))),
+    }
+
+
+def find_rate_card(db: Session, user_id: str, courier_name: Optional[str], at: Optional[datetime] = None) -> Optional[RateCard]:
+    """The user's card version in force at `at` for this courier (card courier contained in courier_name)."""
+    name = courier_key(courier_name)
+    if not user_id or not name:
+        return None
+    cards = (
+        db.query(RateCard)
+        .filter(RateCard.user_id == user_id, RateCard.effective_from <= (at or utcnow()))
+        .order_by(RateCard.effective_from.desc(), RateCard.version.desc())
+        .all()
+    )
+    return next((c for c in cards if c.courier in name), None)
+
+
+def chargeable_weights(db: Session, order_ids: list[str]) -> dict[str, int]:
+    """order_id -> total item weight in grams (RATE_CARD_DEFAULT_ITEM_WEIGHT_GRAMS per unit without a variant weight)."""
+    default = settings.RATE_CARD_DEFAULT_ITEM_WEIGHT_GRAMS
+    weights: dict[str, int] = {}
+    for i in range(0, len(order_ids), RESOLVE_CHUNK):
+        chunk = order_ids[i:i + RESOLVE_CHUNK]
+        rows = (
+            db.query(OrderItem.order_id, func.sum(OrderItem.qty * func.coalesce(ProductVariant.weight_grams, default)))
+            .outerjoin(ProductVariant, OrderItem.variant_id == ProductVariant.id)
+            .filter(OrderItem.order_id.in_(chunk))
+            .group_by(OrderItem.order_id)
+            .all()
+        )
+        weights.update({oid: int(total or 0) for oid, total in rows})
+    return {oid: weights.get(oid) or default for oid in order_ids}
+
+
+def _order_owner(db: Session, order: Order) -> Optional[str]:
+    if not order.channel_account_id:
+        return None
+    return db.query(ChannelAccount.user_id).filter(ChannelAccount.id == order.channel_account_id).scalar()
+
+
+def apply_rate_card(
+    db: Session,
+    shipment: Shipment,
+    order: Order,
+    user_id: Optional[str] = None,
+    zone: Optional[str] = None,
+    weight_grams: Optional[int] = None,
+    card: Optional[RateCard] = None,
+) -> bool:
+    """
+    Cost a shipment from the order owner's rate card (user_id is the fallback owner). zone / weight_grams
+    override the pincode lookup and item weights. Returns False (shipment untouched) when no card applies.
+    Caller commits.
+    """
+    owner = _order_owner(db, order) or user_id
+    card = card or find_rate_card(db, owner, shipment.courier_name, shipment.shipped_at or shipment.created_at)
+    if card is None:
+        return False
+    if zone:
+        zone = zone.strip().upper()
+    else:
+        origin = card.origin_pincode or settings.RATE_CARD_ORIGIN_PINCODE or None
+        zone = zone_for(origin, extract_pincode(order.shipping_address))
+    if not weight_grams:
+        weight_grams = chargeable_weights(db, [order.id])[order.id]
+    result = quote(card, zone, weight_grams, order.payment_mode == PaymentMode.COD, order.order_total)
+    if result is None:
+        logger.info("Rate card %s v%s has no rates for zone %s (order %s)", card.courier, card.version, zone, order.id)
+        return False
+    shipment.rate_card_id = card.id
+    shipment.shipping_zone = result["zone"]
+    shipment.chargeable_weight_grams = result["weight_grams"]
+    shipment.forward_cost = result["forward_cost"]
+    shipment.reverse_cost = result["reverse_cost"]
+    shipment.cost_source = COST_SOURCE_RATE_CARD
+    return True
+
+
+def estimate_missing_costs(db: Session, user_id: str, card: RateCard, limit: int = 5000) -> int:
+    """
+    Cost the user's shipments of the card's courier that were never costed (no cost source, zero forward cost),
+    e.g. shipped before the first card was uploaded. Commits; profit recompute is queued by profit_queue.
+    """
+    rows = (
+        db.query(Shipment, Order)
+        .join(Order, Shipment.order_id == Order.id)
+        .join(ChannelAccount, Order.channel_account_id == ChannelAccount.id)
+        .filter(
+            ChannelAccount.user_id == user_id,
+            Shipment.courier_name.ilike(f"%{card.courier}%"),
+            Shipment.cost_source.is_(None),
+            Shipment.forward_cost == 0,
+        )
+        .limit(limit)
+        .all()
+    )
+    weights = chargeable_weights(db, [order.id for _, order in rows])
+    costed = 0
+    for shipment, order in rows:
+        if apply_rate_card(db, shipment, order, user_id, weight_grams=weights[order.id], card=card):
+            costed += 1
+    db.commit()
+    return costed
+
+
+def _reconcile_invoices(db: Session, user_id: Optional[str], limit: int, now: datetime) -> dict:
+    query = db.query(CourierInvoiceLine).filter(CourierInvoiceLine.reconciled_at.is_(None))
+    if user_id:
+        query = query.filter(CourierInvoiceLine.user_id == user_id)
+    lines = query.order_by(CourierInvoiceLine.created_at).limit(limit).all()
+    if not lines:
+        return {"invoice_lines": 0, "matched": 0, "unmatched": 0, "variance": Decimal("0")}
+    users = list({line.user_id for line in lines})
+    awbs = list({line.awb_number for line in lines})
+    shipments: dict[tuple[str, str], list[Shipment]] = {}
+    for i in range(0, len(awbs), RESOLVE_CHUNK):
+        rows = (
+            db.query(Shipment, ChannelAccount.user_id)
+            .join(Order, Shipment.order_id == Order.id)
+            .join(ChannelAccount, Order.channel_account_id == ChannelAccount.id)
+            .filter(ChannelAccount.user_id.in_(users), Shipment.awb_number.in_(awbs[i:i + RESOLVE_CHUNK]))
+            .all()
+        )
+        for shipment, owner in rows:
+            shipments.setdefault((owner, (shipment.awb_number or "").strip()), []).append(shipment)
+    matched = 0
+    variance = Decimal("0")
+    for line in lines:
+        shipment = next(
+            (s for s in shipments.get((line.user_id, line.awb_number), []) if line.courier in courier_key(s.courier_name)),
+            None,
+        )
+        line.reconciled_at = now
+        if shipment is None:
+            continue
+        variance += _money(line.forward_cost) - _money(shipment.forward_cost)
+        shipment.forward_cost = line.forward_cost
+        if line.reverse_cost is not None:
+            shipment.reverse_cost = line.reverse_cost
+        shipment.cost_source = COST_SOURCE_INVOICE
+        shipment.cost_reconciled_at = now
+        line.shipment_id = shipment.id
+        matched += 1
+    return {"invoice_lines": len(lines), "matched": matched, "unmatched": len(lines) - matched, "variance": variance}
+
+
+def _reconcile_courier_reported(db: Session, user_id: Optional[str], limit: int, now: datetime) -> tuple[int, int]:
+    """
+    Final, not yet reconciled estimates: take the cost Selloship reported in the stored tracking payload.
+    Returns (shipments looked at, shipments updated).
+    """
+    query = (
+        db.query(Shipment, ShipmentTracking.raw_response)
+        .outerjoin(ShipmentTracking, ShipmentTracking.shipment_id == Shipment.id)
+        .filter(
+            Shipment.status.in_(SHIPMENT_FINAL_STATUSES),
+            Shipment.cost_reconciled_at.is_(None),
+            or_(Shipment.cost_source.is_(None), Shipment.cost_source == COST_SOURCE_RATE_CARD),
+        )
+    )
+    if user_id:
+        query = (
+            query.join(Order, Shipment.order_id == Order.id)
+            .join(ChannelAccount, Order.channel_account_id == ChannelAccount.id)
+            .filter(ChannelAccount.user_id == user_id)
+        )
+    rows = query.limit(limit).all()
+    updated = 0
+    for shipment, raw in rows:
+        # Marked either way: a final shipment is looked at once; a later invoice still overrides
+        shipment.cost_reconciled_at = now
+        cost = parse_shipping_cost(raw) if "selloship" in courier_key(shipment.courier_name) else None
+        if not cost or not cost["forward_cost"]:
+            continue
+        shipment.forward_cost = cost["forward_cost"]
+        shipment.reverse_cost = cost["reverse_cost"] or shipment.reverse_cost
+        shipment.cost_source = COST_SOURCE_COURIER
+        updated += 1
+    return len(rows), updated
+
+
+def reconcile_shipping_costs(db: Session, user_id: Optional[str] = None, limit: int = 5000) -> dict:
+    """
+    Periodic batch: apply pending courier invoice lines, then courier-reported costs of final shipments.
+    One commit; the profit recompute for orders whose cost changed is queued by profit_queue.
+    Returns { invoice_lines, matched, unmatched, variance, final_checked, courier_reported }.
+    """
+    now = utcnow()
+    result = _reconcile_invoices(db, user_id, limit, now)
+    result["final_checked"], result["courier_reported"] = _reconcile_courier_reported(db, user_id, limit, now)
+    db.commit()
+    result["variance"] = float(result["variance"])
+    return result
@@ -0,0 +1,164 @@
+"""
+Adaptive token-bucket rate limiter for outbound marketplace and courier APIs.
+One bucket per (provider, account), and per operation for Amazon (SP-API limits each operation
+separately); refill rate and capacity adapt from response headers (X-Shopify-Shop-Api-Call-Limit,
+x-amzn-RateLimit-Limit) and 429 Retry-After. At most MAX_BUCKETS are kept (least recently used dropped).
+Wired into pooled clients in app/services/http_client.py via httpx event hooks.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# (burst capacity, refill per second). Shopify REST: 40 bucket leaking 2/s on standard plans;
+# Amazon getOrders: burst 20, 0.0167/s (header overrides). Others are conservative defaults.
+PROVIDER_LIMITS: dict[str, tuple[float, float]] = {
+    "shopify": (40.0, 2.0),
+    "amazon": (20.0, 0.0167),
+    "flipkart": (10.0, 5.0),
+    "myntra": (10.0, 5.0),
+    "meta": (20.0, 5.0),
+    "delhivery": (10.0, 5.0),
+    "selloship": (10.0, 5.0),
+}
+DEFAULT_LIMIT = (10.0, 5.0)
+# SP-API usage plans per operation (normalized path, see operation_key); unknown operations use PROVIDER_LIMITS
+AMAZON_OPERATION_LIMITS: dict[str, tuple[float, float]] = {
+    "/orders/v0/orders": (20.0, 0.0167),
+    "/orders/v0/orders/*": (30.0, 0.5),
+    "/orders/v0/orders/*/orderitems": (30.0, 0.5),
+    "/orders/v0/orders/*/address": (30.0, 0.5),
+    "/orders/v0/orders/*/buyerinfo": (30.0, 0.5),
+}
+# Buckets idle long enough to be evicted are full again, so dropping them loses no state
+MAX_BUCKETS = 5000
+DEFAULT_RETRY_AFTER = 2.0
+# Headers that identify the calling account when the host is shared across sellers
+_ACCOUNT_HEADERS = ("authorization", "x-amz-access-token", "api-key", "x-api-key")
+
+
+class TokenBucket:
+    """Token bucket with a FIFO wait: acquire() blocks until a token is free and no 429 pause is active."""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate if self.rate > 0 else DEFAULT_RETRY_AFTER
+                await asyncio.sleep(min(wait, 60.0))
+
+    def observe(self, response: httpx.Response) -> None:
+        """Adapt to what the server reports about our remaining budget."""
+        now = time.monotonic()
+        self._refill(now)
+        headers = response.headers
+        call_limit = headers.get("x-shopify-shop-api-call-limit")
+        if call_limit:
+            used, _, size = call_limit.partition("/")
+            try:
+                self.capacity = float(size)
+                self.tokens = min(self.tokens, max(0.0, float(size) - float(used)))
+            except ValueError:
+                pass
+        amz_rate = headers.get("x-amzn-ratelimit-limit")
+        if amz_rate:
+            try:
+                self.rate = float(amz_rate)
+            except ValueError:
+                pass
+        if response.status_code == 429:
+            retry_after = _parse_retry_after(headers.get("retry-after"))
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.tokens = 0.0
+
+
+def _parse_retry_after(value: Optional[str]) -> float:
+    try:
+        return max(0.0, float(value)) if value else DEFAULT_RETRY_AFTER
+    except ValueError:
+        return DEFAULT_RETRY_AFTER
+
+
+_buckets: "OrderedDict[tuple[str, str, str], TokenBucket]" = OrderedDict()
+_ID_SEGMENT = re.compile(r"\d")
+_VERSION_SEGMENT = re.compile(r"^(v\d+|\d{4}-\d{2}-\d{2})$")
+
+
+def operation_key(provider: str, request: httpx.Request) -> str:
+    """Amazon: request path with id segments (order ids, ASINs, seller ids) as '*'; other providers share one bucket."""
+    if provider != "amazon":
+        return ""
+    segments = [
+        seg if _VERSION_SEGMENT.match(seg) or not _ID_SEGMENT.search(seg) else "*"
+        for seg in request.url.path.lower().strip("/").split("/")
+    ]
+    return "/" + "/".join(segments)
+
+
+def get_bucket(provider: str, account: str, operation: str = "") -> TokenBucket:
+    key = (provider, account, operation)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        capacity, rate = AMAZON_OPERATION_LIMITS.get(operation) or PROVIDER_LIMITS.get(provider, DEFAULT_LIMIT)
+        bucket = TokenBucket(capacity, rate)
+        _buckets[key] = bucket
+        while len(_buckets) > MAX_BUCKETS:
+            _buckets.popitem(last=False)
+    else:
+        _buckets.move_to_end(key)
+    return bucket
+
+
+def account_key(request: httpx.Request) -> str:
+    """Shopify shops have their own host; for shared hosts, fingerprint the credential header."""
+    host = request.url.host or ""
+    for name in _ACCOUNT_HEADERS:
+        value = request.headers.get(name)
+        if value:
+            return f"{host}:{hashlib.sha1(value.encode()).hexdigest()[:12]}"
+    return host
+
+
+def event_hooks(provider: str) -> dict:
+    """httpx event hooks that throttle requests and adapt buckets from responses."""
+
+    async def _before(request: httpx.Request) -> None:
+        await get_bucket(provider, account_key(request), operation_key(provider, request)).acquire()
+
+    async def _after(response: httpx.Response) -> None:
+        request = response.request
+        bucket = get_bucket(provider, account_key(request), operation_key(provider, request))
+        bucket.observe(response)
+        if response.status_code == 429:
+            logger.warning(
+                "Rate limited by %s (%s); pausing %.1fs",
+                provider, response.request.url.host, _parse_retry_after(response.headers.get("retry-after")),
+            )
+
+    return {"request": [_before], "response": [_after]}
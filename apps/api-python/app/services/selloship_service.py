@@ -13,8 +13,9 @@ from typing import Any, Optional
 import httpx
 
 from app.config import settings
-from app.services.http_client import get_with_retry, post_no_retry
+from app.services.http_client import get_client, get_with_retry, post_no_retry
 from app.models import ShipmentStatus
+from app.services.shipment_schedule import parse_courier_time
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +60,67 @@ def map_selloship_status(raw_status: Optional[str]) -> ShipmentStatus:
     )
 
 
+def parse_waybill_detail(detail: dict, awb_fallback: str) -> dict:
+    """
+    Parse one entry from waybillDetails[] per Base.com spec:
+    waybill, currentStatus, statusDate, current_location
+    """
+    waybill = (detail.get("waybill") or awb_fallback or "").strip()
+    current_status = detail.get("currentStatus") or detail.get("current_status") or ""
+    status_date = detail.get("statusDate") or detail.get("status_date")
+    current_location = detail.get("current_location") or detail.get("currentLocation")
+    internal = map_selloship_status(current_status)
+    return {
+        "waybill": waybill,
+        "status": internal.value,
+        "raw_status": current_status,
+        "status_date": status_date,
+        "event_at": parse_courier_time(status_date),
+        "current_location": current_location,
+        "delivery_status": None,
+        "rto_status": None,
+        "scan": [],
+        "error": None,
+        "raw_response": detail,
+    }
+
+
+def parse_push_payload(payload: Any) -> list[dict]:
+    """
+    Status push body -> normalized results. Accepts the waybillDetails shape ({"waybillDetails": [...]}),
+    a single detail object ({"waybill": ..., "currentStatus": ...}) or a list of details.
+    """
+    if isinstance(payload, dict):
+        details = payload.get("waybillDetails") or payload.get("waybill_details")
+        entries = details if isinstance(details, list) else [payload]
+    elif isinstance(payload, list):
+        entries = payload
+    else:
+        entries = []
+    results = []
+    for detail in entries:
+        if isinstance(detail, dict) and (detail.get("waybill") or "").strip():
+            results.append(parse_waybill_detail(detail, ""))
+    return results
+
+
+def parse_shipping_cost(raw: Any) -> Optional[dict]:
+    """
+    Courier-reported cost from a waybillDetails response (also stored in ShipmentTracking.raw_response).
+    Returns { "forward_cost": Decimal, "reverse_cost": Decimal } or None when the response carries no cost.
+    """
+    if not isinstance(raw, dict):
+        return None
+    forward = raw.get("forward_cost") or raw.get("shipping_cost") or raw.get("cost")
+    if forward is None:
+        return None
+    reverse = raw.get("reverse_cost") or raw.get("rto_cost") or 0
+    try:
+        return {"forward_cost": Decimal(str(forward)), "reverse_cost": Decimal(str(reverse))}
+    except Exception:
+        return None
+
+
 def build_waybill_payload_from_order(
     order: Any,
     items: list[Any],
@@ -172,10 +234,10 @@ async def fetch_selloship_token(
     payload = {"username": username.strip(), "password": password}
     headers = {"Content-Type": "application/json"}
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.post(url, json=payload, headers=headers)
-            resp.raise_for_status()
-            data = resp.json()
+        client = get_client("selloship")
+        resp = await client.post(url, json=payload, headers=headers)
+        resp.raise_for_status()
+        data = resp.json()
     except Exception as e:
         logger.warning("Selloship fetch_selloship_token failed: %s", e)
         return None
@@ -241,10 +303,10 @@ class SelloshipService:
         payload = {"username": self.username, "password": self.password}
         headers = {"Content-Type": "application/json"}
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                resp = await client.post(url, json=payload, headers=headers)
-                resp.raise_for_status()
-                data = resp.json()
+            client = get_client("selloship")
+            resp = await client.post(url, json=payload, headers=headers)
+            resp.raise_for_status()
+            data = resp.json()
         except Exception as e:
             logger.warning("Selloship authToken failed: %s", e)
             return None
@@ -274,27 +336,7 @@ class SelloshipService:
         return headers
 
     def _parse_waybill_detail(self, detail: dict, awb_fallback: str) -> dict:
-        """
-        Parse one entry from waybillDetails[] per Base.com spec:
-        waybill, currentStatus, statusDate, current_location
-        """
-        waybill = (detail.get("waybill") or awb_fallback or "").strip()
-        current_status = detail.get("currentStatus") or detail.get("current_status") or ""
-        status_date = detail.get("statusDate") or detail.get("status_date")
-        current_location = detail.get("current_location") or detail.get("currentLocation")
-        internal = map_selloship_status(current_status)
-        return {
-            "waybill": waybill,
-            "status": internal.value,
-            "raw_status": current_status,
-            "status_date": status_date,
-            "current_location": current_location,
-            "delivery_status": None,
-            "rto_status": None,
-            "scan": [],
-            "error": None,
-            "raw_response": detail,
-        }
+        return parse_waybill_detail(detail, awb_fallback)
 
     async def get_waybill_details_batch(self, awb_list: list[str]) -> list[dict]:
         """
@@ -328,7 +370,7 @@ class SelloshipService:
         params = {"waybills": waybills_value}
         headers = await self._get_headers()
         try:
-            resp = await get_with_retry(url, params=params, headers=headers, timeout=20.0, max_retries=2)
+            resp = await get_with_retry(url, params=params, headers=headers, max_retries=2, provider="selloship")
             resp.raise_for_status()
             data = resp.json()
         except httpx.HTTPStatusError as e:
@@ -447,17 +489,7 @@ class SelloshipService:
         result = await self.get_tracking(awb)
         if result.get("error"):
             return None
-        raw = result.get("raw_response") or {}
-        if not isinstance(raw, dict):
-            return None
-        forward = raw.get("forward_cost") or raw.get("shipping_cost") or raw.get("cost")
-        reverse = raw.get("reverse_cost") or raw.get("rto_cost") or 0
-        try:
-            fwd = Decimal(str(forward)) if forward is not None else Decimal("0")
-            rev = Decimal(str(reverse)) if reverse is not None else Decimal("0")
-            return {"forward_cost": fwd, "reverse_cost": rev}
-        except Exception:
-            return None
+        return parse_shipping_cost(result.get("raw_response"))
 
     async def get_costs(self, awb: str) -> Optional[dict]:
         """Alias for get_shipping_cost."""
@@ -475,7 +507,7 @@ class SelloshipService:
         url = f"{self.base_url}/waybill"
         headers = await self._get_headers()
         try:
-            resp = await post_no_retry(url, json=payload, headers=headers, timeout=30.0)
+            resp = await post_no_retry(url, json=payload, headers=headers, provider="selloship")
             data = resp.json() if resp.content else {}
         except Exception as e:
             logger.warning("Selloship create_waybill error: %s", e)
@@ -503,7 +535,7 @@ class SelloshipService:
         url = f"{self.base_url}/cancel"
         headers = await self._get_headers()
         try:
-            resp = await post_no_retry(url, json={"waybill": waybill.strip()}, headers=headers, timeout=15.0)
+            resp = await post_no_retry(url, json={"waybill": waybill.strip()}, headers=headers, provider="selloship")
             data = resp.json() if resp.content else {}
         except Exception as e:
             logger.warning("Selloship cancel_waybill error: %s", e)
@@ -524,7 +556,7 @@ class SelloshipService:
         headers = await self._get_headers()
         awb_list = [str(a).strip() for a in awb_numbers if str(a).strip()]
         try:
-            resp = await post_no_retry(url, json={"awbNumbers": awb_list}, headers=headers, timeout=30.0)
+            resp = await post_no_retry(url, json={"awbNumbers": awb_list}, headers=headers, timeout=30.0, provider="selloship")
             data = resp.json() if resp.content else {}
         except Exception as e:
             logger.warning("Selloship generate_manifest error: %s", e)
@@ -547,7 +579,7 @@ class SelloshipService:
         url = f"{self.base_url}/waybill/update"
         headers = await self._get_headers()
         try:
-            resp = await post_no_retry(url, json=payload, headers=headers, timeout=20.0)
+            resp = await post_no_retry(url, json=payload, headers=headers, provider="selloship")
             data = resp.json() if resp.content else {}
         except Exception as e:
             logger.warning("Selloship update_waybill error: %s", e)
@@ -565,11 +597,10 @@ class SelloshipService:
 async def sync_selloship_shipments(db: Any, api_key: Optional[str] = None) -> dict:
     """
     Sync all active Selloship shipments. Uses batch GET /waybillDetails (max 50 per call).
-    Updates Shipment.status, Shipment.last_synced_at, ShipmentTracking; triggers profit recompute.
+    Updates Shipment.status, Shipment.last_synced_at, ShipmentTracking; profit recompute is queued on commit (profit_queue).
     Returns { synced: int, updated: int, errors: list }.
     """
     from app.models import Shipment, ShipmentStatus, ShipmentTracking
-    from app.services.profit_calculator import compute_profit_for_order
 
     final_statuses = (ShipmentStatus.DELIVERED, ShipmentStatus.RTO_DONE, ShipmentStatus.LOST)
     active = (
@@ -613,10 +644,6 @@ async def sync_selloship_shipments(db: Any, api_key: Optional[str] = None) -> di
             except (ValueError, TypeError):
                 pass
             s.last_synced_at = datetime.now(timezone.utc)
-            cost = await client.get_shipping_cost(awb)
-            if cost:
-                s.forward_cost = cost.get("forward_cost") or s.forward_cost
-                s.reverse_cost = cost.get("reverse_cost") or s.reverse_cost
             payload = r.get("raw_response")
             current_location = r.get("current_location")
             if payload is not None and current_location is not None:
@@ -639,7 +666,6 @@ async def sync_selloship_shipments(db: Any, api_key: Optional[str] = None) -> di
                 )
                 db.add(tracking)
             db.flush()
-            compute_profit_for_order(db, s.order_id)
             synced += 1
     try:
         db.commit()
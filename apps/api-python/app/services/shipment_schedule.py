@@ -0,0 +1,122 @@
+"""
+Adaptive tracking schedule. Every non-final shipment carries next_poll_at and poll_priority (0 = most
+urgent), recomputed after each poll from its status, the courier's raw status, the shipment's age and how
+long ago its status last changed: out-for-delivery parcels are polled every 15 min, fresh labels every
+6 h, parcels stuck in transit for days every 6-12 h. The poller only reads due rows
+(ix_shipments_next_poll_at), most urgent first. Final shipments have next_poll_at NULL (see the Shipment
+hooks in app/models) and are never polled again. Tenants whose courier pushes status
+(app/services/courier_push.py) are polled at most every COURIER_PUSH_POLL_INTERVAL_SEC as a safety net.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from app.models import SHIPMENT_FINAL_STATUSES, Shipment, ShipmentStatus
+
+# Raw courier statuses meaning the parcel is with the delivery agent today (Delhivery "Dispatched")
+_OUT_FOR_DELIVERY_MARKERS = ("out for delivery", "out_for_delivery", "ofd", "dispatched")
+
+# (interval, priority) per situation
+OUT_FOR_DELIVERY = (timedelta(minutes=15), 0)
+RTO_IN_PROGRESS = (timedelta(hours=1), 1)
+IN_TRANSIT_RECENT = (timedelta(hours=1), 2)  # status changed within a day
+IN_TRANSIT = (timedelta(hours=2), 2)
+IN_TRANSIT_STALE = (timedelta(hours=6), 3)  # no change for 3+ days
+IN_TRANSIT_ABANDONED = (timedelta(hours=12), 4)  # shipped 14+ days ago and still moving
+CREATED_FRESH = (timedelta(hours=6), 3)
+CREATED_OLD = (timedelta(hours=12), 4)  # label created 2+ days ago and never picked up
+
+
+def utcnow() -> datetime:
+    """Naive UTC (shipment timestamps are TIMESTAMP WITHOUT TIME ZONE)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+_IST = timezone(timedelta(hours=5, minutes=30))
+_COURIER_TIME_FORMATS = ("%d-%b-%Y %H:%M:%S", "%d-%m-%Y %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+
+def parse_courier_time(value: Any) -> Optional[datetime]:
+    """
+    Courier event timestamp (ISO 8601, dd-Mon-yyyy HH:MM:SS and similar, or epoch seconds/ms) as naive UTC.
+    Times without an offset are courier-local (IST). None when absent or unparseable.
+    """
+    if value is None or value == "":
+        return None
+    parsed: Optional[datetime] = None
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        seconds = value / 1000 if value > 1e11 else value
+        return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+    elif isinstance(value, str):
+        text = value.strip()
+        try:
+            parsed = datetime.fromisoformat(text[:-1] + "+00:00" if text.endswith("Z") else text)
+        except ValueError:
+            for fmt in _COURIER_TIME_FORMATS:
+                try:
+                    parsed = datetime.strptime(text, fmt)
+                    break
+                except ValueError:
+                    continue
+    if parsed is None:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=_IST)
+    return _naive(parsed)
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def compute_schedule(
+    status: Optional[ShipmentStatus],
+    raw_status: Optional[str],
+    created_at: Optional[datetime],
+    status_changed_at: Optional[datetime],
+    now: Optional[datetime] = None,
+) -> tuple[Optional[datetime], int]:
+    """(next_poll_at, poll_priority) for a shipment; next_poll_at is None for final statuses."""
+    if status in SHIPMENT_FINAL_STATUSES:
+        return None, 0
+    now = now or utcnow()
+    created_at = _naive(created_at) or now
+    since_change = now - (_naive(status_changed_at) or created_at)
+    raw = (raw_status or "").strip().lower()
+    if any(marker in raw for marker in _OUT_FOR_DELIVERY_MARKERS):
+        interval, priority = OUT_FOR_DELIVERY
+    elif status == ShipmentStatus.RTO_INITIATED:
+        interval, priority = RTO_IN_PROGRESS
+    elif status in (None, ShipmentStatus.CREATED):
+        interval, priority = CREATED_OLD if now - created_at > timedelta(days=2) else CREATED_FRESH
+    elif now - created_at > timedelta(days=14):
+        interval, priority = IN_TRANSIT_ABANDONED
+    elif since_change > timedelta(days=3):
+        interval, priority = IN_TRANSIT_STALE
+    elif since_change < timedelta(days=1):
+        interval, priority = IN_TRANSIT_RECENT
+    else:
+        interval, priority = IN_TRANSIT
+    return now + interval, priority
+
+
+def reschedule(
+    shipment: Shipment,
+    raw_status: Optional[str],
+    now: Optional[datetime] = None,
+    min_interval: Optional[timedelta] = None,
+) -> None:
+    """
+    Set next_poll_at / poll_priority on a shipment after it was polled, skipped or updated by a push.
+    min_interval stretches the poll when the courier pushes status for this tenant (polling is then a safety net).
+    """
+    now = now or utcnow()
+    next_poll_at, priority = compute_schedule(
+        shipment.status, raw_status, shipment.created_at, shipment.status_changed_at, now
+    )
+    if next_poll_at is not None and min_interval is not None:
+        next_poll_at = max(next_poll_at, now + min_interval)
+    shipment.next_poll_at, shipment.poll_priority = next_poll_at, priority
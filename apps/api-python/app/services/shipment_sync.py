@@ -1,43 +1,50 @@
 """
 Unified shipment sync: single loop over all active shipments.
 Dispatches to DelhiveryService or SelloshipService by courier_name.
-Uses ProviderCredential (or env) per user per courier. Status/cost updates trigger profit recompute.
+Uses ProviderCredential (or env) per user per courier. Status updates queue a profit recompute on commit (profit_queue),
+so a cycle's changed orders are recomputed in one batch and unchanged shipments are not recomputed.
+Polling only tracks status: costs come from rate cards at ship time and the reconcile batch (app/services/rate_cards.py).
 """
-import json
 import logging
-from datetime import datetime, timezone
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
 
+from sqlalchemy import bindparam, func, insert, update
+
 from app.config import settings
-from app.models import Shipment, ShipmentStatus, ShipmentTracking, Order, ChannelAccount
+from app.models import (
+    SHIPMENT_FINAL_STATUSES,
+    ChannelAccount,
+    CourierPushToken,
+    Order,
+    Shipment,
+    ShipmentStatus,
+    ShipmentTracking,
+)
+from app.services.credentials import get_provider_credentials
+from app.services.shipment_schedule import reschedule, utcnow
 
 logger = logging.getLogger(__name__)
 
+# Selloship /waybillDetails accepts at most 50 waybills per call
+SELLOSHIP_BATCH_SIZE = 50
+_STATUS_VALUES = {e.value for e in ShipmentStatus}
+
 
 def _get_courier_api_key(db: Any, user_id: str, courier_name: str) -> Optional[str]:
     """
     Return API key for (user_id, courier). Courier normalized: delhivery | selloship.
-    Uses ProviderCredential first, then env fallback.
+    Uses ProviderCredential first (cached credential store), then env fallback.
     """
-    from app.models import ProviderCredential
-    from app.services.credentials import decrypt_token
-
     normalized = "delhivery" if courier_name and "delhivery" in courier_name.lower() else "selloship" if courier_name and "selloship" in courier_name.lower() else None
     if not normalized:
         return None
-    cred = db.query(ProviderCredential).filter(
-        ProviderCredential.user_id == user_id,
-        ProviderCredential.provider_id == normalized,
-    ).first()
-    if cred and cred.value_encrypted:
-        try:
-            dec = decrypt_token(cred.value_encrypted)
-            data = json.loads(dec) if isinstance(dec, str) and dec.strip().startswith("{") else {"apiKey": dec}
-            key = data.get("apiKey") or data.get("api_key")
-            if key:
-                return key
-        except Exception:
-            pass
+    data = get_provider_credentials(db, user_id, normalized) if user_id else None
+    key = (data or {}).get("apiKey") or (data or {}).get("api_key")
+    if key:
+        return key
     if normalized == "delhivery":
         return (getattr(settings, "DELHIVERY_API_KEY", None) or "").strip() or None
     if normalized == "selloship":
@@ -45,185 +52,313 @@ def _get_courier_api_key(db: Any, user_id: str, courier_name: str) -> Optional[s
     return None
 
 
-def _user_id_for_shipment(db: Any, shipment: Shipment) -> Optional[str]:
-    """Resolve user_id for a shipment via order -> channel_account."""
-    order = db.query(Order).filter(Order.id == shipment.order_id).first()
-    if not order or not order.channel_account_id:
-        return None
-    acc = db.query(ChannelAccount).filter(ChannelAccount.id == order.channel_account_id).first()
-    return acc.user_id if acc else None
-
-
 def _get_selloship_credentials(db: Any, user_id: str) -> tuple[Optional[str], Optional[str], Optional[str]]:
-    """Return (api_key, username, password) for Selloship from ProviderCredential or env."""
-    from app.models import ProviderCredential
-    from app.services.credentials import decrypt_token
-
-    cred = db.query(ProviderCredential).filter(
-        ProviderCredential.user_id == user_id,
-        ProviderCredential.provider_id == "selloship",
-    ).first()
-    if cred and cred.value_encrypted:
-        try:
-            dec = decrypt_token(cred.value_encrypted)
-            data = json.loads(dec) if isinstance(dec, str) and dec.strip().startswith("{") else {"apiKey": dec}
-            api_key = data.get("apiKey") or data.get("api_key")
-            username = data.get("username")
-            password = data.get("password")
-            if api_key or (username and password):
-                return (api_key, username, password)
-        except Exception:
-            pass
+    """Return (api_key, username, password) for Selloship from ProviderCredential (cached) or env."""
+    data = get_provider_credentials(db, user_id, "selloship") if user_id else None
+    if data:
+        api_key = data.get("apiKey") or data.get("api_key")
+        username = data.get("username")
+        password = data.get("password")
+        if api_key or (username and password):
+            return (api_key, username, password)
     key = (getattr(settings, "SELLOSHIP_API_KEY", None) or "").strip() or None
     user = (getattr(settings, "SELLOSHIP_USERNAME", None) or "").strip() or None
     pwd = (getattr(settings, "SELLOSHIP_PASSWORD", None) or "").strip() or None
     return (key, user, pwd) if (key or (user and pwd)) else (None, None, None)
 
 
-async def sync_shipments(db: Any, user_id: Optional[str] = None) -> dict:
+@dataclass
+class _SyncRow:
+    shipment: Shipment
+    user_id: str
+    tracking_id: Optional[str]
+    raw_status: Optional[str] = None  # last courier status (tracking row), updated when polled
+    last_event_at: Optional[datetime] = None  # courier timestamp of that status (tracking row)
+
+
+class _TrackingWriter:
+    """Collects tracking row changes for one cycle and writes them with two executemany statements."""
+
+    def __init__(self) -> None:
+        self.updates: list[dict] = []
+        self.inserts: list[dict] = []
+
+    def add(self, row: _SyncRow, awb: str, result: dict) -> None:
+        values = {
+            "status": result.get("raw_status") or result.get("status"),
+            "delivery_status": result.get("delivery_status"),
+            "rto_status": result.get("rto_status"),
+            "raw_response": result.get("raw_response"),
+            "last_event_at": result.get("event_at"),
+        }
+        if row.tracking_id:
+            self.updates.append({"tid": row.tracking_id, **{f"v_{k}": v for k, v in values.items()}})
+        else:
+            row.tracking_id = str(uuid.uuid4())
+            self.inserts.append({"id": row.tracking_id, "shipment_id": row.shipment.id, "waybill": awb, **values})
+
+    def flush(self, db: Any) -> None:
+        table = ShipmentTracking.__table__
+        if self.updates:
+            db.execute(
+                update(table)
+                .where(table.c.id == bindparam("tid"))
+                .values(
+                    status=bindparam("v_status"),
+                    delivery_status=bindparam("v_delivery_status"),
+                    rto_status=bindparam("v_rto_status"),
+                    raw_response=bindparam("v_raw_response"),
+                    last_event_at=func.coalesce(bindparam("v_last_event_at"), table.c.last_event_at),
+                    last_updated_at=func.now(),
+                ),
+                self.updates,
+            )
+        if self.inserts:
+            db.execute(insert(table), self.inserts)
+        self.updates, self.inserts = [], []
+
+
+def _load_active_shipments(
+    db: Any,
+    user_id: Optional[str],
+    due_only: bool = False,
+    limit: Optional[int] = None,
+    awbs: Optional[list[str]] = None,
+    courier: Optional[str] = None,
+) -> list[_SyncRow]:
     """
-    Sync all active shipments. Delhivery: one get_tracking per shipment. Selloship: batch GET /waybillDetails (max 50 per call per Base.com spec).
-    Returns { synced: int, errors: list }.
+    Active shipments with their owner's user_id and tracking row: one joined query.
+    due_only: only shipments whose next_poll_at has passed (index range scan), most urgent first, at most limit.
+    awbs / courier: only these waybills of this courier (push ingestion).
     """
-    from app.services.delhivery_service import get_client as get_delhivery_client
-    from app.services.selloship_service import get_selloship_client
-    from app.services.profit_calculator import compute_profit_for_order
-
-    final_statuses = (ShipmentStatus.DELIVERED, ShipmentStatus.RTO_DONE, ShipmentStatus.LOST)
     query = (
-        db.query(Shipment)
-        .filter(Shipment.status.notin_(final_statuses))
+        db.query(Shipment, ChannelAccount.user_id, ShipmentTracking.id, ShipmentTracking.status, ShipmentTracking.last_event_at)
+        .outerjoin(Order, Shipment.order_id == Order.id)
+        .outerjoin(ChannelAccount, Order.channel_account_id == ChannelAccount.id)
+        .outerjoin(ShipmentTracking, ShipmentTracking.shipment_id == Shipment.id)
+        .filter(Shipment.status.notin_(SHIPMENT_FINAL_STATUSES))
     )
     if user_id:
-        query = (
-            query.join(Order, Shipment.order_id == Order.id)
-            .join(ChannelAccount, Order.channel_account_id == ChannelAccount.id)
-            .filter(ChannelAccount.user_id == user_id)
-        )
-    shipments_list = query.all()
+        query = query.filter(ChannelAccount.user_id == user_id)
+    if awbs is not None:
+        query = query.filter(Shipment.awb_number.in_(awbs))
+    if courier:
+        query = query.filter(Shipment.courier_name.ilike(f"%{courier}%"))
+    if due_only:
+        query = query.filter(Shipment.next_poll_at <= utcnow()).order_by(Shipment.poll_priority, Shipment.next_poll_at)
+        if limit:
+            query = query.limit(limit)
+    rows: dict[str, _SyncRow] = {}
+    for shipment, owner_id, tracking_id, tracking_status, last_event_at in query.all():
+        # Legacy duplicate tracking rows: keep updating the first one, as before
+        if shipment.id not in rows:
+            rows[shipment.id] = _SyncRow(shipment, user_id or owner_id or "", tracking_id, tracking_status, last_event_at)
+    return list(rows.values())
+
+
+def _courier_key(courier_name: Optional[str]) -> Optional[str]:
+    name = (courier_name or "").lower()
+    return "delhivery" if "delhivery" in name else "selloship" if "selloship" in name else None
+
+
+def _push_poll_floor() -> timedelta:
+    return timedelta(seconds=settings.COURIER_PUSH_POLL_INTERVAL_SEC)
+
+
+def _push_enabled_users(db: Any, now: datetime) -> set[tuple[str, str]]:
+    """(user_id, courier) pairs whose status pushes are live (a push arrived within COURIER_PUSH_ACTIVE_WINDOW_SEC)."""
+    since = now - timedelta(seconds=settings.COURIER_PUSH_ACTIVE_WINDOW_SEC)
+    return {
+        (uid, courier)
+        for uid, courier in db.query(CourierPushToken.user_id, CourierPushToken.courier)
+        .filter(CourierPushToken.last_push_at >= since)
+        .all()
+    }
+
+
+def _apply_result(row: _SyncRow, awb: str, result: dict, tracking: _TrackingWriter, errors: list[str]) -> bool:
+    """Apply one courier result to the shipment (ORM, so the profit/analytics hooks see real changes)."""
+    if result.get("error"):
+        # Failed AWBs keep their current status (error stubs carry CREATED)
+        errors.append(f"{awb}: {result.get('error')}")
+        return False
+    event_at = result.get("event_at")
+    if event_at and row.last_event_at and event_at < row.last_event_at:
+        # Out-of-order delivery (push retried late, or a poll raced a newer push): keep the newer status
+        return False
+    internal_status = result.get("status")
+    if isinstance(internal_status, ShipmentStatus):
+        internal_status = internal_status.value
+    s = row.shipment
+    try:
+        new_status = ShipmentStatus(internal_status) if internal_status in _STATUS_VALUES else s.status
+    except (ValueError, TypeError):
+        new_status = s.status
+    if new_status != s.status:
+        s.status = new_status
+        s.status_changed_at = utcnow()
+    s.last_synced_at = datetime.now(timezone.utc)
+    row.raw_status = result.get("raw_status") or row.raw_status
+    row.last_event_at = event_at or row.last_event_at
+    tracking.add(row, awb, result)
+    return True
+
+
+async def sync_shipments(
+    db: Any,
+    user_id: Optional[str] = None,
+    due_only: bool = False,
+    limit: Optional[int] = None,
+) -> dict:
+    """
+    Sync active shipments (all of them, or with due_only only those whose next_poll_at has passed).
+    Delhivery: get_tracking_batch per API key (comma-separated waybills). Selloship: batch GET /waybillDetails (max 50 per call per Base.com spec).
+    Shipments, owners and tracking ids come from one joined query; tracking rows are written in bulk and
+    everything commits once, so the profit recompute for changed statuses is queued as one batch.
+    Every loaded shipment is rescheduled (shipment_schedule), including failed or unconfigured ones; if the
+    commit fails the new schedule is still committed on its own and polled is reported as 0.
+    Returns { synced: int, polled: int, errors: list }.
+    """
+    from app.services.delhivery_service import get_client as get_delhivery_client
+    from app.services.selloship_service import get_selloship_client
+
+    rows = _load_active_shipments(db, user_id, due_only=due_only, limit=limit)
     synced = 0
     errors: list[str] = []
+    tracking = _TrackingWriter()
 
-    # Split Delhivery vs Selloship; for Selloship group by user_id for batch
-    delhivery_shipments = []
-    selloship_by_user: dict[str, list] = {}
-    for s in shipments_list:
-        awb = (s.awb_number or "").strip()
+    # Split Delhivery (grouped by API key) vs Selloship (grouped by user)
+    delhivery_by_key: dict[str, dict[str, list[_SyncRow]]] = {}
+    selloship_by_user: dict[str, dict[str, list[_SyncRow]]] = {}
+    for row in rows:
+        awb = (row.shipment.awb_number or "").strip()
         if not awb:
             continue
-        courier_raw = (s.courier_name or "").strip().lower()
+        courier_raw = (row.shipment.courier_name or "").strip().lower()
         if "delhivery" in courier_raw:
-            delhivery_shipments.append(s)
+            api_key = _get_courier_api_key(db, row.user_id, courier_raw)
+            if api_key:
+                delhivery_by_key.setdefault(api_key, {}).setdefault(awb, []).append(row)
         elif "selloship" in courier_raw:
-            uid = user_id or _user_id_for_shipment(db, s) or ""
-            selloship_by_user.setdefault(uid, []).append(s)
-    # Delhivery: one-by-one
-    for s in delhivery_shipments:
-        awb = (s.awb_number or "").strip()
-        uid = user_id or _user_id_for_shipment(db, s)
-        api_key = _get_courier_api_key(db, uid or "", s.courier_name or "")
-        if not api_key:
-            continue
+            selloship_by_user.setdefault(row.user_id, {}).setdefault(awb, []).append(row)
+
+    # Delhivery: batched comma-separated tracking per API key (bounded concurrency inside the client)
+    for api_key, by_awb in delhivery_by_key.items():
+        client = get_delhivery_client(api_key)
         try:
-            client = get_delhivery_client(api_key)
-            result = await client.get_tracking(awb)
-            raw_status = result.get("raw_status") or result.get("status")
-            internal_status = result.get("status")
-            if isinstance(internal_status, ShipmentStatus):
-                internal_status = internal_status.value
-            delivery_status = result.get("delivery_status")
-            rto_status = result.get("rto_status")
-            payload = result.get("raw_response")
-            if result.get("error") and not internal_status:
-                errors.append(f"{awb}: {result.get('error')}")
-                continue
-            try:
-                s.status = ShipmentStatus(internal_status) if internal_status in [e.value for e in ShipmentStatus] else s.status
-            except (ValueError, TypeError):
-                pass
-            s.last_synced_at = datetime.now(timezone.utc)
-            tracking = db.query(ShipmentTracking).filter(ShipmentTracking.shipment_id == s.id).first()
-            if tracking:
-                tracking.status = raw_status or internal_status
-                tracking.delivery_status = delivery_status
-                tracking.rto_status = rto_status
-                tracking.raw_response = payload
-            else:
-                tracking = ShipmentTracking(
-                    shipment_id=s.id,
-                    waybill=awb,
-                    status=raw_status or internal_status,
-                    delivery_status=delivery_status,
-                    rto_status=rto_status,
-                    raw_response=payload,
-                )
-                db.add(tracking)
-            db.flush()
-            compute_profit_for_order(db, s.order_id)
-            synced += 1
+            results = await client.get_tracking_batch(list(by_awb))
         except Exception as e:
-            logger.warning("Sync shipment %s (Delhivery) failed: %s", awb, e)
-            errors.append(f"{awb}: {e}")
+            logger.warning("Delhivery batch sync (%s AWBs) failed: %s", len(by_awb), e)
+            errors.append(f"Delhivery batch: {e}")
+            continue
+        for awb, awb_rows in by_awb.items():
+            result = results.get(awb)
+            if not result:
+                continue
+            for row in awb_rows:
+                if _apply_result(row, awb, result, tracking, errors):
+                    synced += 1
 
     # Selloship: batch GET /waybillDetails (max 50 per call)
-    for uid, selloship_list in selloship_by_user.items():
+    for uid, by_awb in selloship_by_user.items():
         api_key, username, password = _get_selloship_credentials(db, uid)
         if not api_key and not (username and password):
             continue
         client = get_selloship_client(api_key=api_key, username=username, password=password)
-        awb_list = [s.awb_number.strip() for s in selloship_list]
-        for i in range(0, len(awb_list), 50):
-            chunk_awbs = awb_list[i : i + 50]
-            chunk_shipments = [s for s in selloship_list if (s.awb_number or "").strip() in chunk_awbs]
+        awb_list = list(by_awb)
+        for i in range(0, len(awb_list), SELLOSHIP_BATCH_SIZE):
+            chunk_awbs = awb_list[i : i + SELLOSHIP_BATCH_SIZE]
             try:
                 results = await client.get_waybill_details_batch(chunk_awbs)
             except Exception as e:
                 errors.append(f"Selloship batch: {e}")
                 continue
-            by_awb = {r.get("waybill", "").strip(): r for r in results if r.get("waybill")}
-            for s in chunk_shipments:
-                awb = (s.awb_number or "").strip()
-                r = by_awb.get(awb)
+            by_result_awb = {r.get("waybill", "").strip(): r for r in results if r.get("waybill")}
+            for awb in chunk_awbs:
+                r = by_result_awb.get(awb)
                 if not r:
                     continue
-                raw_status = r.get("raw_status") or r.get("status")
-                internal_status = r.get("status")
-                if r.get("error") and not internal_status:
-                    errors.append(f"{awb}: {r.get('error')}")
-                    continue
-                try:
-                    s.status = ShipmentStatus(internal_status) if internal_status in [e.value for e in ShipmentStatus] else s.status
-                except (ValueError, TypeError):
-                    pass
-                s.last_synced_at = datetime.now(timezone.utc)
-                if hasattr(client, "get_shipping_cost"):
-                    cost = await client.get_shipping_cost(awb)
-                    if cost:
-                        s.forward_cost = cost.get("forward_cost") or s.forward_cost
-                        s.reverse_cost = cost.get("reverse_cost") or s.reverse_cost
-                payload = r.get("raw_response")
-                tracking = db.query(ShipmentTracking).filter(ShipmentTracking.shipment_id == s.id).first()
-                if tracking:
-                    tracking.status = raw_status or internal_status
-                    tracking.delivery_status = r.get("delivery_status")
-                    tracking.rto_status = r.get("rto_status")
-                    tracking.raw_response = payload
-                else:
-                    tracking = ShipmentTracking(
-                        shipment_id=s.id,
-                        waybill=awb,
-                        status=raw_status or internal_status,
-                        delivery_status=r.get("delivery_status"),
-                        rto_status=r.get("rto_status"),
-                        raw_response=payload,
-                    )
-                    db.add(tracking)
-                db.flush()
-                compute_profit_for_order(db, s.order_id)
-                synced += 1
+                for row in by_awb[awb]:
+                    if _apply_result(row, awb, r, tracking, errors):
+                        synced += 1
+    now = utcnow()
+    push_users = _push_enabled_users(db, now)
+    for row in rows:
+        courier = _courier_key(row.shipment.courier_name)
+        floor = _push_poll_floor() if (row.user_id, courier) in push_users else None
+        reschedule(row.shipment, row.raw_status, now, min_interval=floor)
+    schedule = [
+        {"sid": row.shipment.id, "v_next_poll_at": row.shipment.next_poll_at, "v_poll_priority": row.shipment.poll_priority}
+        for row in rows
+    ]
     try:
+        db.flush()
+        tracking.flush(db)
         db.commit()
     except Exception as e:
         db.rollback()
         errors.append(f"commit: {e}")
-    return {"synced": synced, "updated": synced, "errors": errors[:50]}
+        # Status/tracking writes are lost for this cycle; still push the polled shipments out so the
+        # next tick does not pick the same batch up again, and report nothing polled (no backlog loop)
+        _commit_schedule(db, schedule, errors)
+        return {"synced": 0, "updated": 0, "polled": 0, "errors": errors[:50]}
+    return {"synced": synced, "updated": synced, "polled": len(rows), "errors": errors[:50]}
+
+
+def _commit_schedule(db: Any, schedule: list[dict], errors: list[str]) -> None:
+    """Write only next_poll_at / poll_priority (one executemany) in a transaction of its own."""
+    if not schedule:
+        return
+    table = Shipment.__table__
+    try:
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("sid"))
+            .values(next_poll_at=bindparam("v_next_poll_at"), poll_priority=bindparam("v_poll_priority")),
+            schedule,
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        errors.append(f"reschedule commit: {e}")
+
+
+def apply_courier_updates(db: Any, user_id: str, courier: str, results: list[dict]) -> dict:
+    """
+    Apply pushed courier statuses (get_tracking-shaped results) to this user's active shipments of this
+    courier, reschedule them with the push safety-net interval and commit once (profit recompute is queued
+    by the profit_queue hook for shipments whose status actually changed). Per AWB the newest event wins
+    (courier timestamp, else body order); events older than the one already applied are counted as stale.
+    Returns { updated: int, stale: int, unmatched: [awb], errors: [str] }.
+    """
+    by_awb: dict[str, dict] = {}
+    for r in results:
+        awb = (r.get("waybill") or "").strip()
+        if not awb:
+            continue
+        prev = by_awb.get(awb)
+        if prev and prev.get("event_at") and r.get("event_at") and r["event_at"] < prev["event_at"]:
+            continue
+        by_awb[awb] = r
+    rows = _load_active_shipments(db, user_id, awbs=list(by_awb), courier=courier) if by_awb else []
+    tracking = _TrackingWriter()
+    errors: list[str] = []
+    updated = 0
+    stale = 0
+    matched: set[str] = set()
+    now = utcnow()
+    for row in rows:
+        awb = (row.shipment.awb_number or "").strip()
+        result = by_awb.get(awb)
+        if not result:
+            continue
+        matched.add(awb)
+        if _apply_result(row, awb, result, tracking, errors):
+            updated += 1
+        elif not result.get("error"):
+            stale += 1
+        reschedule(row.shipment, row.raw_status, now, min_interval=_push_poll_floor())
+    db.flush()
+    tracking.flush(db)
+    db.commit()
+    return {"updated": updated, "stale": stale, "unmatched": sorted(set(by_awb) - matched), "errors": errors}
@@ -1,8 +1,11 @@
 """
 Persist Shopify inventory to DB: ShopifyInventory cache + Inventory (Warehouse/ProductVariant).
 Used by POST /shopify/sync and by SyncEngine.sync_inventory so one code path.
+apply_inventory_level() applies a single inventory_levels/update webhook without a catalog refetch.
 """
 import logging
+from typing import Iterable, Optional
+from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
 from decimal import Decimal
 
@@ -17,10 +20,24 @@ from app.models import (
 logger = logging.getLogger(__name__)
 
 
-def persist_shopify_inventory(db: Session, shop_domain: str, inv_list: list) -> int:
+def clear_inventory_cache(db: Session, shop_domain: str, keep_item_ids: Iterable = ()) -> None:
+    """Delete the shop's shopify_inventory rows except those of keep_item_ids (levels that failed to fetch)."""
+    query = db.query(ShopifyInventory).filter(ShopifyInventory.shop_domain == shop_domain)
+    keep = [str(i)[:64] for i in keep_item_ids if i is not None]
+    if keep:
+        query = query.filter(or_(
+            ShopifyInventory.inventory_item_id.is_(None),
+            ShopifyInventory.inventory_item_id.notin_(keep),
+        ))
+    query.delete(synchronize_session=False)
+
+
+def persist_shopify_inventory(db: Session, shop_domain: str, inv_list: list, failed_item_ids: Iterable = ()) -> int:
     """
     Upsert inventory into shopify_inventory cache and into Inventory (Shopify warehouse).
     inv_list: list of dicts with sku, product_name, variant_id, inventory_item_id, location_id, available.
+    failed_item_ids: inventory items whose levels could not be fetched (get_inventory); their cached levels
+    and Inventory quantities are left as they are.
     Returns number of inventory records updated/inserted (for Inventory table; cache is full replace).
     """
     if not inv_list:
@@ -28,7 +45,7 @@ def persist_shopify_inventory(db: Session, shop_domain: str, inv_list: list) ->
 
     # 1) Replace shopify_inventory cache for this shop (do not rollback; caller may have other changes)
     try:
-        db.query(ShopifyInventory).filter(ShopifyInventory.shop_domain == shop_domain).delete()
+        clear_inventory_cache(db, shop_domain, failed_item_ids)
         for row in inv_list:
             if not isinstance(row, dict):
                 continue
@@ -48,56 +65,123 @@ def persist_shopify_inventory(db: Session, shop_domain: str, inv_list: list) ->
     except Exception as e:
         logger.warning("Failed to update ShopifyInventory cache: %s", e)
 
-    # 2) Upsert into Inventory (Warehouse "Shopify", Product "Shopify Products")
+    # 2) Upsert into Inventory (Warehouse "Shopify", Product "Shopify Products"): one row per SKU holding
+    # the sum over locations, as apply_inventory_level() keeps it
+    totals: dict[str, int] = {}
+    for row in inv_list:
+        if not isinstance(row, dict):
+            continue
+        sku = (row.get("sku") or "").strip() or "—"
+        if sku == "—":
+            continue
+        totals[sku] = totals.get(sku, 0) + int(row.get("available", 0) or 0)
     inventory_synced = 0
     try:
-        warehouse = db.query(Warehouse).filter(Warehouse.name == "Shopify").first()
-        if not warehouse:
-            warehouse = Warehouse(name="Shopify", city=None, state=None)
-            db.add(warehouse)
-            db.flush()
-        product = db.query(Product).filter(Product.title == "Shopify Products").first()
-        if not product:
-            product = Product(title="Shopify Products", brand=None, category=None)
-            db.add(product)
-            db.flush()
-        for row in inv_list:
-            if not isinstance(row, dict):
-                continue
-            sku = (row.get("sku") or "").strip() or "—"
-            if sku == "—":
-                continue
-            product_name = ((row.get("product_name") or sku) or "—")[:255]
-            available = int(row.get("available", 0) or 0)
-            variant = db.query(ProductVariant).filter(ProductVariant.sku == sku).first()
-            if not variant:
-                variant = ProductVariant(
-                    product_id=product.id,
-                    sku=sku,
-                    mrp=Decimal("0"),
-                    selling_price=Decimal("0"),
-                )
-                db.add(variant)
-                db.flush()
-            inv = db.query(Inventory).filter(
-                Inventory.warehouse_id == warehouse.id,
-                Inventory.variant_id == variant.id,
-            ).first()
-            if not inv:
-                inv = Inventory(
-                    warehouse_id=warehouse.id,
-                    variant_id=variant.id,
-                    total_qty=available,
-                    reserved_qty=0,
-                )
-                db.add(inv)
+        warehouse, product = _shopify_warehouse_and_product(db)
+        for sku, available in totals.items():
+            if _upsert_inventory_qty(db, warehouse, product, sku, available):
                 inventory_synced += 1
-            else:
-                if inv.total_qty != available:
-                    inv.total_qty = available
-                    inventory_synced += 1
     except Exception as e:
         logger.exception("Inventory DB sync failed: %s", e)
         return 0
 
     return inventory_synced
+
+
+def _shopify_warehouse_and_product(db: Session) -> tuple[Warehouse, Product]:
+    """Get or create the "Shopify" warehouse and the "Shopify Products" placeholder product."""
+    warehouse = db.query(Warehouse).filter(Warehouse.name == "Shopify").first()
+    if not warehouse:
+        warehouse = Warehouse(name="Shopify", city=None, state=None)
+        db.add(warehouse)
+        db.flush()
+    product = db.query(Product).filter(Product.title == "Shopify Products").first()
+    if not product:
+        product = Product(title="Shopify Products", brand=None, category=None)
+        db.add(product)
+        db.flush()
+    return warehouse, product
+
+
+def _upsert_inventory_qty(db: Session, warehouse: Warehouse, product: Product, sku: str, available: int) -> bool:
+    """Set Inventory.total_qty for sku in the Shopify warehouse (creating variant/row if needed). True if changed."""
+    variant = db.query(ProductVariant).filter(ProductVariant.sku == sku).first()
+    if not variant:
+        variant = ProductVariant(
+            product_id=product.id,
+            sku=sku,
+            mrp=Decimal("0"),
+            selling_price=Decimal("0"),
+        )
+        db.add(variant)
+        db.flush()
+    inv = db.query(Inventory).filter(
+        Inventory.warehouse_id == warehouse.id,
+        Inventory.variant_id == variant.id,
+    ).first()
+    if not inv:
+        db.add(Inventory(
+            warehouse_id=warehouse.id,
+            variant_id=variant.id,
+            total_qty=available,
+            reserved_qty=0,
+        ))
+        return True
+    if inv.total_qty != available:
+        inv.total_qty = available
+        return True
+    return False
+
+
+def apply_inventory_level(
+    db: Session,
+    shop_domain: str,
+    inventory_item_id,
+    location_id,
+    available: Optional[int],
+) -> bool:
+    """
+    Apply one inventory level (inventory_levels/update payload) to the ShopifyInventory cache and Inventory.
+    Returns False when the inventory item is not in the cache (caller should schedule a catalog refresh).
+    Inventory.total_qty for the SKU becomes the sum of this shop's cached levels across locations.
+    """
+    if inventory_item_id is None or location_id is None:
+        return False
+    item_id = str(inventory_item_id)[:64]
+    loc_id = str(location_id)[:64]
+    qty = int(available or 0)
+
+    rows = (
+        db.query(ShopifyInventory)
+        .filter(ShopifyInventory.shop_domain == shop_domain, ShopifyInventory.inventory_item_id == item_id)
+        .all()
+    )
+    if not rows:
+        return False
+    row = next((r for r in rows if r.location_id == loc_id), None)
+    if row is None:
+        # Item known at other locations (e.g. newly stocked location): copy its identity
+        ref = rows[0]
+        row = ShopifyInventory(
+            shop_domain=shop_domain,
+            sku=ref.sku,
+            product_name=ref.product_name,
+            variant_id=ref.variant_id,
+            inventory_item_id=item_id,
+            location_id=loc_id,
+            available=qty,
+        )
+        db.add(row)
+    else:
+        row.available = qty
+    db.flush()
+
+    total = (
+        db.query(func.coalesce(func.sum(ShopifyInventory.available), 0))
+        .filter(ShopifyInventory.shop_domain == shop_domain, ShopifyInventory.sku == row.sku)
+        .scalar()
+    )
+    warehouse, product = _shopify_warehouse_and_product(db)
+    _upsert_inventory_qty(db, warehouse, product, row.sku, int(total or 0))
+    db.flush()
+    return True
@@ -0,0 +1,78 @@
+"""
+Debounced full Shopify inventory refresh (products -> locations -> levels) per shop.
+Webhook handlers call schedule_inventory_refresh() only when an event references an inventory item
+the cache does not know; a burst of such events for one shop collapses into a single refresh.
+"""
+import asyncio
+import logging
+import threading
+from typing import Optional
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import ShopifyIntegration
+from app.services.shopify_inventory_persist import persist_shopify_inventory
+from app.services.shopify_service import get_inventory
+
+logger = logging.getLogger(__name__)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_scheduled: set[str] = set()
+_lock = threading.Lock()
+
+
+def bind_event_loop(loop: asyncio.AbstractEventLoop) -> None:
+    """Remember the app event loop so handlers running in worker threads can schedule refreshes."""
+    global _loop
+    _loop = loop
+
+
+async def _refresh_after_delay(shop_domain: str) -> None:
+    await asyncio.sleep(settings.SHOPIFY_INVENTORY_REFRESH_DEBOUNCE_SEC)
+    with _lock:
+        _scheduled.discard(shop_domain)
+    db = SessionLocal()
+    try:
+        integration = db.query(ShopifyIntegration).filter(ShopifyIntegration.shop_domain == shop_domain).first()
+        if not integration or not integration.access_token:
+            return
+        inv_list, failed_item_ids = await get_inventory(integration.shop_domain, integration.access_token)
+        count = persist_shopify_inventory(db, integration.shop_domain, inv_list or [], failed_item_ids)
+        db.commit()
+        logger.info("Debounced inventory refresh for %s: %s level(s), %s inventory row(s) updated",
+                    shop_domain, len(inv_list or []), count)
+    except Exception as e:
+        db.rollback()
+        logger.warning("Debounced inventory refresh failed for %s: %s", shop_domain, e)
+    finally:
+        db.close()
+
+
+def schedule_inventory_refresh(shop_domain: str) -> bool:
+    """
+    Schedule a full inventory refresh for shop_domain after the debounce window.
+    No-op if one is already pending for the shop. Safe to call from the event loop or a worker thread.
+    Returns True if a new refresh was scheduled.
+    """
+    with _lock:
+        if shop_domain in _scheduled:
+            return False
+        _scheduled.add(shop_domain)
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    try:
+        if running is not None:
+            running.create_task(_refresh_after_delay(shop_domain))
+        elif _loop is not None and _loop.is_running():
+            asyncio.run_coroutine_threadsafe(_refresh_after_delay(shop_domain), _loop)
+        else:
+            raise RuntimeError("no running event loop")
+    except RuntimeError as e:
+        with _lock:
+            _scheduled.discard(shop_domain)
+        logger.warning("Inventory refresh for %s not scheduled: %s", shop_domain, e)
+        return False
+    logger.info("Inventory refresh for %s scheduled in %ss", shop_domain, settings.SHOPIFY_INVENTORY_REFRESH_DEBOUNCE_SEC)
+    return True
@@ -8,6 +8,7 @@ import secrets
 import time
 from urllib.parse import urlencode, parse_qs, urlparse, quote_plus
 from app.config import settings
+from app.services.http_client import get_client
 import logging
 
 logger = logging.getLogger(__name__)
@@ -137,22 +138,21 @@ class ShopifyOAuthService:
             
             logger.info(f"Exchanging code for token for shop: {shop}")
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    url,
-                    json={
-                        "client_id": self.api_key,
-                        "client_secret": self.api_secret,
-                        "code": code,
-                    },
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                token_data = response.json()
-                
-                # Log success (but not the token itself)
-                logger.info(f"Successfully exchanged code for token for shop: {shop}")
-                return token_data
+            client = get_client("shopify")
+            response = await client.post(
+                url,
+                json={
+                    "client_id": self.api_key,
+                    "client_secret": self.api_secret,
+                    "code": code,
+                }
+            )
+            response.raise_for_status()
+            token_data = response.json()
+            
+            # Log success (but not the token itself)
+            logger.info(f"Successfully exchanged code for token for shop: {shop}")
+            return token_data
                 
         except httpx.HTTPStatusError as e:
             logger.error(f"Token exchange failed for shop {shop_domain}: HTTP {e.response.status_code} - {e.response.text[:200]}")
@@ -3,9 +3,13 @@ Shopify Admin API service - authenticated requests.
 Uses API version 2024-01 (stable). Never expose access_token to frontend.
 Supports cursor pagination (Link header) so we fetch all products, not just first 250.
 """
+import asyncio
 import re
 import httpx
 import logging
+
+from app.services.http_client import get_client
+from datetime import datetime, timezone
 from typing import Any, Optional
 
 # Use 2024-01 (stable). 2026-01 can be unstable and cause inventory issues.
@@ -65,9 +69,9 @@ async def get_access_scopes(shop_domain: str, access_token: str) -> list[str]:
     """
     url = f"{_shop_base_url(shop_domain)}/admin/oauth/access_scopes.json"
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=_headers(access_token), timeout=10.0)
-            response.raise_for_status()
+        client = get_client("shopify")
+        response = await client.get(url, headers=_headers(access_token))
+        response.raise_for_status()
         data = response.json()
         scopes = data.get("access_scopes") or []
         return [str(s.get("handle", "")).strip() for s in scopes if s and s.get("handle")]
@@ -83,14 +87,13 @@ async def get_orders(shop_domain: str, access_token: str, limit: int = 250) -> l
     Returns normalized list of orders (id, customer, total, status, created_at).
     """
     url = f"{_base_url(shop_domain)}/orders.json"
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            url,
-            params={"status": "any", "limit": limit},
-            headers=_headers(access_token),
-            timeout=30.0,
-        )
-        response.raise_for_status()
+    client = get_client("shopify")
+    response = await client.get(
+        url,
+        params={"status": "any", "limit": limit},
+        headers=_headers(access_token),
+    )
+    response.raise_for_status()
     data = response.json()
     raw_orders = data.get("orders", [])
     return [
@@ -117,19 +120,85 @@ def _order_customer_name(o: dict) -> str:
     return (o.get("email") or "").strip() or "—"
 
 
-async def get_orders_raw(shop_domain: str, access_token: str, limit: int = 250) -> list[dict]:
-    """Fetch raw orders from Shopify for sync (full payload including line_items)."""
-    url = f"{_base_url(shop_domain)}/orders.json"
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            url,
-            params={"status": "any", "limit": limit},
-            headers=_headers(access_token),
-            timeout=30.0,
-        )
+async def get_orders_raw(
+    shop_domain: str,
+    access_token: str,
+    limit: int = 250,
+    updated_at_min: Optional[str] = None,
+) -> list[dict]:
+    """Fetch raw orders from Shopify for sync (full payload including line_items), all pages."""
+    orders, _ = await get_orders_raw_paginated(
+        shop_domain,
+        access_token,
+        updated_at_min=updated_at_min,
+        page_limit=limit,
+    )
+    return orders
+
+
+async def get_orders_raw_paginated(
+    shop_domain: str,
+    access_token: str,
+    updated_at_min: Optional[str] = None,
+    cursor: Optional[str] = None,
+    page_limit: int = 250,
+    max_pages: Optional[int] = None,
+) -> tuple[list[dict], Optional[str]]:
+    """
+    Fetch raw orders following Link rel=next, oldest update first so callers can checkpoint
+    the last updated_at they processed. cursor is a saved rel=next URL to resume a capped walk.
+    Returns (orders, next_cursor); next_cursor is set only when max_pages stopped the walk early.
+    """
+    if cursor:
+        url = cursor
+        params: dict = {}
+    else:
+        url = f"{_base_url(shop_domain)}/orders.json"
+        params = {"status": "any", "limit": page_limit, "order": "updated_at asc"}
+        if updated_at_min:
+            params["updated_at_min"] = updated_at_min
+    h = _headers(access_token)
+    all_orders: list[dict] = []
+    page = 0
+    next_url: Optional[str] = None
+    client = get_client("shopify")
+    while True:
+        page += 1
+        response = await client.get(url, params=params, headers=h)
+        body = response.text[:300] if response.text else ""
+        _log_shopify_response("GET", url, response.status_code, body)
         response.raise_for_status()
-    data = response.json()
-    return data.get("orders", [])
+        orders = response.json().get("orders") or []
+        all_orders.extend(orders)
+        next_url = _parse_link_next(response.headers.get("link")) if len(orders) >= page_limit else None
+        if not next_url:
+            break
+        if max_pages and page >= max_pages:
+            break
+        url = next_url
+        params = {}  # page_info URL already has params; do not add extra
+    logger.info("Shopify orders: got %s order(s) across %s page(s)", len(all_orders), page)
+    return all_orders, next_url
+
+
+def latest_updated_at(orders: list[dict], current: Optional[str] = None) -> Optional[str]:
+    """Max updated_at (ISO 8601) across orders, starting from current. Used as the next sync watermark."""
+    best = current
+    best_dt = _parse_shopify_ts(current) if current else None
+    for o in orders or []:
+        ts = o.get("updated_at")
+        dt = _parse_shopify_ts(ts) if ts else None
+        if dt and (best_dt is None or dt > best_dt):
+            best, best_dt = ts, dt
+    return best
+
+
+def _parse_shopify_ts(value: Optional[str]) -> Optional[datetime]:
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
 
 
 async def get_products(shop_domain: str, access_token: str, limit: int = 250) -> list[dict]:
@@ -138,14 +207,13 @@ async def get_products(shop_domain: str, access_token: str, limit: int = 250) ->
     GET /admin/api/2024-01/products.json
     """
     url = f"{_base_url(shop_domain)}/products.json"
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            url,
-            params={"limit": limit},
-            headers=_headers(access_token),
-            timeout=30.0,
-        )
-        response.raise_for_status()
+    client = get_client("shopify")
+    response = await client.get(
+        url,
+        params={"limit": limit},
+        headers=_headers(access_token),
+    )
+    response.raise_for_status()
     data = response.json()
     return data.get("products", [])
 
@@ -161,24 +229,24 @@ async def get_products_all_pages(shop_domain: str, access_token: str, page_limit
     params: dict = {"limit": page_limit}
     all_products: list[dict] = []
     page = 0
-    async with httpx.AsyncClient() as client:
-        while True:
-            page += 1
-            response = await client.get(url, params=params, headers=h, timeout=30.0)
-            body = response.text[:300] if response.text else ""
-            _log_shopify_response("GET", url, response.status_code, body)
-            response.raise_for_status()
-            data = response.json()
-            products = data.get("products") or []
-            all_products.extend(products)
-            logger.info("Shopify products page %s: got %s (total so far: %s)", page, len(products), len(all_products))
-            if len(products) < page_limit:
-                break
-            next_url = _parse_link_next(response.headers.get("link"))
-            if not next_url:
-                break
-            url = next_url
-            params = {}  # page_info URL already has params; do not add extra
+    client = get_client("shopify")
+    while True:
+        page += 1
+        response = await client.get(url, params=params, headers=h)
+        body = response.text[:300] if response.text else ""
+        _log_shopify_response("GET", url, response.status_code, body)
+        response.raise_for_status()
+        data = response.json()
+        products = data.get("products") or []
+        all_products.extend(products)
+        logger.info("Shopify products page %s: got %s (total so far: %s)", page, len(products), len(all_products))
+        if len(products) < page_limit:
+            break
+        next_url = _parse_link_next(response.headers.get("link"))
+        if not next_url:
+            break
+        url = next_url
+        params = {}  # page_info URL already has params; do not add extra
     logger.info("Shopify products: got %s product(s) across %s page(s)", len(all_products), page)
     return all_products
 
@@ -191,16 +259,15 @@ async def get_locations(shop_domain: str, access_token: str) -> list[dict]:
     base = _base_url(shop_domain)
     url = f"{base}/locations.json"
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                params={"limit": 50},
-                headers=_headers(access_token),
-                timeout=15.0,
-            )
-            body = response.text[:300] if response.text else ""
-            _log_shopify_response("GET", url, response.status_code, body)
-            response.raise_for_status()
+        client = get_client("shopify")
+        response = await client.get(
+            url,
+            params={"limit": 50},
+            headers=_headers(access_token),
+        )
+        body = response.text[:300] if response.text else ""
+        _log_shopify_response("GET", url, response.status_code, body)
+        response.raise_for_status()
         data = response.json()
         locs = data.get("locations") or []
         logger.info("Shopify locations: got %s location(s)", len(locs))
@@ -235,7 +302,92 @@ def _variants_from_products(products: list[dict]) -> list[dict]:
     return out
 
 
-async def get_inventory(shop_domain: str, access_token: str) -> list[dict]:
+# inventory_levels.json accepts at most 50 inventory_item_ids and 50 location_ids per request
+INVENTORY_LEVELS_CHUNK_SIZE = 50
+INVENTORY_LEVELS_CONCURRENCY = 4
+
+
+def _chunks(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def _get_inventory_levels_chunk(
+    client: httpx.AsyncClient,
+    url: str,
+    params: dict,
+    headers: dict,
+    sem: asyncio.Semaphore,
+    max_attempts: int = 4,
+) -> list[dict]:
+    """All pages of inventory_levels for one (item chunk, location chunk). Retries 429s (the pooled
+    client's rate limiter holds the retry until Retry-After has passed)."""
+    levels: list[dict] = []
+    attempts = 0
+    while True:
+        async with sem:
+            response = await client.get(url, params=params, headers=headers)
+        if response.status_code == 429 and attempts < max_attempts:
+            attempts += 1
+            continue
+        body = response.text[:300] if response.text else ""
+        _log_shopify_response("GET", url, response.status_code, body)
+        response.raise_for_status()
+        attempts = 0
+        page = response.json().get("inventory_levels") or []
+        levels.extend(page)
+        next_url = _parse_link_next(response.headers.get("link")) if len(page) >= (params.get("limit") or 250) else None
+        if not next_url:
+            return levels
+        url = next_url
+        params = {"limit": 250}  # page_info URL carries the filters; limit is still allowed
+
+
+async def get_inventory_levels(
+    shop_domain: str,
+    access_token: str,
+    inventory_item_ids: list,
+    location_ids: list,
+) -> tuple[list[dict], set]:
+    """
+    Step 4 of inventory pipeline. Splits item (and location) ids into API-sized chunks, paginates each
+    chunk and runs chunks with bounded concurrency. A failed chunk is logged and skipped; returns
+    (levels, inventory_item_ids of failed chunks) so callers never mistake a failed item for 0 available.
+    """
+    if not inventory_item_ids:
+        return [], set()
+    url = f"{_base_url(shop_domain)}/inventory_levels.json"
+    h = _headers(access_token)
+    item_chunks = _chunks(list(inventory_item_ids), INVENTORY_LEVELS_CHUNK_SIZE)
+    loc_chunks = _chunks(list(location_ids), INVENTORY_LEVELS_CHUNK_SIZE) if location_ids else [[]]
+    sem = asyncio.Semaphore(INVENTORY_LEVELS_CONCURRENCY)
+    levels: list[dict] = []
+    failed = 0
+    failed_item_ids: set = set()
+    client = get_client("shopify")
+    tasks = []
+    task_items = []
+    for items in item_chunks:
+        for locs in loc_chunks:
+            params: dict = {"limit": 250, "inventory_item_ids": ",".join(str(x) for x in items)}
+            if locs:
+                params["location_ids"] = ",".join(str(x) for x in locs)
+            tasks.append(_get_inventory_levels_chunk(client, url, params, h, sem))
+            task_items.append(items)
+    for items, res in zip(task_items, await asyncio.gather(*tasks, return_exceptions=True)):
+        if isinstance(res, Exception):
+            failed += 1
+            failed_item_ids.update(items)
+            logger.warning("Shopify inventory_levels chunk failed (read_inventory, read_locations): %s", res)
+            continue
+        levels.extend(res)
+    logger.info(
+        "Shopify inventory_levels: got %s level(s) from %s chunk(s), %s failed",
+        len(levels), len(tasks), failed,
+    )
+    return levels, failed_item_ids
+
+
+async def get_inventory(shop_domain: str, access_token: str) -> tuple[list[dict], set]:
     """
     Full inventory pipeline (no silent fails):
     1) GET products.json
@@ -243,26 +395,25 @@ async def get_inventory(shop_domain: str, access_token: str) -> list[dict]:
     3) GET locations.json
     4) GET inventory_levels.json?inventory_item_ids=...&location_ids=...
     5) Merge into normalized: sku, product_name, variant_id, inventory_item_id, location_id, available
-    Defensive: never raises. Returns [] on error. Logs every step.
+    Returns (rows, failed inventory_item_ids). Items whose levels could not be fetched have no rows (not
+    even the 0-available backfill); pass the ids to persist_shopify_inventory so their stored levels are kept.
+    Defensive: never raises. Returns ([], set()) on error. Logs every step.
     """
-    base = _base_url(shop_domain)
-    h = _headers(access_token)
-
     # Step 1: Get all products (paginated; not just first 250)
     products: list[dict] = []
     try:
         products = await get_products_all_pages(shop_domain, access_token, page_limit=250)
     except (httpx.HTTPStatusError, Exception) as e:
         logger.warning("Shopify products failed (read_products scope): %s", e)
-        return []
+        return [], set()
 
     # Step 2: Extract variants with inventory_item_id
     variants = _variants_from_products(products)
     if not variants:
         logger.warning("Shopify inventory: no variants with inventory_item_id found")
-        return []
+        return [], set()
 
-    inventory_item_ids = [v["inventory_item_id"] for v in variants if v.get("inventory_item_id") is not None]
+    inventory_item_ids = list(dict.fromkeys(v["inventory_item_id"] for v in variants if v.get("inventory_item_id") is not None))
     inv_by_id = {v["inventory_item_id"]: v for v in variants}
 
     # Step 3: Get locations
@@ -271,33 +422,24 @@ async def get_inventory(shop_domain: str, access_token: str) -> list[dict]:
     if not location_ids:
         logger.warning("Shopify inventory: no locations (read_locations required); levels may be empty")
 
-    # Step 4: Get inventory levels (need both params for full data)
-    levels: list[dict] = []
-    try:
-        url = f"{base}/inventory_levels.json"
-        params: dict = {"limit": 250}
-        if inventory_item_ids:
-            params["inventory_item_ids"] = ",".join(str(x) for x in inventory_item_ids[:250])
-        if location_ids:
-            params["location_ids"] = ",".join(str(x) for x in location_ids[:50])
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, headers=h, timeout=30.0)
-            body = response.text[:300] if response.text else ""
-            _log_shopify_response("GET", url, response.status_code, body)
-            response.raise_for_status()
-        data = response.json()
-        levels = data.get("inventory_levels") or []
-        logger.info("Shopify inventory_levels: got %s level(s)", len(levels))
-    except (httpx.HTTPStatusError, Exception) as e:
-        logger.warning("Shopify inventory_levels failed (read_inventory, read_locations): %s", e)
-        levels = []
+    # Step 4: Get inventory levels in API-sized chunks (need both params for full data)
+    levels, failed_item_ids = await get_inventory_levels(shop_domain, access_token, inventory_item_ids, location_ids)
 
-    # Step 5: Merge
+    # Step 5: Merge (a failed item may still have levels from its other location chunks; a partial set is not stock)
     result: list[dict] = []
+    seen: set = set()
+    items_with_level: set = set()
     for lev in levels or []:
         if not isinstance(lev, dict):
             continue
         iid = lev.get("inventory_item_id")
+        if iid in failed_item_ids:
+            continue
+        key = (iid, lev.get("location_id"))
+        if key in seen:
+            continue
+        seen.add(key)
+        items_with_level.add(iid)
         v = inv_by_id.get(iid) if iid is not None else None
         sku = (v.get("sku") or "—") if v else "—"
         product_name = (v.get("product_title") or sku) if v else "—"
@@ -310,30 +452,34 @@ async def get_inventory(shop_domain: str, access_token: str) -> list[dict]:
             "location": str(lev.get("location_id") or ""),
             "available": int(lev.get("available", 0) or 0),
         })
-    # Include variants that have no level (0 available)
-    seen = {(r.get("inventory_item_id"), r.get("location_id")): True for r in result}
+    # Include variants that have no level (0 available); failed items are unknown, not 0
     for v in variants:
+        iid = v.get("inventory_item_id")
+        if iid in failed_item_ids:
+            continue
         if not location_ids:
-            if not any(r.get("inventory_item_id") == v.get("inventory_item_id") for r in result):
+            if iid not in items_with_level:
+                items_with_level.add(iid)
                 result.append({
                     "sku": v.get("sku") or "—",
                     "product_name": v.get("product_title") or "—",
                     "variant_id": v.get("variant_id"),
-                    "inventory_item_id": v.get("inventory_item_id"),
+                    "inventory_item_id": iid,
                     "location_id": None,
                     "location": "",
                     "available": 0,
                 })
         else:
             for loc_id in location_ids:
-                if (v.get("inventory_item_id"), loc_id) not in seen:
+                if (iid, loc_id) not in seen:
+                    seen.add((iid, loc_id))
                     result.append({
                         "sku": v.get("sku") or "—",
                         "product_name": v.get("product_title") or "—",
                         "variant_id": v.get("variant_id"),
-                        "inventory_item_id": v.get("inventory_item_id"),
+                        "inventory_item_id": iid,
                         "location_id": loc_id,
                         "location": str(loc_id),
                         "available": 0,
                     })
-    return result
+    return result, failed_item_ids
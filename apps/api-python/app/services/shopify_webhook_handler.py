@@ -24,10 +24,11 @@ from app.models import (
     PaymentMode,
     FulfillmentStatus,
     ShopifyIntegration,
+    ShopifyInventory,
     WebhookEvent,
 )
-from app.services.shopify_inventory_persist import persist_shopify_inventory
-from app.services.shopify_service import get_inventory as shopify_get_inventory
+from app.services.shopify_inventory_persist import apply_inventory_level
+from app.services.shopify_inventory_refresh import schedule_inventory_refresh
 from app.services.profit_calculator import compute_profit_for_order
 
 logger = logging.getLogger(__name__)
@@ -166,6 +167,40 @@ def _upsert_order_from_payload(db: Session, shop_domain: str, payload: dict) ->
     return order_id
 
 
+def _apply_product_update(db: Session, shop_domain: str, payload: dict) -> bool:
+    """
+    products/update: refresh cached product names for known inventory items.
+    Returns True when a full inventory refresh is needed (new variant/item or SKU changed).
+    """
+    title = (payload.get("title") or "").strip()
+    variants = [v for v in payload.get("variants") or [] if isinstance(v, dict) and v.get("inventory_item_id")]
+    if not variants:
+        return False
+    item_ids = [str(v["inventory_item_id"]) for v in variants]
+    rows = (
+        db.query(ShopifyInventory)
+        .filter(ShopifyInventory.shop_domain == shop_domain, ShopifyInventory.inventory_item_id.in_(item_ids))
+        .all()
+    )
+    rows_by_item: dict[str, list] = {}
+    for r in rows:
+        rows_by_item.setdefault(r.inventory_item_id, []).append(r)
+    needs_refresh = False
+    for v in variants:
+        item_rows = rows_by_item.get(str(v["inventory_item_id"]))
+        if not item_rows:
+            needs_refresh = True
+            continue
+        sku = (v.get("sku") or "").strip()
+        for r in item_rows:
+            if sku and r.sku != sku:
+                needs_refresh = True
+            elif title:
+                r.product_name = title[:255]
+    db.flush()
+    return needs_refresh
+
+
 def process_shopify_webhook(
     db: Session,
     shop_domain: str,
@@ -174,7 +209,8 @@ def process_shopify_webhook(
     event_id: Optional[str] = None,
 ) -> None:
     """
-    Dispatch by topic: upsert order, cancel order, recompute profit, or sync inventory.
+    Dispatch by topic: upsert order, cancel order, recompute profit, or apply an inventory change.
+    Inventory topics update the cached rows directly; a debounced full refresh runs only for unknown items.
     """
     try:
         if topic in ("orders/create", "orders/updated"):
@@ -213,15 +249,24 @@ def process_shopify_webhook(
                     if order:
                         compute_profit_for_order(db, order.id)
                         logger.info("Webhook refunds/create: recomputed profit for order %s", order.id)
-        elif topic in ("inventory_levels/update", "products/update"):
-            integration, _ = _get_integration_and_account(db, shop_domain)
-            if integration:
-                try:
-                    inv_list = shopify_get_inventory(integration.shop_domain, integration.access_token)
-                    persist_shopify_inventory(db, integration.shop_domain, inv_list or [])
-                    logger.info("Webhook %s: synced inventory for %s", topic, shop_domain)
-                except Exception as e:
-                    logger.warning("Webhook inventory sync failed: %s", e)
+        elif topic == "inventory_levels/update":
+            applied = apply_inventory_level(
+                db,
+                shop_domain,
+                payload.get("inventory_item_id"),
+                payload.get("location_id"),
+                payload.get("available"),
+            )
+            if applied:
+                logger.info(
+                    "Webhook inventory_levels/update: item %s at location %s -> %s",
+                    payload.get("inventory_item_id"), payload.get("location_id"), payload.get("available"),
+                )
+            else:
+                schedule_inventory_refresh(shop_domain)
+        elif topic == "products/update":
+            if _apply_product_update(db, shop_domain, payload):
+                schedule_inventory_refresh(shop_domain)
         else:
             logger.debug("Webhook topic %s: no handler", topic)
 
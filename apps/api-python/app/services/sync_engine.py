@@ -121,18 +121,18 @@ class SyncEngine:
                     "Shopify not connected for this account. Connect via OAuth and ensure ShopifyIntegration exists."
                 )
 
-            inv_list = await shopify_get_inventory(
+            inv_list, failed_item_ids = await shopify_get_inventory(
                 integration.shop_domain,
                 integration.access_token,
             )
             inventory_synced = persist_shopify_inventory(
-                self.db, integration.shop_domain, inv_list or []
+                self.db, integration.shop_domain, inv_list or [], failed_item_ids
             )
 
             sync_job.status = SyncJobStatus.SUCCESS
             sync_job.finished_at = datetime.now(timezone.utc)
             sync_job.records_processed = len(inv_list or [])
-            sync_job.records_failed = 0
+            sync_job.records_failed = len(failed_item_ids)
 
             log = SyncLog(
                 sync_job_id=sync_job.id,
@@ -0,0 +1,76 @@
+"""
+Per-user cache of channel-account ids (the tenant scope most controllers filter by).
+Cached for TENANT_SCOPE_CACHE_TTL_SEC; a Session hook drops a user's entry after any commit that
+creates, deletes or re-assigns one of their channel accounts (connect/disconnect). Per process:
+other workers see the change within the TTL.
+"""
+import threading
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import ChannelAccount
+
+_INFO_KEY = "tenant_scope_users"
+
+_cache: dict[str, tuple[float, tuple[str, ...]]] = {}
+_lock = threading.Lock()
+
+
+async def get_channel_account_ids(db: AsyncSession, user_id: str) -> list[str]:
+    """Ids of the user's channel accounts (cached)."""
+    ttl = settings.TENANT_SCOPE_CACHE_TTL_SEC
+    now = time.monotonic()
+    if ttl > 0:
+        with _lock:
+            hit = _cache.get(user_id)
+        if hit and hit[0] > now:
+            return list(hit[1])
+    ids = tuple((await db.execute(select(ChannelAccount.id).where(ChannelAccount.user_id == user_id))).scalars().all())
+    if ttl > 0:
+        with _lock:
+            _cache[user_id] = (now + ttl, ids)
+    return list(ids)
+
+
+def invalidate_tenant_scope(user_ids: Optional[Iterable[str]] = None) -> None:
+    """Drop cached scopes for these users, or for everyone."""
+    with _lock:
+        if user_ids is None:
+            _cache.clear()
+            return
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_scope_changes(session: Session, flush_context, instances) -> None:
+    users: set[str] = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, ChannelAccount):
+            users.add(obj.user_id)
+    for obj in session.dirty:
+        if isinstance(obj, ChannelAccount):
+            hist = inspect(obj).attrs.user_id.history
+            if hist.has_changes():
+                users.update(hist.added or ())
+                users.update(hist.deleted or ())
+    users.discard(None)
+    if users:
+        session.info.setdefault(_INFO_KEY, set()).update(users)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session: Session) -> None:
+    users = session.info.pop(_INFO_KEY, None)
+    if users:
+        invalidate_tenant_scope(users)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session) -> None:
+    session.info.pop(_INFO_KEY, None)
@@ -0,0 +1,83 @@
+"""
+Per-process cache of authenticated users keyed by the JWT `sub` (user id), so get_current_user does
+not load the users row on every request. Cached for USER_CACHE_TTL_SEC; a Session hook drops a user's
+entry after any commit that updates or deletes them (/users PATCH/DELETE, password reset). Hits return a
+fresh transient User built from a column snapshot (never a shared instance, never the password hash).
+Per process: other workers see role/email changes within the TTL.
+"""
+import threading
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import User
+
+_INFO_KEY = "user_cache_ids"
+MAX_ENTRIES = 10000
+# Columns controllers read off current_user; secrets are left out of the cache
+_FIELDS = ("id", "name", "email", "role", "created_at", "updated_at")
+
+_cache: dict[str, tuple[float, dict]] = {}
+_lock = threading.Lock()
+
+
+def get_cached_user(user_id: str) -> Optional[User]:
+    """A detached copy of the cached user, or None on miss/expiry."""
+    if settings.USER_CACHE_TTL_SEC <= 0:
+        return None
+    with _lock:
+        hit = _cache.get(user_id)
+    if not hit or hit[0] <= time.monotonic():
+        return None
+    return User(**hit[1])
+
+
+def cache_user(user: User) -> None:
+    ttl = settings.USER_CACHE_TTL_SEC
+    if ttl <= 0 or not user.id:
+        return
+    now = time.monotonic()
+    snapshot = {f: getattr(user, f) for f in _FIELDS}
+    with _lock:
+        if len(_cache) >= MAX_ENTRIES:
+            for key in [k for k, (expires, _) in _cache.items() if expires <= now]:
+                _cache.pop(key, None)
+            if len(_cache) >= MAX_ENTRIES:
+                _cache.clear()
+        _cache[user.id] = (now + ttl, snapshot)
+
+
+def invalidate_users(user_ids: Optional[Iterable[str]] = None) -> None:
+    """Drop cached users, or everyone."""
+    with _lock:
+        if user_ids is None:
+            _cache.clear()
+            return
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_user_changes(session: Session, flush_context, instances) -> None:
+    ids = {
+        obj.id
+        for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, User) and obj.id
+    }
+    if ids:
+        session.info.setdefault(_INFO_KEY, set()).update(ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session: Session) -> None:
+    ids = session.info.pop(_INFO_KEY, None)
+    if ids:
+        invalidate_users(ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session) -> None:
+    session.info.pop(_INFO_KEY, None)
@@ -0,0 +1,265 @@
+"""
+Durable webhook queue: the receiver stores the raw payload on WebhookEvent (status PENDING) and acks;
+a bounded pool of async workers drains events with per-shop ordering, retries with backoff
+and a DEAD (dead-letter) state after WEBHOOK_MAX_ATTEMPTS.
+State lives in webhook_events, so events survive restarts and can be re-queued via /events/{id}/retry.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import and_, exists, func, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import WebhookEvent, WebhookEventStatus
+
+logger = logging.getLogger(__name__)
+
+RETRY_BACKOFF_BASE_SEC = 30
+RETRY_BACKOFF_MAX_SEC = 3600
+# A PROCESSING event whose lease expired (worker crashed/restarted) goes back to PENDING
+PROCESSING_LEASE_SEC = 300
+# Shop queue heads considered per claim pass (one row per shop, oldest first)
+SCAN_LIMIT = 500
+
+_wakeup: Optional[asyncio.Event] = None
+_active_shops: set[str] = set()
+
+
+def _utcnow() -> datetime:
+    """Naive UTC (webhook_events timestamps are TIMESTAMP WITHOUT TIME ZONE)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(RETRY_BACKOFF_BASE_SEC * (2 ** max(0, attempts - 1)), RETRY_BACKOFF_MAX_SEC))
+
+
+def notify() -> None:
+    """Wake the dispatcher (called after enqueue/retry in this process)."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def enqueue_event(
+    db: Session,
+    source: str,
+    shop_domain: str,
+    topic: str,
+    raw_body: bytes,
+    payload_summary: Optional[str] = None,
+    claim: bool = False,
+) -> WebhookEvent:
+    """
+    Persist a verified webhook as PENDING and commit; the worker pool processes it.
+    claim=True stores it as PROCESSING (leased) for a caller that processes it inline.
+    """
+    now = _utcnow()
+    event = WebhookEvent(
+        source=source,
+        shop_domain=shop_domain,
+        topic=topic,
+        payload_summary=payload_summary,
+        payload=raw_body.decode("utf-8") if raw_body else "",
+        status=(WebhookEventStatus.PROCESSING if claim else WebhookEventStatus.PENDING).value,
+        attempts=0,
+        next_attempt_at=now + timedelta(seconds=PROCESSING_LEASE_SEC) if claim else now,
+        # Explicit (sub-second) arrival time: per-shop ordering sorts on created_at
+        created_at=now,
+    )
+    db.add(event)
+    db.commit()
+    if not claim:
+        notify()
+    return event
+
+
+def requeue_event(db: Session, event: WebhookEvent) -> None:
+    """Reset an event (failed, dead or done) to PENDING with a fresh attempt budget."""
+    event.status = WebhookEventStatus.PENDING.value
+    event.attempts = 0
+    event.next_attempt_at = _utcnow()
+    event.error = None
+    event.processed_at = None
+    db.commit()
+    notify()
+
+
+def mark_failed(db: Session, event: WebhookEvent, error: str) -> None:
+    """Record a failed attempt: schedule a retry with backoff, or dead-letter after max attempts."""
+    event.attempts = (event.attempts or 0) + 1
+    event.error = (error or "")[:500]
+    if event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+        event.status = WebhookEventStatus.DEAD.value
+        event.next_attempt_at = None
+        logger.warning(
+            "Webhook event %s (%s %s) dead-lettered after %s attempts: %s",
+            event.id, event.shop_domain, event.topic, event.attempts, event.error,
+        )
+    else:
+        event.status = WebhookEventStatus.PENDING.value
+        event.next_attempt_at = _utcnow() + _backoff(event.attempts)
+
+
+def _process_event(event_id: str) -> None:
+    """Run the topic handler for one claimed event in its own session (called in a worker thread)."""
+    from app.services.shopify_webhook_handler import process_shopify_webhook
+
+    db = SessionLocal()
+    try:
+        event = db.query(WebhookEvent).filter(WebhookEvent.id == event_id).first()
+        if not event:
+            return
+        try:
+            payload = json.loads(event.payload) if event.payload else {}
+            if event.source == "shopify":
+                process_shopify_webhook(db, event.shop_domain or "", event.topic, payload, event_id=event.id)
+            else:
+                logger.debug("Webhook event %s: no processor for source %s", event.id, event.source)
+            event.status = WebhookEventStatus.DONE.value
+            event.error = None
+            event.next_attempt_at = None
+            event.processed_at = event.processed_at or _utcnow()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            event = db.query(WebhookEvent).filter(WebhookEvent.id == event_id).first()
+            if event:
+                mark_failed(db, event, str(e))
+                db.commit()
+    finally:
+        db.close()
+
+
+def _claim_next(db: Session, busy_shops: set[str], max_claims: int) -> list[tuple[str, str]]:
+    """
+    Claim the oldest unfinished event per shop when it is due and no event for that shop is in flight.
+    Ordering: a shop's later events wait behind an earlier event that is backing off.
+    Only each shop's head event is read (row_number per shop_domain), so one shop's burst cannot fill
+    the scan and starve other tenants.
+    The conditional UPDATE (status still PENDING, no PROCESSING sibling) keeps concurrent workers
+    in other processes from claiming the same event or a second event for the same shop.
+    """
+    now = _utcnow()
+    # Leases left by a crashed worker go back to the queue
+    db.execute(
+        update(WebhookEvent)
+        .where(
+            WebhookEvent.status == WebhookEventStatus.PROCESSING.value,
+            WebhookEvent.next_attempt_at < now,
+        )
+        .values(status=WebhookEventStatus.PENDING.value, next_attempt_at=now)
+    )
+    unfinished = (
+        select(
+            WebhookEvent.id,
+            WebhookEvent.shop_domain,
+            WebhookEvent.next_attempt_at,
+            WebhookEvent.status,
+            WebhookEvent.created_at,
+            func.row_number()
+            .over(
+                partition_by=WebhookEvent.shop_domain,
+                order_by=(WebhookEvent.created_at.asc(), WebhookEvent.id.asc()),
+            )
+            .label("position"),
+        )
+        .where(WebhookEvent.status.in_([WebhookEventStatus.PENDING.value, WebhookEventStatus.PROCESSING.value]))
+        .subquery()
+    )
+    heads = db.execute(
+        select(unfinished.c.id, unfinished.c.shop_domain)
+        .where(
+            unfinished.c.position == 1,
+            unfinished.c.status == WebhookEventStatus.PENDING.value,
+            or_(unfinished.c.next_attempt_at.is_(None), unfinished.c.next_attempt_at <= now),
+        )
+        .order_by(unfinished.c.created_at.asc(), unfinished.c.id.asc())
+        .limit(SCAN_LIMIT)
+    ).all()
+    claimed: list[tuple[str, str]] = []
+    sibling = aliased(WebhookEvent)
+    for event_id, shop in heads:
+        if len(claimed) >= max_claims:
+            break
+        shop_key = shop or ""
+        if shop_key in busy_shops:
+            continue
+        result = db.execute(
+            update(WebhookEvent)
+            .where(
+                WebhookEvent.id == event_id,
+                WebhookEvent.status == WebhookEventStatus.PENDING.value,
+                ~exists().where(
+                    and_(
+                        sibling.shop_domain == shop if shop else sibling.shop_domain.is_(None),
+                        sibling.status == WebhookEventStatus.PROCESSING.value,
+                    )
+                ),
+            )
+            .values(
+                status=WebhookEventStatus.PROCESSING.value,
+                next_attempt_at=now + timedelta(seconds=PROCESSING_LEASE_SEC),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            claimed.append((event_id, shop_key))
+    db.commit()
+    return claimed
+
+
+def _claim_batch(busy_shops: set[str], max_claims: int) -> list[tuple[str, str]]:
+    db = SessionLocal()
+    try:
+        return _claim_next(db, busy_shops, max_claims)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def _run_one(event_id: str, shop_key: str) -> None:
+    try:
+        await asyncio.to_thread(_process_event, event_id)
+    except Exception as e:
+        logger.exception("Webhook worker failed on event %s: %s", event_id, e)
+    finally:
+        _active_shops.discard(shop_key)
+        notify()
+
+
+async def run_webhook_worker() -> None:
+    """
+    Dispatcher loop: claim due events (one in flight per shop) and run them on at most
+    WEBHOOK_WORKER_CONCURRENCY workers. Wakes on notify() or every WEBHOOK_POLL_INTERVAL_SEC.
+    """
+    global _wakeup
+    _wakeup = asyncio.Event()
+    concurrency = max(1, settings.WEBHOOK_WORKER_CONCURRENCY)
+    logger.info(
+        "Webhook worker started (concurrency=%s, max_attempts=%s)",
+        concurrency, settings.WEBHOOK_MAX_ATTEMPTS,
+    )
+    while True:
+        _wakeup.clear()
+        # One event in flight per shop, so active shops == busy workers
+        free = concurrency - len(_active_shops)
+        claimed = []
+        if free > 0:
+            try:
+                claimed = await asyncio.to_thread(_claim_batch, set(_active_shops), free)
+            except Exception as e:
+                logger.exception("Webhook worker claim failed: %s", e)
+        for event_id, shop_key in claimed:
+            _active_shops.add(shop_key)
+            asyncio.create_task(_run_one(event_id, shop_key))
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=settings.WEBHOOK_POLL_INTERVAL_SEC)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,103 @@
+"""
+Per-shop cache of decrypted Shopify app secrets used to verify webhook HMACs.
+Candidates: ShopifyIntegration.app_secret_encrypted, shopify_app ProviderCredential of every user with
+the shop connected, and SHOPIFY_API_SECRET. Cached per shop for WEBHOOK_SECRET_CACHE_TTL_SEC; the
+shopify_app connect endpoint and the OAuth callback invalidate it. The cache is per process, so callers
+reload once (refresh=True) when no cached candidate verifies before rejecting the webhook; that reload
+only hits the DB when the cached entry is older than REFRESH_MIN_AGE_SEC, so a stream of forged or
+mis-signed webhooks for a shop cannot turn into one secrets query (and decrypts) per request.
+"""
+import json
+import logging
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import ChannelAccount, ProviderCredential, ShopifyIntegration
+from app.services.credentials import decrypt_token
+
+logger = logging.getLogger(__name__)
+
+# Minimum age of a cached entry before refresh=True reloads it
+REFRESH_MIN_AGE_SEC = 5.0
+
+# shop_domain -> (loaded_at, candidates); monotonic time
+_cache: dict[str, tuple[float, list[str]]] = {}
+_lock = threading.Lock()
+
+
+def _secret_from_provider_credential(value_encrypted: str) -> str:
+    raw = decrypt_token(value_encrypted)
+    if isinstance(raw, str) and raw.strip().startswith("{"):
+        data = json.loads(raw)
+        return (data.get("apiSecret") or data.get("appSecret") or "").strip()
+    return raw.strip() if isinstance(raw, str) else ""
+
+
+def _load_candidates(db: Session, shop_domain: str) -> list[str]:
+    candidates: list[str] = []
+
+    def _add(secret: str) -> None:
+        if secret and secret not in candidates:
+            candidates.append(secret)
+
+    integration = db.query(ShopifyIntegration).filter(ShopifyIntegration.shop_domain == shop_domain).first()
+    if integration and getattr(integration, "app_secret_encrypted", None):
+        try:
+            _add((decrypt_token(integration.app_secret_encrypted) or "").strip())
+        except Exception:
+            pass
+    # ProviderCredential (shopify_app) for any user who has this shop connected: one joined query
+    creds = (
+        db.query(ProviderCredential.value_encrypted)
+        .join(ChannelAccount, ChannelAccount.user_id == ProviderCredential.user_id)
+        .filter(
+            ChannelAccount.shop_domain == shop_domain,
+            ChannelAccount.access_token.isnot(None),
+            ProviderCredential.provider_id == "shopify_app",
+            ProviderCredential.value_encrypted.isnot(None),
+        )
+        .distinct()
+        .all()
+    )
+    for (value_encrypted,) in creds:
+        try:
+            _add(_secret_from_provider_credential(value_encrypted))
+        except Exception:
+            pass
+    # Env (OAuth flow registers webhooks with SHOPIFY_API_SECRET)
+    _add((getattr(settings, "SHOPIFY_API_SECRET", None) or "").strip())
+    return candidates
+
+
+def get_webhook_secret_candidates(db: Session, shop_domain: str, refresh: bool = False) -> list[str]:
+    """
+    Decrypted candidate app secrets for shop_domain (cached for WEBHOOK_SECRET_CACHE_TTL_SEC).
+    refresh=True bypasses the cache unless the entry was loaded less than REFRESH_MIN_AGE_SEC ago.
+    """
+    ttl = settings.WEBHOOK_SECRET_CACHE_TTL_SEC
+    now = time.monotonic()
+    if ttl > 0:
+        with _lock:
+            hit = _cache.get(shop_domain)
+        if hit:
+            age = now - hit[0]
+            if age < (min(REFRESH_MIN_AGE_SEC, ttl) if refresh else ttl):
+                return hit[1]
+    candidates = _load_candidates(db, shop_domain)
+    if ttl > 0:
+        with _lock:
+            _cache[shop_domain] = (now, candidates)
+    return candidates
+
+
+def invalidate_webhook_secrets(shop_domain: Optional[str] = None) -> None:
+    """Drop cached secrets for one shop, or for all shops (e.g. a user's shopify_app secret changed)."""
+    with _lock:
+        if shop_domain is None:
+            _cache.clear()
+        else:
+            _cache.pop(shop_domain, None)
@@ -18,8 +18,13 @@ from app.database import engine, Base, get_db, SessionLocal
 from app.config import settings
 from app.services.shopify_oauth import ShopifyOAuthService
 from app.services.shipment_sync import sync_shipments
+from app.services.rate_cards import reconcile_shipping_costs
 from app.services.ad_spend_sync import sync_ad_spend_for_date, get_first_user_id_for_sync
 from app.services.credentials import encrypt_token, decrypt_token
+from app.services.http_client import init_clients, close_clients
+from app.services.webhook_queue import run_webhook_worker
+from app.services.webhook_secrets import invalidate_webhook_secrets
+from app.services.shopify_inventory_refresh import bind_event_loop as bind_inventory_refresh_loop
 from app.models import (
     User,
     Channel,
@@ -30,10 +35,8 @@ from app.models import (
     ShopifyIntegration,
     AuditLog,
     AuditLogAction,
-    Order,
 )
-from app.services.profit_calculator import compute_profit_for_order
-from sqlalchemy import func
+from app.services.profit_queue import enqueue_profit_recompute, run_profit_recompute_worker
 from jose import jwt, JWTError
 import json
 import time
@@ -184,36 +187,103 @@ async def health():
     }
 
 
-# --- Unified courier 30-min poll: Delhivery + Selloship, RTO/Lost → profit recalc ---
-SHIPMENT_POLL_INTERVAL_SEC = int(os.getenv("SHIPMENT_POLL_INTERVAL_SEC", "1800"))  # 30 min
+@app.on_event("startup")
+async def startup_http_clients() -> None:
+    """Create pooled outbound HTTP clients (keep-alive per provider)."""
+    init_clients()
+
+
+@app.on_event("shutdown")
+async def shutdown_http_clients() -> None:
+    """Close pooled outbound HTTP clients."""
+    await close_clients()
+
+
+@app.on_event("startup")
+async def startup_webhook_worker() -> None:
+    """Start background webhook queue workers (drain stored Shopify webhook events)."""
+    bind_inventory_refresh_loop(asyncio.get_running_loop())
+    asyncio.create_task(run_webhook_worker())
+
+
+@app.on_event("startup")
+async def startup_profit_recompute_worker() -> None:
+    """Start the background profit recompute queue (cost / ad spend / shipment invalidations)."""
+    asyncio.create_task(run_profit_recompute_worker())
+
+
+# --- Unified courier poll: Delhivery + Selloship, adaptive per-shipment schedule (next_poll_at), RTO/Lost → profit recalc ---
+SHIPMENT_POLL_TICK_SEC = int(os.getenv("SHIPMENT_POLL_TICK_SEC", "60"))  # how often due shipments are picked up
+SHIPMENT_POLL_BATCH_LIMIT = int(os.getenv("SHIPMENT_POLL_BATCH_LIMIT", "2000"))  # due shipments per tick
 SHIPMENT_POLL_FIRST_DELAY_SEC = int(os.getenv("SHIPMENT_POLL_FIRST_DELAY_SEC", "120"))  # first run after 2 min
 
 
 async def _shipments_sync_loop() -> None:
-    """Background: poll Delhivery and Selloship every 30 min; update status/cost; trigger profit recalc. Single loop."""
+    """Background: every tick, poll only shipments whose next_poll_at is due (most urgent first); update status; trigger profit recalc."""
     await asyncio.sleep(SHIPMENT_POLL_FIRST_DELAY_SEC)
-    logger.info("Shipments 30-min poll started (interval=%ss)", SHIPMENT_POLL_INTERVAL_SEC)
+    logger.info("Shipments poll started (tick=%ss, batch=%s)", SHIPMENT_POLL_TICK_SEC, SHIPMENT_POLL_BATCH_LIMIT)
     while True:
         db = None
+        backlog = False
         try:
             db = SessionLocal()
-            result = await sync_shipments(db, user_id=None)
+            result = await sync_shipments(db, user_id=None, due_only=True, limit=SHIPMENT_POLL_BATCH_LIMIT)
+            backlog = result.get("polled", 0) >= SHIPMENT_POLL_BATCH_LIMIT
             if result.get("synced", 0) > 0 or result.get("errors"):
-                logger.info("Shipments sync: synced=%s errors=%s", result.get("synced", 0), len(result.get("errors", [])))
+                logger.info(
+                    "Shipments sync: polled=%s synced=%s errors=%s",
+                    result.get("polled", 0), result.get("synced", 0), len(result.get("errors", [])),
+                )
         except Exception as e:
-            logger.exception("Shipments 30-min sync failed: %s", e)
+            logger.exception("Shipments sync failed: %s", e)
         finally:
             if db:
                 db.close()
-        await asyncio.sleep(SHIPMENT_POLL_INTERVAL_SEC)
+        # A full batch means more shipments are due: continue right away
+        await asyncio.sleep(1 if backlog else SHIPMENT_POLL_TICK_SEC)
 
 
 @app.on_event("startup")
 async def startup_shipments_poll() -> None:
-    """Start background unified courier sync loop (every 30 min)."""
+    """Start background unified courier sync loop (adaptive per-shipment schedule)."""
     asyncio.create_task(_shipments_sync_loop())
 
 
+# --- Shipping cost reconcile: courier invoice lines and courier-reported costs replace rate-card estimates ---
+SHIPPING_COST_RECONCILE_INTERVAL_SEC = int(os.getenv("SHIPPING_COST_RECONCILE_INTERVAL_SEC", "3600"))
+SHIPPING_COST_RECONCILE_BATCH_LIMIT = int(os.getenv("SHIPPING_COST_RECONCILE_BATCH_LIMIT", "5000"))
+
+
+async def _shipping_cost_reconcile_loop() -> None:
+    """Background: periodically apply uploaded courier invoices / courier-reported costs to shipments (profit recalc via queue)."""
+    await asyncio.sleep(SHIPMENT_POLL_FIRST_DELAY_SEC)
+    logger.info("Shipping cost reconcile started (interval=%ss)", SHIPPING_COST_RECONCILE_INTERVAL_SEC)
+    while True:
+        db = None
+        backlog = False
+        try:
+            db = SessionLocal()
+            result = reconcile_shipping_costs(db, limit=SHIPPING_COST_RECONCILE_BATCH_LIMIT)
+            backlog = max(result.get("invoice_lines", 0), result.get("final_checked", 0)) >= SHIPPING_COST_RECONCILE_BATCH_LIMIT
+            if result.get("invoice_lines") or result.get("courier_reported"):
+                logger.info(
+                    "Shipping cost reconcile: invoice_lines=%s matched=%s variance=%.2f courier_reported=%s",
+                    result.get("invoice_lines"), result.get("matched"), result.get("variance", 0), result.get("courier_reported"),
+                )
+        except Exception as e:
+            logger.exception("Shipping cost reconcile failed: %s", e)
+        finally:
+            if db:
+                db.close()
+        await asyncio.sleep(1 if backlog else SHIPPING_COST_RECONCILE_INTERVAL_SEC)
+
+
+@app.on_event("startup")
+async def startup_shipping_cost_reconcile() -> None:
+    """Start background shipping cost reconcile (invoices → shipment costs)."""
+    asyncio.create_task(_shipping_cost_reconcile_loop())
+
+
 # --- Ad spend daily sync at 00:30 IST (CAC) ---
 IST = timezone(timedelta(hours=5, minutes=30))
 
@@ -246,9 +316,8 @@ async def _ad_spend_sync_loop() -> None:
                 yesterday = (now_ist - timedelta(days=1)).date()
                 result = await sync_ad_spend_for_date(db, user_id, yesterday)
                 db.commit()
-                for (oid,) in db.query(Order.id).filter(func.date(Order.created_at) == yesterday).all():
-                    compute_profit_for_order(db, str(oid))
-                db.commit()
+                # Also covers CAC drift from the day's order count when spend itself did not change
+                enqueue_profit_recompute(days=[yesterday])
                 if result.get("meta") or result.get("google") or result.get("errors"):
                     logger.info("Ad spend sync: date=%s meta=%s google=%s errors=%s",
                                 yesterday, result.get("meta"), result.get("google"), result.get("errors"))
@@ -464,6 +533,7 @@ async def auth_shopify_callback(
                 db.add(audit)
 
         db.commit()
+        invalidate_webhook_secrets(normalized_shop)
         return RedirectResponse(url=redirect_ok)
     except Exception as e:
         logger.exception("Shopify OAuth callback unhandled error: %s", e)
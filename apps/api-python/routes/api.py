@@ -24,8 +24,10 @@ from app.http.controllers import (
     users,
     integrations,
     sku_costs,
+    rate_cards,
     profit,
     mock,
+    admin,
 )
 
 logger = logging.getLogger(__name__)
@@ -55,4 +57,6 @@ def register_routes(app: FastAPI, settings) -> None:
     app.include_router(users.router, prefix="/api/users", tags=["users"])
     app.include_router(integrations.router, prefix="/api/integrations", tags=["integrations"])
     app.include_router(sku_costs.router, prefix="/api/sku-costs", tags=["sku-costs"])
+    app.include_router(rate_cards.router, prefix="/api/rate-cards", tags=["rate-cards"])
     app.include_router(profit.router, prefix="/api/profit", tags=["profit"])
+    app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Rebuild daily_order_rollup (per channel account, IST day) from orders, order_items and order_profit.
+Run once after the add_daily_order_rollup migration, or any time the rollups look off; it is idempotent.
+
+Usage:
+  cd apps/api-python && python scripts/backfill_order_rollups.py [--since YYYY-MM-DD] [--batch-days N]
+
+Expects DATABASE_URL (or .env).
+"""
+import argparse
+import os
+import sys
+
+# Add app to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import date
+
+# Load env
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.database import SessionLocal
+from app.services.order_rollup import backfill_rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild daily_order_rollup")
+    parser.add_argument("--since", type=date.fromisoformat, default=None, help="only IST days on/after this date")
+    parser.add_argument("--batch-days", type=int, default=31, help="days recounted per transaction")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        written = backfill_rollups(db, since=args.since, batch_days=args.batch_days)
+        print(f"daily_order_rollup: {written} row(s) rebuilt" + (f" since {args.since}" if args.since else ""))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()